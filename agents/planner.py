@@ -2,11 +2,77 @@
 import re
 import ast
 import json
+import asyncio
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
 from state import AgentState
 from utils.helpers import log_message
+from utils.attachment_store import resolve_image_part
+from utils.document_extractor import get_cached_text
+from utils.document_index import document_index_store
 
+# 上传时同步提取、并随消息保存的文档文本上限；完整内容通过分块检索按需提供
 MAX_FILE_CONTENT_CHARS = 12000
+# 每轮注入 prompt 的文档片段 token 预算
+FILE_CONTEXT_TOKEN_BUDGET = 3000
+
+
+def _message_text(message) -> str:
+    if isinstance(message.content, list):
+        return "\n".join(part['text'] for part in message.content if part.get('type') == 'text')
+    return message.content if isinstance(message.content, str) else ""
+
+
+def _get_document_index(file_info: dict):
+    """取出文档索引；若已被淘汰，则用提取缓存中的全文（或消息里保存的文本）重建。"""
+    index = document_index_store.get(file_info['ref'])
+    if index is not None:
+        return index
+    full_text = get_cached_text(file_info)
+    if full_text is not None:
+        return document_index_store.put(file_info['ref'], full_text, complete=True)
+    return document_index_store.put(file_info['ref'], file_info.get("text_content") or "", complete=False)
+
+
+async def build_file_context(messages) -> str:
+    """
+    找到对话中最近附加的文档，用最新的用户问题在其分块索引上检索，
+    只把预算内最相关的片段注入 prompt。同一文档的后续提问复用同一个索引。
+    """
+    file_info = None
+    human_messages = [msg for msg in messages if isinstance(msg, HumanMessage)]
+    for msg in reversed(human_messages):
+        if msg.additional_kwargs and "file" in msg.additional_kwargs:
+            file_info = msg.additional_kwargs["file"]
+            break
+    if not file_info:
+        return ""
+    file_name = file_info.get('name', 'N/A')
+    if not file_info.get("ref"):
+        # 旧会话中没有附件引用的消息，按原方式截断
+        content = file_info.get("text_content")
+        if not content:
+            return ""
+        if len(content) > MAX_FILE_CONTENT_CHARS:
+            content = content[:MAX_FILE_CONTENT_CHARS] + f"\n\n[... 文件 '{file_name}' 内容过长，已被截断 ...]"
+        return f"\n# 附加的文件内容 (来自文件: {file_name}):\n--- START OF FILE CONTENT ---\n{content}\n--- END OF FILE CONTENT ---\n"
+
+    latest_human = human_messages[-1]
+    # 文件随本轮消息附加时，问题不相关也要展示文件开头；后续追问只注入真正相关的片段
+    file_is_new = latest_human.additional_kwargs.get("file") is file_info
+    index = await asyncio.to_thread(_get_document_index, file_info)
+    chunks = index.select(_message_text(latest_human), FILE_CONTEXT_TOKEN_BUDGET, fallback_to_head=file_is_new)
+    if not chunks:
+        return ""
+    log_message(f"Selected {len(chunks)}/{len(index.chunks)} chunks of '{file_name}' for the current question.")
+    notes = []
+    if len(chunks) < len(index.chunks):
+        notes.append(f"以下仅为文件 '{file_name}' 中与当前问题最相关的 {len(chunks)} 个片段（共 {len(index.chunks)} 个），片段之间以 --- 分隔。")
+    if not index.complete:
+        notes.append("文件仍在后台解析中，目前只检索了文件的前半部分。")
+    note_str = "\n".join(notes) + "\n" if notes else ""
+    file_ref_str = f"文件引用: {file_info['url']} (调用需要文件路径的工具时，可直接将此引用作为路径参数传入)\n" if file_info.get("url") else ""
+    content = "\n---\n".join(chunks)
+    return f"\n# 附加的文件内容 (来自文件: {file_name}):\n{file_ref_str}{note_str}--- START OF FILE CONTENT ---\n{content}\n--- END OF FILE CONTENT ---\n"
 
 async def run_planner(state: AgentState, llm, tools_config: dict, user_habits: dict, executable_tools: dict) -> AgentState:
     """
@@ -50,15 +116,7 @@ async def run_planner(state: AgentState, llm, tools_config: dict, user_habits: d
                 log_message(f"Error during memory retrieval: {e}")
     
     # --- 2. 准备文件上下文和对话历史 ---
-    current_file_context_str = ""
-    if isinstance(last_message, HumanMessage) and last_message.additional_kwargs and "file" in last_message.additional_kwargs:
-        file_info = last_message.additional_kwargs["file"]
-        content = file_info.get("text_content")
-        if content:
-            file_name = file_info.get('name', 'N/A')
-            if len(content) > MAX_FILE_CONTENT_CHARS:
-                content = content[:MAX_FILE_CONTENT_CHARS] + f"\n\n[... 文件 '{file_name}' 内容过长，已被截断 ...]"
-            current_file_context_str = f"\n# 附加的文件内容 (来自文件: {file_name}):\n--- START OF FILE CONTENT ---\n{content}\n--- END OF FILE CONTENT ---\n"
+    current_file_context_str = await build_file_context(messages)
     
     formatted_history = []
     for msg in messages:
@@ -221,10 +279,10 @@ async def run_planner(state: AgentState, llm, tools_config: dict, user_habits: d
         image_part = next((part for part in last_message.content if part.get("type") == "image_url"), None)
         
         if image_part:
-            # 将“思考指令”作为文本部分，与图片部分打包
+            # 将“思考指令”作为文本部分，与图片部分打包（附件引用在此时才解析为图片数据）
             multimodal_content = [
                 {"type": "text", "text": decision_prompt_text},
-                image_part
+                resolve_image_part(image_part)
             ]
             # 为了确保上下文完整，我们发送包含 SystemMessage 的历史 + 新的 HumanMessage
             llm_input = [msg for msg in messages[:-1] if isinstance(msg, SystemMessage)] + [HumanMessage(content=multimodal_content)]
@@ -0,0 +1,58 @@
+# agents/proactive_scoring.py
+"""
+主动服务评分模型的参数和公式。
+UserStateModeler 用它给实时的滑动窗口打分，utils/proactive_replay.py 用它回放录制的数据、扫描参数；
+这里只依赖 NumPy，公式对单个数值和 NumPy 数组都适用。
+"""
+import numpy as np
+
+# 建模器历史中每个槽代表的时长（权重和阈值按这个采样周期调过）；没有新数据的槽沿用上一次的数据
+SAMPLE_SLOT_SECONDS = 5
+
+# 各分项的权重和询问阈值（手工调定）
+PROACTIVE_WEIGHTS = {
+    "cognitive_load": 0.6, # 认知负荷作为基础分的权重，提升至60%
+    "stuck_bonus": 1.5,  # “卡壳信号”的奖励乘数，非常重要
+    "flow_signal": 0.5, # “心流”状态下的惩罚乘数
+    "window_switch": 0.4 # “分心信号”（窗口切换）的权重
+}
+PROACTIVE_THRESHOLD = 10
+
+# 认知负荷等级对应的得分区间 (起点, 跨度)，区间内按置信度取值；未知等级为 0 分
+COGNITIVE_LOAD_RANGES = {
+    "Low Load": (0, 33),      # 低负荷：0~33
+    "Medium Load": (34, 32),  # 中负荷：34~66
+    "High Load": (67, 33),    # 高负荷：67~100
+}
+
+
+def cognitive_load_score(cognitive_load: str, confidence: float) -> int:
+    """认知负荷得分 (考虑置信度)。"""
+    start, span = COGNITIVE_LOAD_RANGES.get(cognitive_load, (0, 0))
+    return int(start + confidence * span)
+
+
+def signal_scores(load_score, avg_keyboard_hz, avg_mouse_hz, changed_windows_count) -> dict:
+    """由认知负荷得分和窗口内的键鼠均值、窗口变化数计算其余分项，均归一化到 0-100。"""
+    # “卡壳”信号分：负荷高但几乎没有输入，如果卡壳，信号分为满分100
+    is_stuck = (load_score > 60) & (avg_keyboard_hz < 0.5) & (avg_mouse_hz < 0.5)
+    # “心流”信号分：键盘和鼠标活动归一化后加权，键盘占70%，鼠标权重较低
+    keyboard_flow = np.minimum(100, (avg_keyboard_hz / 8.0) * 100)
+    mouse_flow = np.minimum(100, (avg_mouse_hz / 5.0) * 50)
+    return {
+        "cognitive_load": load_score,
+        "stuck_signal": is_stuck * 100,
+        "flow_signal": (keyboard_flow * 0.7) + (mouse_flow * 0.3),
+        # 窗口切换得分 (线性映射, 超过5次为满分)
+        "window_switch": np.minimum(100, (changed_windows_count / 5.0) * 100),
+    }
+
+
+def total_score(scores: dict, weights: dict):
+    """加权总分：心流信号为减分项。"""
+    return (
+        scores["cognitive_load"] * weights["cognitive_load"] +
+        scores["stuck_signal"] * weights["stuck_bonus"] +
+        scores["window_switch"] * weights["window_switch"] -
+        scores["flow_signal"] * weights["flow_signal"]
+    )
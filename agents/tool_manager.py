@@ -5,6 +5,7 @@ from langchain_core.tools import BaseTool
 from langchain_core.messages import ToolMessage
 from state import AgentState
 from utils.helpers import log_message
+from utils.attachment_store import resolve_tool_args
 
 async def run_tool_manager(state: AgentState, executable_tools: Dict[str, BaseTool]) -> AgentState:
     """
@@ -20,7 +21,8 @@ async def run_tool_manager(state: AgentState, executable_tools: Dict[str, BaseTo
 
     tool_call = last_message.tool_calls[0]
     tool_name = tool_call.get("name")
-    tool_params = tool_call.get("args", {})
+    # 参数中的 attachment:// 引用在执行前解析为本地文件路径
+    tool_params = resolve_tool_args(tool_call.get("args", {}))
     tool_call_id = tool_call.get("id")
 
     log_message(f"Preparing to execute tool: {tool_name} with params: {tool_params}")
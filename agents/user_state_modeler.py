@@ -1,8 +1,12 @@
 # agents/user_state_modeler.py
 import json
 import asyncio
+from collections import Counter
 from datetime import datetime
-from utils.helpers import take_screenshot, log_message
+import numpy as np
+from utils.helpers import take_screenshot, log_message, SCREENSHOT_MIME
+from utils.event_broker import LOCAL_USER_ID
+from agents.proactive_scoring import PROACTIVE_WEIGHTS, PROACTIVE_THRESHOLD, cognitive_load_score, signal_scores, total_score
 from langchain_core.messages import HumanMessage
 from langchain_core.language_models import BaseLanguageModel
 from typing import Dict, Any
@@ -11,113 +15,120 @@ class UserStateModeler:
     """
     用户建模器，使用一个加权分数模型来判断是否需要主动服务。
     同时作为一个“分析器Agent”，能够在用户确认后分析其意图并提出建议。
+
+    最近 history_limit 条读数保存在环形缓冲区中，窗口标题维护多重集合，每条新读数 O(1) 写入，并在完整的滑动窗口上重新评分；
+    键盘/鼠标频率的窗口和在评分时按时间顺序重新累加（不维护会累积浮点误差的滑动和），与 proactive_replay 的结果逐位一致。
+    发出询问后冷却 cooldown_samples 条读数。
     """
-    def __init__(self, observation_period_seconds=30, history_limit=6):
-        self.history = []
+    def __init__(self, observation_period_seconds=30, history_limit=6, cooldown_samples=None):
         self.period = observation_period_seconds
         self.limit = history_limit
-        # 【核心】定义分数模型的权重和阈值
-        self.weights = {
-            "cognitive_load": 0.6, # 认知负荷作为基础分的权重，提升至60%
-            "stuck_bonus": 1.5,  # “卡壳信号”的奖励乘数，非常重要
-            "flow_signal": 0.5, # “心流”状态下的惩罚乘数
-            "window_switch": 0.4 # “分心信号”（窗口切换）的权重
-        }
-        self.proactive_threshold = 10 # 阈值
-
-    def log_current_state_from_data(self, activity: dict):
-        """从外部接收活动数据并记录。"""
-        timestamp = datetime.now().isoformat()
-        self.history.append({"timestamp": timestamp, "activity": activity})
-        if len(self.history) > self.limit:
-            self.history.pop(0)
+        # 发出询问后，至少再积累这么多条新读数才会再次询问（默认一个窗口，与原先每个窗口最多决策一次一致）
+        self.cooldown_samples = history_limit if cooldown_samples is None else cooldown_samples
+        # 环形缓冲区：inputs 的两列为键盘、鼠标频率；entries 和 title_sets 与之按同一下标对应
+        self.inputs = np.zeros((history_limit, 2), dtype=np.float64)
+        self.entries = [None] * history_limit
+        self.title_sets = [frozenset()] * history_limit
+        self.title_counts = Counter()  # 窗口内各窗口标题出现的读数条数
+        self.head = 0  # 下一条读数写入的位置
+        self.count = 0
+        self.samples_since_inquiry = None  # None 表示还没有询问过
+        # 【核心】分数模型的权重和阈值（默认值及调参方法见 agents/proactive_scoring.py、utils/proactive_replay.py）
+        self.weights = dict(PROACTIVE_WEIGHTS)
+        self.proactive_threshold = PROACTIVE_THRESHOLD # 阈值
+
+    @property
+    def history(self) -> list:
+        """窗口内的读数，按时间从旧到新。"""
+        start = (self.head - self.count) % self.limit
+        return [self.entries[(start + i) % self.limit] for i in range(self.count)]
+
+    def _remove(self, index: int):
+        self.title_counts.subtract(self.title_sets[index])
+        for title in self.title_sets[index]:
+            if self.title_counts[title] <= 0:
+                del self.title_counts[title]
+
+    def _write(self, index: int, activity: dict, timestamp: datetime):
+        self.inputs[index] = (activity.get("keyboard_freq_hz", 0.0), activity.get("mouse_freq_hz", 0.0))
+        self.title_sets[index] = frozenset(activity.get("window_titles", []))
+        self.title_counts.update(self.title_sets[index])
+        self.entries[index] = {"timestamp": (timestamp or datetime.now()).isoformat(), "activity": activity}
+
+    def log_current_state_from_data(self, activity: dict, timestamp: datetime = None):
+        """从外部接收活动数据并记录；timestamp 为该条数据所代表的时刻，默认为当前时间。窗口已满时挤掉最旧的一条。"""
+        if self.count == self.limit:
+            self._remove(self.head)
+        else:
+            self.count += 1
+        self._write(self.head, activity, timestamp)
+        self.head = (self.head + 1) % self.limit
+        if self.samples_since_inquiry is not None:
+            self.samples_since_inquiry += 1
+
+    def replace_latest(self, activity: dict, timestamp: datetime = None):
+        """用新的读数替换最新的一条（同一个采样槽内收到更新的数据时）。"""
+        if self.count == 0:
+            self.log_current_state_from_data(activity, timestamp)
+            return
+        latest = (self.head - 1) % self.limit
+        self._remove(latest)
+        self._write(latest, activity, timestamp)
 
     def calculate_proactive_score(self) -> dict:
         """
-        计算并返回当前周期的主动服务分数和明细。
+        计算并返回当前滑动窗口的主动服务分数和明细。
         所有单项分数都归一化到 0-100 的范围。
         """
-        # --- 1. 获取基础指标 ---
-        last_activity = self.history[-1]['activity']
+        # --- 1. 获取基础指标（均值由环形缓冲区按时间顺序累加得到，首尾两条读数直接从环形缓冲区取） ---
+        oldest = (self.head - self.count) % self.limit
+        latest = (self.head - 1) % self.limit
+        last_activity = self.entries[latest]['activity']
         cognitive_load = last_activity.get("cognitive_load", "low_load")
         confidence = last_activity.get("confidence", 0.0)
 
-        avg_keyboard_hz = sum(item['activity']['keyboard_freq_hz'] for item in self.history) / len(self.history)
-        avg_mouse_hz = sum(item['activity']['mouse_freq_hz'] for item in self.history) / len(self.history)
-        start_titles = set(self.history[0]['activity'].get('window_titles', []))
-        end_titles = set(self.history[-1]['activity'].get('window_titles', []))
-        changed_windows_count = len(start_titles.symmetric_difference(end_titles))
-
-        scores = {}
-        
-        # --- 2. 计算各分项得分 ---
-        
-        # a) 认知负荷得分 (考虑置信度)
-        if cognitive_load == "Low Load":
-            # 低负荷：0~33
-            scores["cognitive_load"] = int(confidence * 33)
-        elif cognitive_load == "Medium Load":
-            # 中负荷：34~66
-            scores["cognitive_load"] = int(34 + confidence * (66 - 34))
-        elif cognitive_load == "High Load":
-            # 高负荷：67~100
-            scores["cognitive_load"] = int(67 + confidence * (100 - 67))
-        else:
-            scores["cognitive_load"] = 0
-
-        # b) “卡壳”信号分 (Stuck Signal Score)
-        is_stuck = (scores["cognitive_load"] > 60) and (avg_keyboard_hz < 0.5 and avg_mouse_hz < 0.5)
-        scores["stuck_signal"] = 100 if is_stuck else 0 # 如果卡壳，信号分为满分100
+        input_sums = self.inputs[oldest].copy()
+        for i in range(1, self.count):
+            input_sums += self.inputs[(oldest + i) % self.limit]
+        avg_keyboard_hz, avg_mouse_hz = (input_sums / self.count).tolist()
+        changed_windows_count = len(self.title_sets[oldest].symmetric_difference(self.title_sets[latest]))
 
-        # c) “心流”信号分 (Flow Signal Score)
-        # 将键盘和鼠标活动归一化到一个0-100的“心流”分数
-        keyboard_flow = min(100, (avg_keyboard_hz / 8.0) * 100)
-        mouse_flow = min(100, (avg_mouse_hz / 5.0) * 50) # 鼠标权重较低
-        scores["flow_signal"] = (keyboard_flow * 0.7) + (mouse_flow * 0.3) # 键盘占70%
-        
-        # d) 窗口切换得分 (线性映射, 超过5次为满分)
-        scores["window_switch"] = min(100, (changed_windows_count / 5.0) * 100)
-        
-        # --- 3. 计算加权总分 ---
-        total_score = (
-            scores["cognitive_load"] * self.weights["cognitive_load"] +
-            scores["stuck_signal"] * self.weights["stuck_bonus"] +
-            scores["window_switch"] * self.weights["window_switch"] -
-            scores["flow_signal"] * self.weights["flow_signal"]
-        )
+        scores = signal_scores(cognitive_load_score(cognitive_load, confidence),
+                               avg_keyboard_hz, avg_mouse_hz, changed_windows_count)
+        total = total_score(scores, self.weights)
 
         return {
-            "total_score": round(total_score, 2),
-            "breakdown": {k: round(v, 2) for k, v in scores.items()},
-            "is_above_threshold": total_score > self.proactive_threshold,
+            "total_score": round(float(total), 2),
+            "breakdown": {k: round(float(v), 2) for k, v in scores.items()},
+            "is_above_threshold": bool(total > self.proactive_threshold),
             "raw_metrics": {
                 "cognitive_load": cognitive_load,
                 "confidence": confidence,
                 "avg_keyboard_hz": avg_keyboard_hz,
                 "avg_mouse_hz": avg_mouse_hz,
                 "changed_windows_count": changed_windows_count,
-                "is_stuck": is_stuck
+                "is_stuck": bool(scores["stuck_signal"])
             }
         }
 
     def analyze_and_decide(self) -> dict:
         """
-        基于分数模型进行分析和决策。
+        基于分数模型在当前滑动窗口上进行分析和决策，每条新读数之后都可以调用。
+        窗口未满或仍在询问后的冷却期内时不询问。
         """
-        if len(self.history) < self.limit:
+        if self.count < self.limit:
             return {"needs_inquiry": False}
 
         score_result = self.calculate_proactive_score()
+        if not score_result["is_above_threshold"]:
+            return {"needs_inquiry": False}
+        if self.samples_since_inquiry is not None and self.samples_since_inquiry < self.cooldown_samples:
+            return {"needs_inquiry": False}
+        self.samples_since_inquiry = 0
 
         log_message("--- User State Score ---")
         log_message(f"Total Score: {score_result['total_score']} / {self.proactive_threshold}")
         log_message(f"Breakdown: {json.dumps(score_result['breakdown'])}")
-        
-        history_to_return = self.history.copy()
-        self.history = []
-
-        if not score_result["is_above_threshold"]:
-            return {"needs_inquiry": False}
 
         reason_for_inquiry = f"系统综合评分 ({score_result['total_score']:.0f}) 超过了阈值，表明用户可能需要帮助。"
         
@@ -132,9 +143,11 @@ class UserStateModeler:
                     "avg_mouse_hz": round(score_result['raw_metrics']['avg_mouse_hz'], 2),
                     "changed_windows_count": score_result['raw_metrics']['changed_windows_count'],
                     "final_cognitive_load": score_result['raw_metrics']['cognitive_load'],
-                    "final_confidence": round(score_result['raw_metrics']['confidence'], 2)
+                    "final_confidence": round(score_result['raw_metrics']['confidence'], 2),
+                    # 窗口内出现过的所有窗口标题，出现次数多的在前
+                    "window_titles": [title for title, _ in self.title_counts.most_common()]
                 },
-                "activity_log": history_to_return
+                "activity_log": self.history
             }
         }
 
@@ -151,7 +164,10 @@ class UserStateModeler:
         log_message("--- Analyzer Agent Started ---")
         summary = context.get("activity_summary", {})
         reason = context.get("reason", "注意到用户似乎很忙。")
-        screenshot_b64 = await asyncio.to_thread(take_screenshot)
+        # 远程用户（遥测上报）的屏幕不在这台机器上，只根据上报的活动数据分析
+        include_screenshot = context.get("user_id", LOCAL_USER_ID) == LOCAL_USER_ID
+        screenshot_b64 = await asyncio.to_thread(take_screenshot) if include_screenshot else None
+        screenshot_note = "附在下面的图片中，展示了用户正在进行的具体工作。" if include_screenshot else "本次没有截图，请根据窗口标题推断用户正在进行的工作。"
 
         analyzer_prompt_text = f"""
 你是一个专业的“AI认知伙伴”。你的核心能力是运用**心智理论（Theory of Mind）**来**建模和推断**用户的内在状态，包括他们的**意图、目标、知识状态和认知负荷**。你的最终目标是基于这个心智模型，从可用工具中建议一个最能**预判用户需求、减轻其心智负担**的具体行动。
@@ -163,7 +179,7 @@ class UserStateModeler:
     - 最终认知状态判断: {summary.get('final_cognitive_load', 'N/A')} (置信度: {summary.get('final_confidence', 0.0):.0%})
     - 平均键盘/鼠标活动: {summary.get('avg_keyboard_hz', 'N/A')} Hz / {summary.get('avg_mouse_hz', 'N/A')} Hz
     - 所有打开的窗口标题: {json.dumps(context.get("activity_summary", {}).get("window_titles", []), ensure_ascii=False)}
-3.  **用户的屏幕截图**: 附在下面的图片中，展示了用户正在进行的具体工作。
+3.  **用户的屏幕截图**: {screenshot_note}
 4.  **可用的工具集**:
     ```json
     {json.dumps(tools_config, indent=2, ensure_ascii=False)}
@@ -203,10 +219,9 @@ class UserStateModeler:
   "reasoning": "解释你为什么会提出这个建议的简短理由，并明确指出你的决策是基于【优先级1: 工具解决】、【优先级2: 任务排序】还是【优先级3: 文件辅助】。"
 }}
 """
-        multimodal_content = [
-            {"type": "text", "text": analyzer_prompt_text},
-            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{screenshot_b64}"}}
-        ]
+        multimodal_content = [{"type": "text", "text": analyzer_prompt_text}]
+        if screenshot_b64:
+            multimodal_content.append({"type": "image_url", "image_url": {"url": f"data:{SCREENSHOT_MIME};base64,{screenshot_b64}"}})
         
         # 将多模态内容包装在HumanMessage中，然后传递给LLM
         analyzer_message = HumanMessage(content=multimodal_content)
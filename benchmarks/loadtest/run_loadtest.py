@@ -0,0 +1,402 @@
+# benchmarks/loadtest/run_loadtest.py
+"""
+CogAgent 的压测工具：模拟多个并发用户驱动 /listen、/chat、/request_assistance 和 /end_chat，
+统计各接口的 p50/p95/p99 延迟、吞吐量和服务端进程（含子进程）的 RSS。
+
+默认会先启动桩 LLM（stub_llm.py）和桩 MCP 记忆服务（stub_mcp_memory.py），再用 hypercorn 启动 web_app，
+传感器使用合成数据（SENSOR_MODE=synthetic），因此可以在没有摄像头、没有显示器的 Linux 机器上离线运行：
+
+    python benchmarks/loadtest/run_loadtest.py --sessions 50 --concurrency 20 --turns 3
+
+也可以用 --url 压测已经启动的服务（此时 RSS 需要 --server-pid）。
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import signal
+import asyncio
+import argparse
+import contextlib
+import subprocess
+from collections import defaultdict, Counter
+import httpx
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(LOADTEST_DIR, "..", ".."))
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled", "timeout"}
+JOB_POLL_WAIT_SECONDS = 25
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """最近秩法求百分位数，values 须已排序。"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    """按操作名记录延迟（秒）和错误。"""
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.events = Counter()
+
+    def ok(self, op: str, seconds: float):
+        self.latencies[op].append(seconds)
+
+    def error(self, op: str, reason: str):
+        self.errors[op][reason] += 1
+
+    def summary(self, wall_seconds: float) -> dict:
+        ops = {}
+        for op in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[op])
+            ops[op] = {
+                "count": len(values),
+                "errors": dict(self.errors[op]),
+                "throughput_per_s": round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+                "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+                **{f"p{q}_ms": round(percentile(values, q) * 1000, 1) for q in (50, 95, 99)},
+                "max_ms": round(values[-1] * 1000, 1) if values else 0.0,
+            }
+        return ops
+
+
+class RssSampler:
+    """定期读取 /proc 中进程树的 VmRSS（仅 Linux）。"""
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+
+    @staticmethod
+    def _children(pid: int) -> list:
+        children = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # comm 字段可能含空格，ppid 在右括号之后的第二个字段
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == pid:
+                children.append(int(entry))
+        return children
+
+    @staticmethod
+    def _rss_kb(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    def tree_rss_mb(self) -> float:
+        total, pending = 0, [self.pid]
+        while pending:
+            pid = pending.pop()
+            total += self._rss_kb(pid)
+            pending.extend(self._children(pid))
+        return total / 1024
+
+    async def run(self):
+        while True:
+            self.samples.append(await asyncio.to_thread(self.tree_rss_mb))
+            await asyncio.sleep(self.interval)
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {}
+        return {
+            "pid": self.pid,
+            "start_mb": round(self.samples[0], 1),
+            "peak_mb": round(max(self.samples), 1),
+            "mean_mb": round(sum(self.samples) / len(self.samples), 1),
+            "end_mb": round(self.samples[-1], 1),
+        }
+
+
+class VirtualUser:
+    """一个模拟用户：保持一个 SSE 连接，发送若干轮对话，响应主动询问，最后结束会话。"""
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, args):
+        self.client = client
+        self.recorder = recorder
+        self.args = args
+        self.session_id = f"loadtest_{uuid.uuid4().hex[:12]}"
+        self.inquiries = asyncio.Queue()
+
+    async def listen(self, connected: asyncio.Event):
+        start = time.perf_counter()
+        try:
+            async with self.client.stream("GET", "/listen", params={"session_id": self.session_id}, timeout=None) as response:
+                self.recorder.ok("listen_connect", time.perf_counter() - start)
+                connected.set()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[len("data: "):])
+                    self.recorder.events[event.get("type", "state")] += 1
+                    if event.get("type") == "inquiry":
+                        self.inquiries.put_nowait((time.perf_counter(), event))
+        except httpx.HTTPError as e:
+            self.recorder.error("listen_connect", type(e).__name__)
+            connected.set()
+
+    async def post(self, op: str, path: str, payload: dict):
+        """提交请求并记录提交延迟，返回响应 JSON（失败时为 None）。"""
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(path, json=payload)
+        except httpx.HTTPError as e:
+            self.recorder.error(op, type(e).__name__)
+            return None
+        if response.status_code >= 400:
+            self.recorder.error(op, f"http_{response.status_code}")
+            return None
+        self.recorder.ok(f"{op}_submit", time.perf_counter() - start)
+        return response.json()
+
+    async def wait_job(self, op: str, job_id: str, submitted_at: float):
+        """长轮询任务直到结束，记录从提交到完成的端到端延迟。"""
+        while True:
+            try:
+                response = await self.client.get(f"/jobs/{job_id}", params={"wait": JOB_POLL_WAIT_SECONDS},
+                                                 timeout=JOB_POLL_WAIT_SECONDS + 10)
+            except httpx.HTTPError as e:
+                self.recorder.error(op, type(e).__name__)
+                return
+            if response.status_code != 200:
+                self.recorder.error(op, f"http_{response.status_code}")
+                return
+            snapshot = response.json()
+            if snapshot["status"] in TERMINAL_STATUSES:
+                break
+        if snapshot["status"] == "succeeded":
+            self.recorder.ok(op, time.perf_counter() - submitted_at)
+        else:
+            self.recorder.error(op, snapshot["status"])
+
+    async def job(self, op: str, path: str, payload: dict):
+        submitted_at = time.perf_counter()
+        data = await self.post(op, path, payload)
+        if data and data.get("job_id"):
+            await self.wait_job(op, data["job_id"], submitted_at)
+
+    async def answer_inquiries(self):
+        while not self.inquiries.empty():
+            received_at, inquiry = self.inquiries.get_nowait()
+            if time.perf_counter() - received_at > inquiry.get("expires_in", 20):
+                self.recorder.events["inquiry_expired_locally"] += 1
+                continue
+            payload = {"request_id": inquiry["request_id"], "session_id": self.session_id}
+            if random.random() < self.args.accept_rate:
+                await self.job("request_assistance", "/request_assistance", payload)
+            else:
+                await self.post("decline_assistance", "/decline_assistance", payload)
+
+    async def run(self):
+        connected = asyncio.Event()
+        listener = asyncio.create_task(self.listen(connected))
+        await connected.wait()
+        try:
+            for turn in range(self.args.turns):
+                await asyncio.sleep(random.uniform(0, 2 * self.args.think_time))
+                await self.answer_inquiries()
+                await self.job("chat", "/chat", {"message": f"压测消息 {turn}：帮我查一下相关资料", "session_id": self.session_id})
+            await self.answer_inquiries()
+            await self.job("end_chat", "/end_chat", {"session_id": self.session_id})
+        finally:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+
+async def fetch_json(client: httpx.AsyncClient, path: str, headers: dict = None):
+    try:
+        response = await client.get(path, headers=headers, timeout=10)
+        return response.json() if response.status_code == 200 else {"error": f"http_{response.status_code}"}
+    except (httpx.HTTPError, ValueError) as e:
+        return {"error": type(e).__name__}
+
+
+async def wait_until_ready(url: str, path: str, process, timeout: float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode} during startup")
+            try:
+                if (await client.get(path, timeout=2)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} was not ready after {timeout:.0f}s")
+
+
+def launch_stack(args) -> list:
+    """启动桩 LLM 和 web_app，返回 (名称, 进程) 列表。"""
+    python_dir = os.path.dirname(sys.executable)
+    env = {
+        **os.environ,
+        # mcp_stub.json 用 "python" 启动桩 MCP 服务，保证与当前解释器一致
+        "PATH": python_dir + os.pathsep + os.environ.get("PATH", ""),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.llm_port}/v1",
+        "OPENAI_API_BASE": f"http://127.0.0.1:{args.llm_port}/v1",
+        "OPENAI_API_KEY": "stub",
+        "LLM_MODEL": "stub",
+        "MCP_CONFIG_PATH": os.path.join(LOADTEST_DIR, "mcp_stub.json"),
+        "MCP_SERVERS_DIR": LOADTEST_DIR,
+        "SENSOR_MODE": "synthetic",
+        "SYNTHETIC_SENSOR_PROFILE": args.profile,
+        "TELEMETRY_SECRET": args.telemetry_secret,
+    }
+    if args.workers > 1:
+        env["EVENT_BUS"] = "sqlite"
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(LOADTEST_DIR, "stub_llm.py"), "--port", str(args.llm_port),
+        "--first-token-latency", str(args.first_token_latency), "--tokens-per-second", str(args.tokens_per_second),
+        "--tool-call-rate", str(args.tool_call_rate),
+    ], env=env)
+    server = subprocess.Popen([
+        sys.executable, "-m", "hypercorn", "web_app:app", "--bind", f"127.0.0.1:{args.port}", "--workers", str(args.workers),
+    ], cwd=REPO_ROOT, env=env, stdout=None if args.verbose else subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    return [("stub_llm", stub), ("web_app", server)]
+
+
+def stop_stack(processes: list):
+    for _, process in reversed(processes):
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+    for _, process in reversed(processes):
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+@contextlib.asynccontextmanager
+async def running_server(args):
+    """启动桩 LLM 和 web_app（或直接使用 --url 指定的服务），产出 (服务地址, 服务进程 pid)；退出时停止启动的进程。"""
+    processes = []
+    url, server_pid = args.url, args.server_pid
+    if url is None:
+        processes = launch_stack(args)
+        url, server_pid = f"http://127.0.0.1:{args.port}", processes[1][1].pid
+    try:
+        if processes:
+            await wait_until_ready(f"http://127.0.0.1:{args.llm_port}", "/stats", processes[0][1], 30)
+        await wait_until_ready(url, "/jobs/stats", processes[1][1] if processes else None, args.startup_timeout)
+        yield url, server_pid
+    finally:
+        stop_stack(processes)
+
+
+async def stub_llm_stats(args) -> dict:
+    if args.url is not None:
+        return {}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.llm_port}") as client:
+        return await fetch_json(client, "/stats")
+
+
+async def run(args) -> dict:
+    async with running_server(args) as (url, server_pid):
+        recorder = Recorder()
+        sampler = RssSampler(server_pid) if server_pid and os.path.isdir("/proc") else None
+        sampler_task = asyncio.create_task(sampler.run()) if sampler else None
+        limits = httpx.Limits(max_connections=args.sessions * 2 + 10, max_keepalive_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+            gate = asyncio.Semaphore(args.concurrency)
+
+            async def one_user():
+                async with gate:
+                    await VirtualUser(client, recorder, args).run()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one_user() for _ in range(args.sessions)))
+            wall_seconds = time.perf_counter() - start
+            server_stats = {
+                "listen": await fetch_json(client, "/listen/stats"),
+                "jobs": await fetch_json(client, "/jobs/stats"),
+                "assistance": await fetch_json(client, "/assistance/stats"),
+            }
+        if sampler_task:
+            sampler_task.cancel()
+            await asyncio.gather(sampler_task, return_exceptions=True)
+        server_stats["stub_llm"] = await stub_llm_stats(args)
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "verbose")},
+        "wall_seconds": round(wall_seconds, 2),
+        "operations": recorder.summary(wall_seconds),
+        "sse_events": dict(recorder.events),
+        "server_rss": sampler.summary() if sampler else {},
+        "server_stats": server_stats,
+    }
+
+
+def print_report(report: dict):
+    print(f"\n=== Load test: {report['config']['sessions']} sessions, concurrency {report['config']['concurrency']}, "
+          f"{report['wall_seconds']}s ===")
+    print(f"{'operation':<28}{'count':>7}{'err':>6}{'req/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for op, s in report["operations"].items():
+        print(f"{op:<28}{s['count']:>7}{sum(s['errors'].values()):>6}{s['throughput_per_s']:>8}"
+              f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+    errors = {op: s["errors"] for op, s in report["operations"].items() if s["errors"]}
+    if errors:
+        print(f"errors: {errors}")
+    print(f"SSE events: {report['sse_events']}")
+    if report["server_rss"]:
+        rss = report["server_rss"]
+        print(f"server RSS (MB, pid {rss['pid']} + children): start {rss['start_mb']}, mean {rss['mean_mb']}, "
+              f"peak {rss['peak_mb']}, end {rss['end_mb']}")
+    for name, stats in report["server_stats"].items():
+        print(f"{name}: {json.dumps(stats, ensure_ascii=False)}")
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """启动或指定被测服务的参数（telemetry_load.py 也使用）。"""
+    parser.add_argument("--url", help="target an already running server instead of launching one")
+    parser.add_argument("--server-pid", type=int, help="pid of the server to sample RSS from when using --url")
+    parser.add_argument("--port", type=int, default=5101, help="port for the launched web_app")
+    parser.add_argument("--workers", type=int, default=1, help="hypercorn workers for the launched web_app")
+    parser.add_argument("--llm-port", type=int, default=9100)
+    parser.add_argument("--first-token-latency", type=float, default=0.8)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--tool-call-rate", type=float, default=0.3)
+    parser.add_argument("--profile", default="mixed", choices=["busy", "calm", "mixed"], help="synthetic sensor profile")
+    parser.add_argument("--telemetry-secret", default=os.getenv("TELEMETRY_SECRET") or "loadtest-secret",
+                        help="TELEMETRY_SECRET of the server (set on the launched web_app)")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show web_app output")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test CogAgent with simulated users, a stub LLM and a stub MCP server.")
+    parser.add_argument("--sessions", type=int, default=20, help="number of simulated users (one session each)")
+    parser.add_argument("--concurrency", type=int, default=10, help="users active at the same time")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per session")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds between turns")
+    parser.add_argument("--accept-rate", type=float, default=0.5, help="fraction of proactive inquiries accepted")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# benchmarks/loadtest/stub_llm.py
+"""
+本地的 OpenAI 兼容 LLM 桩服务，用于压测时代替真实模型（不消耗 API 额度、可离线运行）。
+按请求内容识别是 planner、分析器还是记忆 Agent 的调用，返回它们期望的 JSON 格式；
+响应延迟 = 首 token 延迟 + 输出 token 数 / token 速率。
+
+    python benchmarks/loadtest/stub_llm.py --port 9100 --first-token-latency 0.8 --tokens-per-second 40
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from quart import Quart, request, jsonify, Response
+from hypercorn.config import Config
+from hypercorn.asyncio import serve
+
+app = Quart(__name__)
+settings = argparse.Namespace(first_token_latency=0.8, tokens_per_second=40.0, output_tokens=120, tool_call_rate=0.3, jitter=0.2)
+stats = Counter()
+
+
+def prompt_text(messages: list) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(parts)
+
+
+def filler(tokens: int) -> str:
+    # 中文约 1 字 1 token
+    return ("这是桩模型生成的占位回复。" * (tokens // 12 + 1))[:tokens]
+
+
+def reply_for(prompt: str) -> tuple:
+    """返回 (调用方类型, 回复内容)。"""
+    if '"user_intent"' in prompt:
+        return "analyzer", json.dumps({
+            "user_intent": "完成一个编程功能",
+            "user_tasks": "在编辑器中编码并查阅文档",
+            "suggestion_text": filler(settings.output_tokens // 2),
+            "recommended_tool": None,
+            "reasoning": "【优先级3: 文件辅助】桩模型的固定建议。",
+        }, ensure_ascii=False)
+    if "tool_calls 的列表" in prompt:
+        return "memory", json.dumps({"tool_calls": [{
+            "name": "add_observations",
+            "args": {"observations": [{"entityName": "default_user", "contents": ["压测会话中的一条观察"]}]},
+        }]}, ensure_ascii=False)
+    # planner：对话历史最后一条是工具结果时必须直接回复，否则按比例调用记忆检索工具
+    history = prompt.split("# 对话历史:")[-1].split("# 可用工具列表:")[0].strip().splitlines()
+    last_is_tool = bool(history) and history[-1].startswith("tool:")
+    if not last_is_tool and random.random() < settings.tool_call_rate:
+        return "planner_tool_call", json.dumps({"tool_call": {"name": "search_nodes", "args": {"query": "压测"}}}, ensure_ascii=False)
+    return "planner", json.dumps({"response": filler(settings.output_tokens)}, ensure_ascii=False)
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(re.findall(r"[一-鿿]", text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def completion_delay(output_tokens: int) -> float:
+    delay = settings.first_token_latency + output_tokens / settings.tokens_per_second
+    return max(0.0, delay * random.uniform(1 - settings.jitter, 1 + settings.jitter))
+
+
+@app.route("/v1/models")
+async def models():
+    return jsonify({"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "loadtest"}]})
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+async def chat_completions():
+    body = await request.get_json()
+    prompt = prompt_text(body.get("messages", []))
+    caller, content = reply_for(prompt)
+    prompt_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(content)
+    stats[caller] += 1
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += output_tokens
+    completion_id = f"chatcmpl-{int(time.time() * 1000)}-{random.randint(0, 99999)}"
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": output_tokens, "total_tokens": prompt_tokens + output_tokens}
+
+    if body.get("stream"):
+        async def stream():
+            await asyncio.sleep(settings.first_token_latency)
+            chunk_chars = 8
+            for i in range(0, len(content), chunk_chars):
+                piece = content[i:i + chunk_chars]
+                await asyncio.sleep(estimate_tokens(piece) / settings.tokens_per_second)
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "stub"),
+                         "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+        return Response(stream(), mimetype="text/event-stream")
+
+    await asyncio.sleep(completion_delay(output_tokens))
+    return jsonify({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage,
+    })
+
+
+@app.route("/stats")
+async def get_stats():
+    return jsonify(dict(stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--first-token-latency", type=float, default=settings.first_token_latency, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=settings.tokens_per_second)
+    parser.add_argument("--output-tokens", type=int, default=settings.output_tokens, help="approximate length of planner replies")
+    parser.add_argument("--tool-call-rate", type=float, default=settings.tool_call_rate, help="fraction of planner turns that call a memory tool")
+    parser.add_argument("--jitter", type=float, default=settings.jitter, help="relative latency jitter")
+    args = parser.parse_args()
+    for key in vars(settings):
+        setattr(settings, key, getattr(args, key))
+
+    config = Config()
+    config.bind = [f"{args.host}:{args.port}"]
+    config.accesslog = None
+    asyncio.run(serve(app, config))
+
+
+if __name__ == "__main__":
+    main()
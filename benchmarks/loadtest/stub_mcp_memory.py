@@ -0,0 +1,121 @@
+# benchmarks/loadtest/stub_mcp_memory.py
+"""
+内存中的 MCP 记忆服务桩，提供与 @modelcontextprotocol/server-memory 同名的工具，
+压测时代替 npx 启动的真实服务（不需要 Node.js，也不写磁盘）。通过 stdio 运行：
+
+    python benchmarks/loadtest/stub_mcp_memory.py
+
+环境变量 STUB_MCP_LATENCY 为每次工具调用附加的延迟（秒）。
+"""
+import os
+import asyncio
+from typing import Any, Dict, List
+from mcp.server.fastmcp import FastMCP
+
+LATENCY_SECONDS = float(os.getenv("STUB_MCP_LATENCY", 0.02))
+
+mcp = FastMCP("memory")
+# 工具参数名与真实服务一致（entities、relations），图数据用不同的名字以免被参数遮蔽
+graph_entities: Dict[str, Dict[str, Any]] = {}
+graph_relations: List[Dict[str, str]] = []
+
+
+def graph_view(names=None) -> dict:
+    selected = [e for name, e in graph_entities.items() if names is None or name in names]
+    selected_names = {e["name"] for e in selected}
+    return {
+        "entities": selected,
+        "relations": [r for r in graph_relations if r["from"] in selected_names or r["to"] in selected_names],
+    }
+
+
+@mcp.tool()
+async def create_entities(entities: List[Dict[str, Any]]) -> dict:
+    """Create multiple new entities in the knowledge graph."""
+    await asyncio.sleep(LATENCY_SECONDS)
+    created = []
+    for entity in entities:
+        if entity.get("name") and entity["name"] not in graph_entities:
+            graph_entities[entity["name"]] = {"name": entity["name"], "entityType": entity.get("entityType", ""), "observations": list(entity.get("observations", []))}
+            created.append(entity["name"])
+    return {"created": created}
+
+
+@mcp.tool()
+async def create_relations(relations: List[Dict[str, str]]) -> dict:
+    """Create multiple new relations between entities in the knowledge graph."""
+    await asyncio.sleep(LATENCY_SECONDS)
+    new = [r for r in relations if r not in graph_relations]
+    graph_relations.extend(new)
+    return {"created": len(new)}
+
+
+@mcp.tool()
+async def add_observations(observations: List[Dict[str, Any]]) -> dict:
+    """Add new observations to existing entities in the knowledge graph."""
+    await asyncio.sleep(LATENCY_SECONDS)
+    added = 0
+    for item in observations:
+        entity = graph_entities.setdefault(item["entityName"], {"name": item["entityName"], "entityType": "", "observations": []})
+        for content in item.get("contents", []):
+            if content not in entity["observations"]:
+                entity["observations"].append(content)
+                added += 1
+    return {"added": added}
+
+
+@mcp.tool()
+async def delete_entities(entityNames: List[str]) -> dict:
+    """Delete multiple entities and their associated relations from the knowledge graph."""
+    await asyncio.sleep(LATENCY_SECONDS)
+    for name in entityNames:
+        graph_entities.pop(name, None)
+    graph_relations[:] = [r for r in graph_relations if r["from"] not in entityNames and r["to"] not in entityNames]
+    return {"deleted": len(entityNames)}
+
+
+@mcp.tool()
+async def delete_observations(deletions: List[Dict[str, Any]]) -> dict:
+    """Delete specific observations from entities in the knowledge graph."""
+    await asyncio.sleep(LATENCY_SECONDS)
+    for item in deletions:
+        entity = graph_entities.get(item["entityName"])
+        if entity:
+            entity["observations"] = [o for o in entity["observations"] if o not in item.get("observations", [])]
+    return {"ok": True}
+
+
+@mcp.tool()
+async def delete_relations(relations: List[Dict[str, str]]) -> dict:
+    """Delete multiple relations from the knowledge graph."""
+    await asyncio.sleep(LATENCY_SECONDS)
+    graph_relations[:] = [r for r in graph_relations if r not in relations]
+    return {"ok": True}
+
+
+@mcp.tool()
+async def read_graph() -> dict:
+    """Read the entire knowledge graph."""
+    await asyncio.sleep(LATENCY_SECONDS)
+    return graph_view()
+
+
+@mcp.tool()
+async def search_nodes(query: str) -> dict:
+    """Search for nodes in the knowledge graph based on a query."""
+    await asyncio.sleep(LATENCY_SECONDS)
+    query = query.lower()
+    names = {name for name, e in graph_entities.items()
+             if query in name.lower() or query in e["entityType"].lower() or any(query in o.lower() for o in e["observations"])}
+    return graph_view(names)
+
+
+@mcp.tool()
+async def open_nodes(names: List[str]) -> dict:
+    """Open specific nodes in the knowledge graph by their names."""
+    await asyncio.sleep(LATENCY_SECONDS)
+    return graph_view(set(names))
+
+
+if __name__ == "__main__":
+    mcp.run(transport="stdio")
@@ -0,0 +1,185 @@
+# benchmarks/loadtest/telemetry_load.py
+"""
+/telemetry 的压测：模拟大量客户端代理，按固定节奏上报 gzip 压缩的合成读数，
+统计服务器实际接受的读数速率、上报延迟、推送给各用户的询问，以及服务进程的 RSS。
+
+    python benchmarks/loadtest/telemetry_load.py --users 500 --duration 60
+    python benchmarks/loadtest/telemetry_load.py --users 500 --batch-interval 1 --duration 30   # 加压：上报频率提高 15 倍
+
+启动服务的参数与 run_loadtest.py 相同（默认启动桩 LLM 和合成传感器模式的 web_app，也可用 --url 指定已有服务）。
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import asyncio
+import argparse
+import httpx
+from run_loadtest import REPO_ROOT, Recorder, RssSampler, add_server_arguments, fetch_json, running_server, stub_llm_stats
+
+sys.path.insert(0, REPO_ROOT)
+from utils.synthetic_sensors import SYNTHETIC_WINDOW_TITLES
+from utils.telemetry_auth import telemetry_token
+
+
+def synthetic_sample(t: float, busy: bool, titles: list = None) -> dict:
+    sample = {
+        "t": round(t, 3),
+        "keyboard_freq_hz": round(random.uniform(0.0, 0.4) if busy else random.uniform(3.0, 8.0), 1),
+        "mouse_freq_hz": round(random.uniform(0.0, 0.4) if busy else random.uniform(1.0, 4.0), 1),
+        "open_apps_count": len(titles) if titles else random.randint(3, 6),
+        "cognitive_load": "High Load" if busy else "Low Load",
+        "confidence": round(random.uniform(0.7, 0.95), 2),
+    }
+    if titles is not None:
+        sample["window_titles"] = titles
+    return sample
+
+
+class SimulatedAgent:
+    """一个客户端代理：每 batch_interval 秒上报一批读数，读数均匀分布在这段时间内；窗口标题只在批次开头和变化时发送。"""
+    def __init__(self, index: int, client: httpx.AsyncClient, recorder: Recorder, args):
+        self.user_id = f"loadtest_user_{index}"
+        self.token = telemetry_token(self.user_id, args.telemetry_secret)
+        self.client = client
+        self.recorder = recorder
+        self.args = args
+        self.busy = random.random() < args.busy_fraction
+        self.titles = random.sample(SYNTHETIC_WINDOW_TITLES, k=random.randint(3, 6))
+        self.samples_sent = 0
+        self.bytes_sent = 0
+
+    def build_batch(self, now: float) -> bytes:
+        count = self.args.samples_per_batch
+        spacing = self.args.batch_interval / count
+        samples = []
+        for i in range(count):
+            changed = i == 0 or random.random() < 0.1
+            if changed and i > 0:
+                self.titles = random.sample(SYNTHETIC_WINDOW_TITLES, k=random.randint(3, 6))
+            samples.append(synthetic_sample(now - (count - 1 - i) * spacing, self.busy, self.titles if changed else None))
+        return gzip.compress(json.dumps({"user_id": self.user_id, "sent_at": now, "samples": samples},
+                                        ensure_ascii=False).encode("utf-8"))
+
+    async def listen(self):
+        """订阅该用户的 /listen，统计收到的询问和状态更新。"""
+        try:
+            async with self.client.stream("GET", "/listen", params={"session_id": f"{self.user_id}_session", "user_id": self.user_id, "token": self.token},
+                                          timeout=None) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        self.recorder.events[json.loads(line[len("data: "):]).get("type", "state")] += 1
+        except httpx.HTTPError as e:
+            self.recorder.error("listen_connect", type(e).__name__)
+
+    async def run(self, deadline: float):
+        # 各代理错开上报时刻，避免所有请求同时到达
+        next_send = time.monotonic() + random.uniform(0, self.args.batch_interval)
+        while True:
+            await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+            if time.monotonic() >= deadline:
+                return
+            body = self.build_batch(time.time())
+            start = time.perf_counter()
+            try:
+                response = await self.client.post("/telemetry", content=body,
+                                                  headers={"Content-Type": "application/json", "Content-Encoding": "gzip",
+                                                           "Authorization": f"Bearer {self.token}"})
+            except httpx.HTTPError as e:
+                self.recorder.error("telemetry", type(e).__name__)
+            else:
+                if response.status_code == 200:
+                    self.recorder.ok("telemetry", time.perf_counter() - start)
+                    self.recorder.events["samples_accepted"] += response.json()["accepted"]
+                    self.bytes_sent += len(body)
+                    self.samples_sent += self.args.samples_per_batch
+                else:
+                    self.recorder.error("telemetry", f"http_{response.status_code}")
+            # 按固定节奏发送；落后时立即发下一批，不补发错过的批次
+            next_send = max(next_send + self.args.batch_interval, time.monotonic())
+
+
+async def run(args) -> dict:
+    async with running_server(args) as (url, server_pid):
+        recorder = Recorder()
+        sampler = RssSampler(server_pid) if server_pid and os.path.isdir("/proc") else None
+        sampler_task = asyncio.create_task(sampler.run()) if sampler else None
+        limits = httpx.Limits(max_connections=args.connections + args.users, max_keepalive_connections=args.connections)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+            agents = [SimulatedAgent(i, client, recorder, args) for i in range(args.users)]
+            listeners = [asyncio.create_task(agent.listen()) for agent in agents[:int(args.users * args.listen_fraction)]]
+            start = time.perf_counter()
+            deadline = time.monotonic() + args.duration
+            await asyncio.gather(*(agent.run(deadline) for agent in agents))
+            wall_seconds = time.perf_counter() - start
+            for listener in listeners:
+                listener.cancel()
+            await asyncio.gather(*listeners, return_exceptions=True)
+            server_stats = {
+                "telemetry": await fetch_json(client, "/telemetry/stats", {"Authorization": f"Bearer {args.telemetry_secret}"}),
+                "listen": await fetch_json(client, "/listen/stats"),
+                "assistance": await fetch_json(client, "/assistance/stats"),
+            }
+        if sampler_task:
+            sampler_task.cancel()
+            await asyncio.gather(sampler_task, return_exceptions=True)
+        server_stats["stub_llm"] = await stub_llm_stats(args)
+
+    samples_sent = sum(agent.samples_sent for agent in agents)
+    bytes_sent = sum(agent.bytes_sent for agent in agents)
+    batches = len(recorder.latencies["telemetry"])
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "verbose")},
+        "wall_seconds": round(wall_seconds, 2),
+        "offered_samples_per_s": round(args.users * args.samples_per_batch / args.batch_interval, 1),
+        "accepted_samples_per_s": round(recorder.events["samples_accepted"] / wall_seconds, 1),
+        "sent_samples": samples_sent,
+        "mean_batch_bytes": round(bytes_sent / batches, 1) if batches else 0.0,
+        "operations": recorder.summary(wall_seconds),
+        "sse_events": {k: v for k, v in recorder.events.items() if k != "samples_accepted"},
+        "server_rss": sampler.summary() if sampler else {},
+        "server_stats": server_stats,
+    }
+
+
+def print_report(report: dict):
+    config = report["config"]
+    print(f"\n=== Telemetry load test: {config['users']} users, a batch of {config['samples_per_batch']} samples "
+          f"every {config['batch_interval']}s, {report['wall_seconds']}s ===")
+    print(f"offered {report['offered_samples_per_s']} samples/s, accepted {report['accepted_samples_per_s']} samples/s, "
+          f"mean compressed batch {report['mean_batch_bytes']} bytes")
+    for op, s in report["operations"].items():
+        print(f"{op}: {s['count']} ok, errors {s['errors'] or 0}, {s['throughput_per_s']} batches/s, "
+              f"p50 {s['p50_ms']} ms, p95 {s['p95_ms']} ms, p99 {s['p99_ms']} ms, max {s['max_ms']} ms")
+    print(f"SSE events (listening users): {report['sse_events']}")
+    if report["server_rss"]:
+        rss = report["server_rss"]
+        print(f"server RSS (MB, pid {rss['pid']} + children): start {rss['start_mb']}, mean {rss['mean_mb']}, "
+              f"peak {rss['peak_mb']}, end {rss['end_mb']}")
+    for name, stats in report["server_stats"].items():
+        print(f"{name}: {json.dumps(stats, ensure_ascii=False)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test CogAgent's /telemetry ingestion with simulated client agents.")
+    parser.add_argument("--users", type=int, default=200, help="number of simulated client agents")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to keep reporting")
+    parser.add_argument("--batch-interval", type=float, default=15.0, help="seconds between batches per agent")
+    parser.add_argument("--samples-per-batch", type=int, default=3)
+    parser.add_argument("--busy-fraction", type=float, default=0.2, help="fraction of agents that look busy (and trigger inquiries)")
+    parser.add_argument("--listen-fraction", type=float, default=0.1, help="fraction of users with an open /listen stream")
+    parser.add_argument("--connections", type=int, default=100, help="HTTP keep-alive connections shared by the agents")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
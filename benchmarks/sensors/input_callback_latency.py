@@ -0,0 +1,152 @@
+# benchmarks/sensors/input_callback_latency.py
+"""
+测量 InputWindowMonitor 的 pynput 回调延迟：两个线程以固定频率调用键盘/鼠标回调，同时更新线程不断枚举窗口，
+统计每次回调耗时的 p50/p99/最大值，并与旧实现（持有输入计数锁枚举窗口）对比。
+
+窗口枚举使用模拟的 pygetwindow（每个窗口访问属性时睡眠一段时间，模拟跨进程调用），
+因此可以在没有桌面的 Linux 上运行：
+
+    python benchmarks/sensors/input_callback_latency.py
+    python benchmarks/sensors/input_callback_latency.py --windows 60 --per-window-ms 0.5 --duration 10
+"""
+import os
+import sys
+import json
+import math
+import time
+import types
+import argparse
+import threading
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, REPO_ROOT)
+from utils.activity_monitor import InputWindowMonitor
+
+
+def install_fake_pygetwindow(windows: int, per_window_seconds: float):
+    """注册一个模拟的 pygetwindow 模块：枚举 windows 个窗口，访问每个窗口的 left 属性耗时 per_window_seconds。"""
+    class FakeWindow:
+        def __init__(self, index):
+            self.title = f"Window {index}"
+            self.isMinimized = index % 7 == 0
+
+        @property
+        def left(self):
+            time.sleep(per_window_seconds)
+            return 0
+
+    module = types.ModuleType("pygetwindow")
+    module.PyGetWindowException = type("PyGetWindowException", (Exception,), {})
+    module.getWindowsWithTitle = lambda title: [FakeWindow(i) for i in range(windows)]
+    sys.modules["pygetwindow"] = module
+
+
+class LockedInputWindowMonitor(InputWindowMonitor):
+    """对照组：旧实现，回调和窗口枚举共用一把锁。"""
+    def __init__(self, interval=2.0):
+        super().__init__(interval)
+        self.keyboard_count = 0
+        self.mouse_count = 0
+        self.lock = threading.Lock()
+
+    def _keyboard_on_press(self, key):
+        with self.lock:
+            self.keyboard_count += 1
+
+    def _mouse_on_click(self, x, y, button, pressed):
+        if pressed:
+            with self.lock:
+                self.mouse_count += 1
+
+    def _update_loop(self):
+        import pygetwindow as gw
+        from pygetwindow import PyGetWindowException
+        while not self._stop_event.is_set():
+            time.sleep(self.interval)
+            with self.lock:
+                keyboard_count, mouse_count = self.keyboard_count, self.mouse_count
+                self.keyboard_count = self.mouse_count = 0
+                window_titles = list(self._visible_window_titles(gw, PyGetWindowException))
+                self.snapshot = {
+                    "keyboard_freq_hz": round(keyboard_count / self.interval, 1),
+                    "mouse_freq_hz": round(mouse_count / self.interval, 1),
+                    "open_apps_count": len(window_titles),
+                    "window_titles": window_titles,
+                }
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """最近秩法求百分位数，values 须已排序。"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(1, math.ceil(q / 100 * len(sorted_values))) - 1]
+
+
+def drive_callbacks(callback, rate_hz: float, deadline: float, latencies: list):
+    """以 rate_hz 的频率调用回调直到 deadline，记录每次调用的耗时（秒）。"""
+    period = 1.0 / rate_hz
+    next_call = time.perf_counter()
+    while next_call < deadline:
+        start = time.perf_counter()
+        callback()
+        latencies.append(time.perf_counter() - start)
+        next_call += period
+        time.sleep(max(0.0, next_call - time.perf_counter()))
+
+
+def run(monitor_class, args) -> dict:
+    monitor = monitor_class(interval=args.interval)
+    updater = threading.Thread(target=monitor._update_loop, daemon=True)
+    updater.start()
+    deadline = time.perf_counter() + args.duration
+    latencies = {"keyboard": [], "mouse": []}
+    drivers = [
+        threading.Thread(target=drive_callbacks, args=(lambda: monitor._keyboard_on_press(None), args.rate, deadline, latencies["keyboard"])),
+        threading.Thread(target=drive_callbacks, args=(lambda: monitor._mouse_on_click(0, 0, None, True), args.rate, deadline, latencies["mouse"])),
+    ]
+    for driver in drivers:
+        driver.start()
+    for driver in drivers:
+        driver.join()
+    monitor._stop_event.set()
+    updater.join()
+
+    report = {"implementation": monitor_class.__name__}
+    for name, values in latencies.items():
+        values.sort()
+        report[name] = {
+            "calls": len(values),
+            "p50_us": round(percentile(values, 50) * 1e6, 1),
+            "p99_us": round(percentile(values, 99) * 1e6, 1),
+            "p999_us": round(percentile(values, 99.9) * 1e6, 1),
+            "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure pynput callback latency of InputWindowMonitor while windows are enumerated.")
+    parser.add_argument("--windows", type=int, default=40, help="simulated windows per enumeration")
+    parser.add_argument("--per-window-ms", type=float, default=0.5, help="simulated cost of querying one window")
+    parser.add_argument("--interval", type=float, default=0.1, help="monitor update interval in seconds (2.0 in production)")
+    parser.add_argument("--rate", type=float, default=500.0, help="callbacks per second per input type")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    install_fake_pygetwindow(args.windows, args.per_window_ms / 1000)
+    reports = [run(LockedInputWindowMonitor, args), run(InputWindowMonitor, args)]
+    print(f"\n=== pynput callback latency: {args.windows} windows x {args.per_window_ms} ms enumeration every {args.interval}s, "
+          f"{args.rate:g} callbacks/s per input, {args.duration}s ===")
+    for report in reports:
+        for name in ("keyboard", "mouse"):
+            s = report[name]
+            print(f"{report['implementation']:>26} {name:>8}: {s['calls']} calls, p50 {s['p50_us']} us, p99 {s['p99_us']} us, "
+                  f"p99.9 {s['p999_us']} us, max {s['max_ms']} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# benchmarks/vision/capture_cpu.py
+"""
+测量视觉线程采集画面的 CPU 占用：模拟一个输出 MJPEG 的摄像头（grab() 只等待下一帧，retrieve() 才解码 JPEG），
+对比旧的采集方式（每帧 read() 解码）和 capture_loop（只在采样时刻解码），
+后者分别在摄像头忽略帧率设置（仍按原生帧率出帧）和接受低帧率两种情况下运行。
+CPU 占用为采集线程的 CPU 时间除以墙钟时间。不需要摄像头和模型（不做人脸裁剪），可以在 Linux 上运行：
+
+    python benchmarks/vision/capture_cpu.py
+    python benchmarks/vision/capture_cpu.py --native-fps 30 --width 1280 --height 720 --duration 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, REPO_ROOT)
+import cv2
+import numpy as np
+from utils.realtime_detection.frame_sampler import FrameSampler, capture_loop, VISION_CAPTURE_FPS
+
+SEGMENT_SECONDS = 30
+
+
+class FakeCapture:
+    """模拟的 cv2.VideoCapture：按帧率实时出帧，retrieve() 解码一张 JPEG。"""
+    def __init__(self, width: int, height: int, native_fps: float, honor_fps: bool, duration: float):
+        yy, xx = np.mgrid[0:height, 0:width]
+        image = np.stack([(xx * 255 // width), (yy * 255 // height), ((xx + yy) * 255 // (width + height))], axis=-1).astype(np.uint8)
+        image = cv2.add(image, np.random.default_rng(0).integers(0, 16, image.shape, dtype=np.uint8))
+        self.jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])[1]
+        self.fps = native_fps
+        self.honor_fps = honor_fps
+        self.deadline = time.monotonic() + duration
+        self.next_frame_at = time.monotonic()
+        self.frames = 0
+        self.decoded = 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FPS and self.honor_fps:
+            self.fps = min(self.fps, value)
+        return True
+
+    def grab(self) -> bool:
+        time.sleep(max(0.0, self.next_frame_at - time.monotonic()))
+        self.next_frame_at += 1.0 / self.fps
+        self.frames += 1
+        return time.monotonic() < self.deadline
+
+    def retrieve(self):
+        self.decoded += 1
+        return True, cv2.imdecode(self.jpeg, cv2.IMREAD_COLOR)
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+
+def read_every_frame(cap, sampler):
+    """旧的采集方式：每帧 read()（解码），再交给采样器。"""
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            return
+        sampler.offer(frame)
+
+
+def run(name: str, loop, honor_fps: bool, args) -> dict:
+    cap = FakeCapture(args.width, args.height, args.native_fps, honor_fps, args.duration)
+    cap.set(cv2.CAP_PROP_FPS, VISION_CAPTURE_FPS)
+    sampler = FrameSampler(SEGMENT_SECONDS, sample_frames=32, frame_size=112)
+    wall_start, cpu_start = time.monotonic(), time.thread_time()
+    if loop is capture_loop:
+        for _ in capture_loop(cap, sampler):
+            pass
+    else:
+        loop(cap, sampler)
+    wall, cpu = time.monotonic() - wall_start, time.thread_time() - cpu_start
+    return {
+        "mode": name,
+        "camera_fps": cap.fps,
+        "frames": cap.frames,
+        "decoded": cap.decoded,
+        "samples": sampler.samples_taken + len(sampler.pending),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_percent": round(cpu / wall * 100, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CPU usage of the vision capture loop against a simulated MJPEG camera.")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--native-fps", type=float, default=25.0, help="frame rate of the camera when it ignores CAP_PROP_FPS")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    reports = [
+        run("read every frame", read_every_frame, False, args),
+        run("grab, decode samples only", capture_loop, False, args),
+        run(f"grab at {VISION_CAPTURE_FPS:g} fps, decode samples", capture_loop, True, args),
+    ]
+    print(f"\n=== vision capture CPU: {args.width}x{args.height} MJPEG, {args.duration}s per mode ===")
+    for r in reports:
+        print(f"{r['mode']:>32}: camera {r['camera_fps']:g} fps, {r['frames']} frames, {r['decoded']} decoded, "
+              f"{r['samples']} samples, CPU {r['cpu_seconds']} s ({r['cpu_percent']}%)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# benchmarks/vision/face_detection_throughput.py
+"""
+测量人脸定位在 CPU 上的吞吐（每秒定位的帧数）：
+    per-frame  每帧单独 blobFromImage + 前向（旧的 detect_and_crop_face）
+    batched    每 --batch 帧合并成一次 blobFromImages 前向
+    tracker    FaceTracker：每 --redetect-every 帧检测一次，其间模板匹配，跟丢时合批重新检测
+同时报告 batched / tracker 的人脸框与 per-frame 的平均 IoU。需要 SSD 人脸检测模型文件：
+
+    python benchmarks/vision/face_detection_throughput.py
+    python benchmarks/vision/face_detection_throughput.py --image face.jpg --frames 128 --redetect-every 8
+
+不指定 --image 时使用合成画面（背景上画一个椭圆“人脸”），画面每帧随机平移几个像素模拟头部移动。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, REPO_ROOT)
+import cv2
+import numpy as np
+from utils.realtime_detection.face_tracker import FaceTracker, detect_faces, FACE_REDETECT_EVERY
+from utils.realtime_detection.frame_sampler import VISION_CROP_BATCH
+
+FACE_DETECTOR_DIR = os.path.join(REPO_ROOT, "utils", "realtime_detection", "models", "face_detector")
+
+
+def synthetic_scene(width: int, height: int) -> np.ndarray:
+    yy, xx = np.mgrid[0:height, 0:width]
+    scene = np.stack([xx * 200 // width, yy * 200 // height, np.full_like(xx, 90)], axis=-1).astype(np.uint8)
+    center, axes = (width // 2, height // 2), (width // 8, height // 5)
+    cv2.ellipse(scene, center, axes, 0, 0, 360, (140, 170, 210), -1)
+    for dx in (-axes[0] // 2, axes[0] // 2):
+        cv2.circle(scene, (center[0] + dx, center[1] - axes[1] // 4), max(axes[0] // 8, 2), (40, 40, 40), -1)
+    cv2.ellipse(scene, (center[0], center[1] + axes[1] // 2), (axes[0] // 3, axes[1] // 10), 0, 0, 180, (60, 60, 150), -1)
+    return scene
+
+
+def make_frames(scene: np.ndarray, count: int, seed: int = 0) -> list:
+    """画面随机游走平移，每帧最多移动 4 个像素。"""
+    rng = np.random.default_rng(seed)
+    h, w = scene.shape[:2]
+    offsets = np.cumsum(rng.integers(-4, 5, (count, 2)), axis=0)
+    return [cv2.warpAffine(scene, np.float32([[1, 0, dx], [0, 1, dy]]), (w, h), borderMode=cv2.BORDER_REPLICATE)
+            for dx, dy in offsets]
+
+
+def iou(a, b) -> float:
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def timed(locate, frames: list, batch: int):
+    start = time.perf_counter()
+    boxes = []
+    for i in range(0, len(frames), batch):
+        boxes.extend(locate(frames[i:i + batch]))
+    return boxes, time.perf_counter() - start
+
+
+def agreement(boxes: list, reference: list):
+    pairs = [iou(a, b) for a, b in zip(boxes, reference) if a is not None and b is not None]
+    return round(float(np.mean(pairs)), 3) if pairs else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CPU face localisation throughput: per-frame SSD vs batched vs tracker.")
+    parser.add_argument("--prototxt", default=os.path.join(FACE_DETECTOR_DIR, "deploy.prototxt"))
+    parser.add_argument("--model", default=os.path.join(FACE_DETECTOR_DIR, "res10_300x300_ssd_iter_140000.caffemodel"))
+    parser.add_argument("--image", help="photo with a face to animate (default: synthetic scene)")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=VISION_CROP_BATCH)
+    parser.add_argument("--redetect-every", type=int, default=FACE_REDETECT_EVERY)
+    parser.add_argument("--threads", type=int, help="cv2.setNumThreads")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        sys.exit(f"Face detector weights not found: {args.model}")
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+    net = cv2.dnn.readNetFromCaffe(args.prototxt, args.model)
+    scene = cv2.resize(cv2.imread(args.image), (args.width, args.height)) if args.image else synthetic_scene(args.width, args.height)
+    frames = make_frames(scene, args.frames)
+    detect_faces(net, frames[:1])  # 预热
+
+    per_frame, per_frame_seconds = timed(lambda batch: detect_faces(net, batch), frames, 1)
+    batched, batched_seconds = timed(lambda batch: detect_faces(net, batch), frames, args.batch)
+    tracker = FaceTracker(net, redetect_every=args.redetect_every)
+    tracked, tracked_seconds = timed(tracker.locate_batch, frames, args.batch)
+
+    def report(mode, boxes, seconds, detections, forward_passes, **extra):
+        return {"mode": mode, "frames_per_second": round(len(frames) / seconds, 1), "seconds": round(seconds, 3),
+                "detections": detections, "forward_passes": forward_passes, **extra,
+                "faces_found": sum(box is not None for box in boxes), "iou_vs_per_frame": agreement(boxes, per_frame)}
+
+    reports = [
+        report("per-frame", per_frame, per_frame_seconds, len(frames), len(frames)),
+        report(f"batched x{args.batch}", batched, batched_seconds, len(frames), -(-len(frames) // args.batch)),
+        report(f"tracker every {args.redetect_every}", tracked, tracked_seconds, tracker.counts["detections"],
+               tracker.counts["forward_passes"], tracked=tracker.counts["tracked"], lost=tracker.counts["lost"]),
+    ]
+
+    print(f"\n=== face localisation on CPU: {len(frames)} frames {args.width}x{args.height}, {cv2.getNumThreads()} threads ===")
+    for r in reports:
+        extra = f", tracked {r['tracked']}, lost {r['lost']}" if "tracked" in r else ""
+        print(f"{r['mode']:>18}: {r['frames_per_second']} frames/s, {r['detections']} detections in {r['forward_passes']} forward passes{extra}, "
+              f"faces {r['faces_found']}/{len(frames)}, mean IoU vs per-frame {r['iou_vs_per_frame']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
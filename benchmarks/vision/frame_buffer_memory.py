@@ -0,0 +1,99 @@
+# benchmarks/vision/frame_buffer_memory.py
+"""
+测量视觉缓冲区的峰值常驻内存（RSS）：用合成的摄像头画面分别喂给旧实现（deque 保存每一帧原始画面的副本）
+和 FrameSampler（只保存裁剪、缩放后的采样帧），每种实现在单独的子进程中运行，报告子进程的峰值 RSS 和每帧耗时。
+不需要摄像头和模型（不做人脸裁剪），可以在 Linux 上运行：
+
+    python benchmarks/vision/frame_buffer_memory.py
+    python benchmarks/vision/frame_buffer_memory.py --width 1280 --height 720 --segments 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from collections import deque
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, REPO_ROOT)
+import numpy as np
+from utils.realtime_detection.frame_sampler import FrameSampler
+
+FPS = 25
+SEGMENT_SECONDS = 30
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/status", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux 上单位为 KB
+
+
+def run_child(args) -> dict:
+    """子进程：按所选实现处理 segments 个片段的合成画面。"""
+    frames_per_segment = FPS * SEGMENT_SECONDS
+    rng = np.random.default_rng(0)
+    sources = [rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8) for _ in range(4)]
+    baseline = current_rss_mb()
+    if args.child == "deque":
+        buffer = deque(maxlen=frames_per_segment)
+        ingest = lambda frame: buffer.append(frame.copy())
+    else:
+        sampler = FrameSampler(SEGMENT_SECONDS, sample_frames=32, frame_size=112)
+        ingest = lambda frame: sampler.offer(frame, i / FPS)  # 按模拟的摄像头时钟采样
+
+    start = time.perf_counter()
+    frames = frames_per_segment * args.segments
+    for i in range(frames):
+        frame = sources[i % len(sources)].copy()  # 模拟 cap.read() 每次返回一帧新画面
+        ingest(frame)
+    elapsed = time.perf_counter() - start
+    return {
+        "implementation": args.child,
+        "frames": frames,
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "buffer_growth_mb": round(peak_rss_mb() - baseline, 1),
+        "us_per_frame": round(elapsed / frames * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak RSS of the vision frame buffer: deque of raw copies vs FrameSampler.")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--segments", type=int, default=2, help="30-second segments of 25 fps frames to feed")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--child", choices=("deque", "sampler"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+
+    reports = []
+    for implementation in ("deque", "sampler"):
+        command = [sys.executable, os.path.abspath(__file__), "--child", implementation,
+                   "--width", str(args.width), "--height", str(args.height), "--segments", str(args.segments)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        reports.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"\n=== vision frame buffer: {args.width}x{args.height}, {FPS} fps, {args.segments} x {SEGMENT_SECONDS}s segments ===")
+    for report in reports:
+        print(f"{report['implementation']:>8}: peak RSS {report['peak_rss_mb']} MB "
+              f"(+{report['buffer_growth_mb']} MB over baseline {report['baseline_rss_mb']} MB), {report['us_per_frame']} us/frame")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/vision/inference_backends.py
+"""
+在 CPU 上对比视觉认知负荷模型的各个推理后端（utils/realtime_detection/inference_backends.py）：
+构建耗时（导出、编译、量化校准）、单次前向延迟 p50/p90，以及与 float32 eager 参考结果的一致性
+（softmax 概率的最大绝对误差、top-1 一致率）。概率误差超过容差（float32 后端 1e-4，int8 后端 0.05）时以非零状态退出。
+
+    python benchmarks/vision/inference_backends.py --threads 4
+    python benchmarks/vision/inference_backends.py --weights utils/realtime_detection/best_resnet3d.pth --inputs segments.npy
+
+--inputs 为 uint8 [N, 32, 112, 112, 3] 的 .npy（例如保存的 FrameSampler.ordered()），前 --calibration 个用于 int8-static 校准，
+其余用于一致性检查；不指定时使用平滑的合成视频。不指定 --weights 时使用随机初始化的模型。
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, REPO_ROOT)
+import numpy as np
+import torch
+import torch.nn.functional as F
+from utils.realtime_detection.model import get_resnet3d
+from utils.realtime_detection.inference_backends import BACKENDS, create_backend
+
+FLOAT_TOLERANCE = 1e-4
+INT8_TOLERANCE = 0.05
+
+
+def synthetic_segments(count: int, seed: int = 0) -> torch.Tensor:
+    """平滑的合成视频片段 [count, 1, 3, 32, 112, 112]，取值 0~1。"""
+    generator = torch.Generator().manual_seed(seed)
+    coarse = torch.rand((count, 3, 8, 14, 14), generator=generator)
+    return F.interpolate(coarse, size=(32, 112, 112), mode="trilinear", align_corners=False).unsqueeze(1)
+
+
+def load_segments(path: str) -> torch.Tensor:
+    frames = torch.from_numpy(np.load(path))  # [N, 32, 112, 112, 3] uint8
+    return frames.permute(0, 4, 1, 2, 3).unsqueeze(1).float().div(255)
+
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark latency and parity of the vision model inference backends on CPU.")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma separated subset of: " + ", ".join(BACKENDS))
+    parser.add_argument("--weights", help="state dict of the trained model (default: random initialisation)")
+    parser.add_argument("--inputs", help="uint8 [N, 32, 112, 112, 3] .npy segments (default: synthetic)")
+    parser.add_argument("--calibration", type=int, default=8, help="segments used to calibrate int8-static")
+    parser.add_argument("--parity", type=int, default=8, help="segments used for the parity check")
+    parser.add_argument("--repeat", type=int, default=5, help="timed forward passes per backend")
+    parser.add_argument("--threads", type=int, default=0, help="torch / onnxruntime threads (0 = default)")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    model = get_resnet3d(num_classes=3, pretrained=False).eval()
+    if args.weights:
+        model.load_state_dict(torch.load(args.weights, map_location="cpu"))
+    segments = load_segments(args.inputs) if args.inputs else synthetic_segments(args.calibration + args.parity)
+    calibration, parity = segments[:args.calibration], segments[args.calibration:args.calibration + args.parity]
+    if len(parity) == 0:
+        sys.exit("Not enough input segments for the parity check.")
+    with torch.inference_mode():
+        reference = torch.cat([torch.softmax(model(x), dim=1) for x in parity])
+
+    device = torch.device("cpu")
+    reports = []
+    for name in args.backends.split(","):
+        start = time.perf_counter()
+        try:
+            backend = create_backend(copy.deepcopy(model), name, device, parity[0], args.threads)
+            if hasattr(backend, "calibrate"):
+                backend.calibrate(calibration)
+            backend.warmup(parity[0])
+        except Exception as e:
+            print(f"{name:>13}: unavailable ({e})")
+            reports.append({"backend": name, "error": str(e)})
+            continue
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        for i in range(args.repeat):
+            x = parity[i % len(parity)]
+            start = time.perf_counter()
+            backend(x)
+            latencies.append((time.perf_counter() - start) * 1000)
+        with torch.inference_mode():
+            probabilities = torch.cat([torch.softmax(backend(x).float(), dim=1) for x in parity])
+        error = float((probabilities - reference).abs().max())
+        tolerance = INT8_TOLERANCE if name.startswith("int8") else FLOAT_TOLERANCE
+        reports.append({
+            "backend": name,
+            "build_seconds": round(build_seconds, 2),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p90_ms": round(percentile(latencies, 90), 1),
+            "max_probability_error": round(error, 6),
+            "top1_agreement": round(float((probabilities.argmax(1) == reference.argmax(1)).float().mean()), 3),
+            "parity_ok": error <= tolerance,
+        })
+
+    eager = next((r for r in reports if r["backend"] == "eager" and "p50_ms" in r), None)
+    print(f"\n=== vision inference backends on CPU: {torch.get_num_threads()} threads, {len(parity)} parity segments, "
+          f"{'trained' if args.weights else 'random'} weights ===")
+    for r in reports:
+        if "error" in r:
+            continue
+        speedup = f" ({eager['p50_ms'] / r['p50_ms']:.1f}x)" if eager else ""
+        print(f"{r['backend']:>13}: build {r['build_seconds']} s, p50 {r['p50_ms']} ms{speedup}, p90 {r['p90_ms']} ms, "
+              f"max prob error {r['max_probability_error']}, top-1 agreement {r['top1_agreement']:.0%}, "
+              f"parity {'ok' if r['parity_ok'] else 'FAILED'}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": reports}, f, indent=2)
+    if any(not r.get("parity_ok", True) for r in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
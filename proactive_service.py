@@ -1,94 +1,181 @@
 # proactive_service.py
+import os
 import time
 import asyncio
 import uuid
+from datetime import datetime
+from typing import Optional
 from agents.user_state_modeler import UserStateModeler
+from agents.proactive_scoring import SAMPLE_SLOT_SECONDS
 from utils import activity_monitor, face_thread
+from utils.event_broker import LOCAL_USER_ID
+from utils.event_bus import WORKER_ID
 from utils.helpers import get_real_time_user_activity, log_message # 确保 log_message 被导入
 
-UPDATE_INTERVAL_SECONDS = 5
+# 没有任何变化通知时，最多隔这么久醒来一次（补齐历史槽、续期领导者锁）
+PROACTIVE_HEARTBEAT_SECONDS = float(os.getenv("PROACTIVE_HEARTBEAT_SECONDS", 15))
+# 多 worker 部署时只有持有该锁的 worker 运行监控；锁在几个心跳内没有续期就会被其他 worker 接管
+PROACTIVE_LEADER_LOCK = "proactive_leader"
+PROACTIVE_LEADER_TTL_SECONDS = PROACTIVE_HEARTBEAT_SECONDS * 3
 
 # 【核心修复】创建一个全局标志来跟踪监控器是否已启动
 _monitors_started = False
 
-async def proactive_monitoring_loop(sessions_dict, msg_queue, request_cache):
+
+def log_slots(modeler: UserStateModeler, held_activity, activity: dict, now: float, logged_slot) -> int:
     """
-    监控循环。
-    使用全局标志来确保监控器只被启动一次。
+    把一次读数按固定槽写入建模器历史，返回当前槽号。
+    同一槽内只保留最新的读数；跨过的空槽用上一次的读数补齐（零阶保持），
+    这样无论通知多密或多稀，评分模型看到的仍是每 SAMPLE_SLOT_SECONDS 一条的历史。
     """
-    global _monitors_started # 声明我们要修改的是全局变量
+    slot = int(now // SAMPLE_SLOT_SECONDS)
+    if slot == logged_slot:
+        modeler.replace_latest(activity, datetime.fromtimestamp(now))
+        return slot
+    if held_activity is not None and logged_slot is not None:
+        for missed in range(logged_slot + 1, slot)[-modeler.limit:]:
+            modeler.log_current_state_from_data(held_activity, datetime.fromtimestamp(missed * SAMPLE_SLOT_SECONDS))
+    modeler.log_current_state_from_data(activity, datetime.fromtimestamp(now))
+    return slot
+
+
+class UserActivityTracker:
+    """一个用户的评分模型及其历史槽。本机用户由监控循环驱动，远程用户由遥测上报驱动。"""
+    def __init__(self, user_id: str = LOCAL_USER_ID):
+        self.user_id = user_id
+        self.modeler = UserStateModeler(observation_period_seconds=30, history_limit=6)
+        self.held_activity = None
+        self.logged_slot = None
+
+    def is_stale(self, at: float) -> bool:
+        """读数早于已经记录过的槽（例如客户端重发或乱序的数据）。"""
+        return self.logged_slot is not None and int(at // SAMPLE_SLOT_SECONDS) < self.logged_slot
+
+    def observe(self, activity: dict, at: float) -> dict:
+        """记录一次读数（at 为读数时刻的 Unix 时间），返回评分模型在滑动窗口上的决策。"""
+        self.logged_slot = log_slots(self.modeler, self.held_activity, activity, at, self.logged_slot)
+        self.held_activity = activity
+        return self.modeler.analyze_and_decide()
+
+
+def session_user_state(activity: dict, at: Optional[float] = None) -> dict:
+    """会话 user_state 字段的内容（planner 会把它写进提示词）。"""
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(at)),
+        "keyboard_hz": activity.get("keyboard_freq_hz", 0),
+        "mouse_hz": activity.get("mouse_freq_hz", 0),
+        "open_apps": activity.get("open_apps_count", 0),
+        "window_titles": activity.get("window_titles", "N/A"),
+        "cognitive_load": activity.get("cognitive_load", "waiting..."),
+        "confidence": activity.get("confidence", 0.0)
+    }
+
+
+def chart_state(activity: dict, at: Optional[float] = None) -> dict:
+    """推送给前端图表的状态。"""
+    return {
+        "timestamp": time.strftime("%H:%M:%S", time.localtime(at)),
+        "apps": activity.get("open_apps_count", 0),
+        "keyboard": activity.get("keyboard_freq_hz", 0),
+        "mouse": activity.get("mouse_freq_hz", 0),
+        "cognitive_load": activity.get("cognitive_load", "waiting..."),
+        "confidence": activity.get("confidence", 0.0),
+    }
 
-    # 检查全局标志，如果监控器尚未启动，则启动它们
-    if not _monitors_started:
-        log_message("--- Monitors have not been started yet. Starting them now... ---")
-        try:
-            activity_monitor.monitor.start()
-            face_thread.visual_detector.start()
-            
-            # 启动成功后，立即将标志置为 True
-            _monitors_started = True
-            log_message("--- Monitors started successfully. ---")
-            
-        except Exception as e:
-            log_message(f"FATAL: Error starting monitors: {e}. Proactive service cannot run.")
-            # 如果监控器启动失败，这个后台任务就没有意义了，直接退出。
-            return
 
-    modeler = UserStateModeler(observation_period_seconds=30, history_limit=6)
+async def push_inquiry(analysis_result: dict, user_id: str, broker, request_cache, speculator) -> Optional[str]:
+    """
+    评分模型认为需要帮助时，向该用户在线的会话推送询问，返回询问ID；该用户没有会话在听时不产生询问。
+    询问的上下文写入带有效期的缓存（存放在事件总线上），任何 worker 上的 /request_assistance 都能取到；
+    发出询问的同时开始预分析，用户接受时无需再等待分析器。
+    """
+    if not analysis_result.get("needs_inquiry"):
+        return None
+    target_sessions = broker.subscribed_sessions(user_id)
+    if not target_sessions:
+        log_message(f"--- Proactive Service: Detected high load for user '{user_id}', but no session is listening. Inquiry skipped. ---")
+        return None
+    log_message(f"--- Proactive Service: Detected high load for user '{user_id}'. Caching context and pushing inquiry to {len(target_sessions)} session(s). ---")
+    request_id = str(uuid.uuid4())
+    context = {**analysis_result.get("context", {}), "user_id": user_id}
+    expires_in = await request_cache.put(request_id, context)
+    inquiry_payload = {
+        "type": "inquiry", 
+        "text": analysis_result["inquiry_text"],
+        "request_id": request_id,
+        "expires_in": expires_in
+    }
+    for session_id in target_sessions:
+        broker.publish(inquiry_payload, session_id=session_id)
+    speculator.start(request_id, context, expires_in)
+    return request_id
+
+
+async def proactive_monitoring_loop(sessions_dict, broker, bus, request_cache, speculator, notifier, recorder):
+    """
+    本机用户的监控循环（远程用户的数据由 telemetry_service 处理）。
+    由传感器线程的变化通知驱动（合并一小段时间内的多条通知），没有通知时按心跳醒来；
+    使用全局标志来确保监控器只被启动一次；多 worker 时通过总线上的领导者锁保证只有一个 worker 在运行。
+    状态更新和询问只发给本机用户的订阅者；每条读数和发出的询问交给 recorder 录制（未配置录制目录时不录制）。
+    """
+    global _monitors_started # 声明我们要修改的是全局变量
+
+    tracker = UserActivityTracker(LOCAL_USER_ID)
+    notifier.bind()
+    lock_renewed_at = None
     
-    print(f"--- Proactive Service Thread Started. Updating state every {UPDATE_INTERVAL_SECONDS}s. ---")
+    print(f"--- Proactive Service Thread Started. Reacting to sensor changes, heartbeat every {PROACTIVE_HEARTBEAT_SECONDS:g}s. ---")
     
     while True:
         try:
-            # --- 1. 获取一次实时数据 ---
-            current_activity = await asyncio.to_thread(get_real_time_user_activity)
+            if lock_renewed_at is None or time.monotonic() - lock_renewed_at >= PROACTIVE_HEARTBEAT_SECONDS:
+                if not await bus.acquire_lock(PROACTIVE_LEADER_LOCK, WORKER_ID, PROACTIVE_LEADER_TTL_SECONDS):
+                    lock_renewed_at = None
+                    await asyncio.sleep(PROACTIVE_HEARTBEAT_SECONDS)
+                    continue
+                lock_renewed_at = time.monotonic()
+
+            # 检查全局标志，如果监控器尚未启动，则启动它们
+            if not _monitors_started:
+                log_message(f"--- Worker {WORKER_ID} is the proactive leader. Starting monitors now... ---")
+                try:
+                    activity_monitor.monitor.start()
+                    face_thread.visual_detector.start()
+                    
+                    # 启动成功后，立即将标志置为 True
+                    _monitors_started = True
+                    log_message("--- Monitors started successfully. ---")
+                    
+                except Exception as e:
+                    log_message(f"FATAL: Error starting monitors: {e}. Proactive service cannot run.")
+                    # 如果监控器启动失败，这个后台任务就没有意义了，直接退出。
+                    return
+
+            # --- 1. 获取一次实时数据（只读取传感器线程缓存的结果，不阻塞事件循环） ---
+            current_activity = get_real_time_user_activity()
+            now = time.time()
+            await recorder.record(current_activity, now)
             
-            # --- 2. 更新所有后端活动会话的 user_state ---
+            # --- 2. 更新本机用户的后端会话的 user_state（远程用户的会话由遥测上报更新） ---
+            owners = broker.session_users()
             for session_id, session_state in list(sessions_dict.items()):
-                session_state['user_state'] = {
-                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "keyboard_hz": current_activity.get("keyboard_freq_hz", 0),
-                    "mouse_hz": current_activity.get("mouse_freq_hz", 0),
-                    "open_apps": current_activity.get("open_apps_count", 0),
-                    "window_titles": current_activity.get("window_titles", "N/A"),
-                    "cognitive_load": current_activity.get("cognitive_load", "waiting..."),
-                    "confidence": current_activity.get("confidence", 0.0)
-                }
-
-            # --- 3. 将这份实时数据推送到前端队列，用于更新图表 ---
-            state_update_payload = {
-                "type": "state_update",
-                "data": {
-                    "timestamp": time.strftime("%H:%M:%S"),
-                    "apps": current_activity.get("open_apps_count", 0),
-                    "keyboard": current_activity.get("keyboard_freq_hz", 0),
-                    "mouse": current_activity.get("mouse_freq_hz", 0),
-                    "cognitive_load": current_activity.get("cognitive_load", "waiting..."),
-                    "confidence": current_activity.get("confidence", 0.0),
-                }
-            }
-            await msg_queue.put(state_update_payload)
+                if owners.get(session_id, LOCAL_USER_ID) == LOCAL_USER_ID:
+                    session_state['user_state'] = session_user_state(current_activity, now)
+
+            # --- 3. 将这份实时数据推送给前端，用于更新图表（无变化时不发送，有变化时只发增量） ---
+            broker.publish_state(chart_state(current_activity, now), user_id=LOCAL_USER_ID)
 
             # --- 4. 将刚刚获取的数据用于主动服务决策 ---
-            modeler.log_current_state_from_data(current_activity) 
-            
-            if len(modeler.history) >= modeler.limit:
-                analysis_result = modeler.analyze_and_decide()
-                if analysis_result.get("needs_inquiry"):
-                    log_message(f"--- Proactive Service: Detected high load. Caching context and pushing inquiry. ---")
-                    request_id = str(uuid.uuid4())
-                    request_cache[request_id] = analysis_result.get("context")
-                    inquiry_payload = {
-                        "type": "inquiry", 
-                        "text": analysis_result["inquiry_text"],
-                        "request_id": request_id
-                    }
-                    await msg_queue.put(inquiry_payload)
-
-            await asyncio.sleep(UPDATE_INTERVAL_SECONDS)
+            analysis_result = tracker.observe(current_activity, now)
+            request_id = await push_inquiry(analysis_result, LOCAL_USER_ID, broker, request_cache, speculator)
+            if request_id:
+                recorder.record_event("inquiry", request_id, now)
+
+            # --- 5. 等待下一次变化通知或心跳 ---
+            await notifier.wait(PROACTIVE_HEARTBEAT_SECONDS)
 
         except Exception as e:
             import traceback
             log_message(f"An error occurred in the proactive monitoring loop: {e}")
             traceback.print_exc()
-            await asyncio.sleep(UPDATE_INTERVAL_SECONDS)
\ No newline at end of file
+            await asyncio.sleep(SAMPLE_SLOT_SECONDS)
\ No newline at end of file
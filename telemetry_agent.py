@@ -0,0 +1,132 @@
+# telemetry_agent.py
+"""
+轻量的客户端代理：在用户自己的电脑上运行键鼠/窗口监控和视觉认知负荷检测，
+定期把读数批量压缩后上报到服务器的 /telemetry，服务器据此为该用户单独建模并推送询问。
+
+    python telemetry_agent.py --server http://服务器:5001 --user-id alice --token <令牌>
+
+令牌由服务器管理员用 `python -m utils.telemetry_auth alice` 签发（也可以用环境变量 TELEMETRY_TOKEN 传入）。
+用户在浏览器中打开 http://服务器:5001/?user_id=alice&token=<令牌> 即可收到自己的状态和询问。
+没有摄像头或显示器的机器上可以设置 SENSOR_MODE=synthetic。
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import requests
+from typing import Optional
+from utils.telemetry_auth import telemetry_token, TELEMETRY_SECRET
+from utils.activity_monitor import monitor
+from utils.face_thread import visual_detector
+
+# 与服务器评分模型的历史槽一致
+SAMPLE_INTERVAL_SECONDS = 5
+# 上报失败时最多保留这么多条读数，更旧的丢弃
+MAX_BUFFERED_SAMPLES = 600
+# 每批最多发送的读数数，与服务器的 MAX_TELEMETRY_BATCH_SAMPLES 一致；积压更多时按时间顺序分批发送
+MAX_BATCH_SAMPLES = int(os.getenv("MAX_TELEMETRY_BATCH_SAMPLES", 600))
+
+
+def read_sample(previous_titles):
+    """读取一条读数；窗口标题没有变化时省略，服务器沿用上一条的值。"""
+    activity = monitor.get_latest_data()
+    vision = visual_detector.get_latest_load() or {"cognitive_load": "waiting...", "confidence": 0.0}
+    sample = {
+        "t": round(time.time(), 3),
+        "keyboard_freq_hz": activity["keyboard_freq_hz"],
+        "mouse_freq_hz": activity["mouse_freq_hz"],
+        "open_apps_count": activity["open_apps_count"],
+        "cognitive_load": vision["cognitive_load"],
+        "confidence": vision["confidence"],
+    }
+    if activity["window_titles"] != previous_titles:
+        sample["window_titles"] = activity["window_titles"]
+    return sample, activity["window_titles"]
+
+
+def send_batch(session: requests.Session, server: str, user_id: str, token: str, samples: list) -> Optional[int]:
+    """上报一批读数，返回 HTTP 状态码；网络错误时返回 None。"""
+    body = gzip.compress(json.dumps({"user_id": user_id, "sent_at": time.time(), "samples": samples},
+                                    ensure_ascii=False).encode("utf-8"))
+    try:
+        response = session.post(f"{server}/telemetry", data=body, timeout=10,
+                                headers={"Content-Type": "application/json", "Content-Encoding": "gzip",
+                                         "Authorization": f"Bearer {token}"})
+    except requests.RequestException as e:
+        print(f"[遥测] 上报失败：{e}", file=sys.stderr)
+        return None
+    if response.status_code >= 500:
+        print(f"[遥测] 服务器错误 {response.status_code}，稍后重试", file=sys.stderr)
+    elif response.status_code >= 400:
+        print(f"[遥测] 上报被拒绝 {response.status_code}：{response.text}", file=sys.stderr)
+    return response.status_code
+
+
+def keep_titles(dropped: list, remaining: list):
+    """丢弃或发送掉开头的读数后，保证剩下的第一条仍带有窗口标题。"""
+    if remaining and "window_titles" not in remaining[0]:
+        remaining[0]["window_titles"] = next((s["window_titles"] for s in reversed(dropped) if "window_titles" in s), [])
+
+
+def flush(session: requests.Session, server: str, user_id: str, token: str, buffered: list) -> list:
+    """
+    按时间顺序分批（每批不超过 MAX_BATCH_SAMPLES 条）发送积压的读数，返回还没有发出去的部分。
+    网络错误或服务器错误时停止，剩下的下次再发；413（批次太大）时拆成更小的批次重试；
+    其他 4xx 说明这一批数据本身有问题，重试也没有用，丢弃这一批后继续。
+    """
+    batch_size = MAX_BATCH_SAMPLES
+    while buffered:
+        batch = buffered[:batch_size]
+        status = send_batch(session, server, user_id, token, batch)
+        if status is None or status >= 500:
+            break
+        if status == 413 and batch_size > 1:
+            batch_size = max(batch_size // 2, 1)
+            continue
+        buffered = buffered[len(batch):]
+        keep_titles(batch, buffered)
+    return buffered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report local activity and cognitive load to a CogAgent server.")
+    parser.add_argument("--server", default="http://127.0.0.1:5001")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--token", default=os.getenv("TELEMETRY_TOKEN"),
+                        help="this user's telemetry token (derived from TELEMETRY_SECRET when that is set instead)")
+    parser.add_argument("--flush-interval", type=float, default=15.0, help="seconds between uploads")
+    args = parser.parse_args()
+    token = args.token or (telemetry_token(args.user_id) if TELEMETRY_SECRET else None)
+    if not token:
+        parser.error("a telemetry token is required (--token, TELEMETRY_TOKEN or TELEMETRY_SECRET)")
+
+    monitor.start()
+    visual_detector.start()
+    print(f"[遥测] 开始上报用户 {args.user_id} 的数据到 {args.server}")
+    print(f"[遥测] 在浏览器中打开 {args.server.rstrip('/')}/?user_id={args.user_id}&token={token} 接收状态和询问")
+    session = requests.Session()
+    buffered, previous_titles, last_flush = [], None, time.monotonic()
+    try:
+        while True:
+            time.sleep(SAMPLE_INTERVAL_SECONDS)
+            # 每批的第一条总是带上窗口标题，服务器不需要依赖之前的批次
+            sample, previous_titles = read_sample(previous_titles if buffered else None)
+            buffered.append(sample)
+            if time.monotonic() - last_flush < args.flush_interval:
+                continue
+            last_flush = time.monotonic()
+            buffered = flush(session, args.server.rstrip("/"), args.user_id, token, buffered)
+            if len(buffered) > MAX_BUFFERED_SAMPLES:
+                dropped, buffered = buffered[:-MAX_BUFFERED_SAMPLES], buffered[-MAX_BUFFERED_SAMPLES:]
+                keep_titles(dropped, buffered)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.stop()
+        visual_detector.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# telemetry_service.py
+import os
+import re
+import json
+import math
+import time
+import zlib
+from collections import OrderedDict, Counter
+from utils.event_broker import LOCAL_USER_ID
+from utils.event_bus import bus_broker
+from utils.pending_requests import pending_requests
+from utils.speculation import speculative_analyzer
+from utils.helpers import log_message
+from proactive_service import UserActivityTracker, session_user_state, chart_state, push_inquiry
+
+# 压缩后的请求体上限，以及解压后的上限（防止压缩炸弹）
+MAX_TELEMETRY_BODY_BYTES = int(os.getenv("MAX_TELEMETRY_BODY_BYTES", 256 * 1024))
+MAX_TELEMETRY_DECODED_BYTES = 4 * 1024 * 1024
+MAX_TELEMETRY_BATCH_SAMPLES = int(os.getenv("MAX_TELEMETRY_BATCH_SAMPLES", 600))
+# 同时建模的远程用户上限；超出或长时间没有上报的用户按最久未上报的顺序释放
+MAX_TELEMETRY_USERS = int(os.getenv("MAX_TELEMETRY_USERS", 2000))
+TELEMETRY_USER_IDLE_SECONDS = float(os.getenv("TELEMETRY_USER_IDLE_SECONDS", 600))
+MAX_WINDOW_TITLES = 50
+MAX_WINDOW_TITLE_CHARS = 200
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.@-]{1,64}$")
+
+# 用户的第一条读数缺少的字段用这些值补齐
+DEFAULT_ACTIVITY = {
+    "keyboard_freq_hz": 0.0,
+    "mouse_freq_hz": 0.0,
+    "open_apps_count": 0,
+    "window_titles": [],
+    "cognitive_load": "waiting...",
+    "confidence": 0.0,
+}
+
+
+class TelemetryError(ValueError):
+    """上报的数据无法解析或不合法；status 为返回给客户端的 HTTP 状态码。"""
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def decode_batch(body: bytes, content_encoding: str = "") -> dict:
+    """
+    解析一批上报数据（JSON，可用 gzip 压缩）：
+        {"user_id": "...", "sent_at": 客户端发送时刻, "samples": [{"t": 读数时刻, "keyboard_freq_hz": ..., ...}, ...]}
+    除 t 外的字段都可以省略，省略时沿用该用户上一条读数的值（客户端只在窗口标题变化时才需要发送它）。
+    """
+    if len(body) > MAX_TELEMETRY_BODY_BYTES:
+        raise TelemetryError(f"Telemetry payload exceeds {MAX_TELEMETRY_BODY_BYTES} bytes.", 413)
+    if content_encoding.strip().lower() == "gzip":
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            body = decompressor.decompress(body, MAX_TELEMETRY_DECODED_BYTES)
+        except zlib.error as e:
+            raise TelemetryError(f"Invalid gzip payload: {e}")
+        if decompressor.unconsumed_tail:
+            raise TelemetryError(f"Decompressed telemetry exceeds {MAX_TELEMETRY_DECODED_BYTES} bytes.", 413)
+    try:
+        batch = json.loads(body)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise TelemetryError(f"Invalid telemetry JSON: {e}")
+
+    if not isinstance(batch, dict):
+        raise TelemetryError("Telemetry batch must be a JSON object.")
+    user_id = batch.get("user_id")
+    if not isinstance(user_id, str) or not USER_ID_PATTERN.match(user_id) or user_id == LOCAL_USER_ID:
+        raise TelemetryError("Invalid or reserved user_id.")
+    samples = batch.get("samples")
+    if not isinstance(samples, list) or not samples:
+        raise TelemetryError("Telemetry batch has no samples.")
+    if len(samples) > MAX_TELEMETRY_BATCH_SAMPLES:
+        raise TelemetryError(f"Telemetry batch exceeds {MAX_TELEMETRY_BATCH_SAMPLES} samples.", 413)
+    try:
+        sent_at = _finite(batch.get("sent_at", time.time()))
+        samples = sorted((_normalize_sample(sample) for sample in samples), key=lambda sample: sample["t"])
+    except (TypeError, ValueError, KeyError, OverflowError) as e:
+        raise TelemetryError(f"Invalid telemetry sample: {e}")
+    return {"user_id": user_id, "sent_at": sent_at, "samples": samples}
+
+
+def _finite(value) -> float:
+    """json.loads 接受 NaN / Infinity，这类时刻和读数无法换算成历史槽，按不合法处理。"""
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"non-finite value {value}")
+    return value
+
+
+def _normalize_sample(sample: dict) -> dict:
+    normalized = {"t": _finite(sample["t"])}
+    for key in ("keyboard_freq_hz", "mouse_freq_hz", "confidence"):
+        if key in sample:
+            normalized[key] = _finite(sample[key])
+    if "open_apps_count" in sample:
+        normalized["open_apps_count"] = int(sample["open_apps_count"])
+    if "cognitive_load" in sample:
+        normalized["cognitive_load"] = str(sample["cognitive_load"])[:32]
+    if "window_titles" in sample:
+        normalized["window_titles"] = [str(title)[:MAX_WINDOW_TITLE_CHARS] for title in sample["window_titles"][:MAX_WINDOW_TITLES]]
+    return normalized
+
+
+class TelemetryService:
+    """
+    接收客户端代理上报的远程用户活动，每个用户一个独立的评分模型，询问只推送给该用户的会话。
+    客户端时钟与服务器不一致时，按批次的 sent_at 把读数时刻换算到服务器时间。
+    评分模型保存在本 worker 内存中：多 worker 部署时同一用户的上报需要固定发往同一个 worker。
+    """
+    def __init__(self, broker, request_cache, speculator, max_users: int = MAX_TELEMETRY_USERS,
+                 idle_seconds: float = TELEMETRY_USER_IDLE_SECONDS):
+        self.broker = broker
+        self.request_cache = request_cache
+        self.speculator = speculator
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self.trackers = OrderedDict()  # user_id -> (UserActivityTracker, 最后上报时间)，按最后上报时间排序
+        self.counts = Counter()
+        self.ingest_seconds = 0.0
+        self.started_at = time.time()
+
+    def _tracker(self, user_id: str, now: float) -> UserActivityTracker:
+        entry = self.trackers.pop(user_id, None)
+        tracker = entry[0] if entry else UserActivityTracker(user_id)
+        self.trackers[user_id] = (tracker, now)
+        while self.trackers:
+            oldest_id, (_, last_seen) = next(iter(self.trackers.items()))
+            if len(self.trackers) <= self.max_users and now - last_seen <= self.idle_seconds:
+                break
+            self.trackers.popitem(last=False)
+            self.broker.forget_user(oldest_id)
+            self.counts["users_evicted"] += 1
+        return tracker
+
+    async def ingest(self, batch: dict, sessions_dict: dict) -> dict:
+        """处理一批已解析的上报数据，返回接受/丢弃的读数数和发出的询问。"""
+        start = time.perf_counter()
+        user_id = batch["user_id"]
+        received_at = time.time()
+        clock_offset = received_at - batch["sent_at"]
+        tracker = self._tracker(user_id, received_at)
+
+        # 这一段不让出事件循环，同一用户的两批数据不会交错写入历史槽
+        accepted, stale, decision = 0, 0, None
+        activity, at = tracker.held_activity, received_at
+        for sample in batch["samples"]:
+            at = min(sample["t"] + clock_offset, received_at)
+            if tracker.is_stale(at):
+                stale += 1
+                continue
+            activity = {**(tracker.held_activity or DEFAULT_ACTIVITY), **{k: v for k, v in sample.items() if k != "t"}}
+            result = tracker.observe(activity, at)
+            if result and result.get("needs_inquiry"):
+                decision = result  # 一批数据跨越多个观察窗口时只询问一次
+            accepted += 1
+
+        if accepted:
+            for session_id in self.broker.subscribed_sessions(user_id) & sessions_dict.keys():
+                sessions_dict[session_id]['user_state'] = session_user_state(activity, at)
+            self.broker.publish_state(chart_state(activity, at), user_id=user_id)
+        request_id = await push_inquiry(decision, user_id, self.broker, self.request_cache, self.speculator) if decision else None
+
+        self.counts["batches"] += 1
+        self.counts["samples_accepted"] += accepted
+        self.counts["samples_stale"] += stale
+        self.counts["inquiries"] += request_id is not None
+        self.ingest_seconds += time.perf_counter() - start
+        return {"user_id": user_id, "accepted": accepted, "stale": stale, "inquiry_request_id": request_id}
+
+    def record_rejected(self, reason: TelemetryError):
+        self.counts[f"rejected_{reason.status}"] += 1
+        log_message(f"Rejected telemetry batch: {reason}")
+
+    def stats(self) -> dict:
+        batches = self.counts["batches"]
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            "users": len(self.trackers),
+            "max_users": self.max_users,
+            **dict(self.counts),
+            "samples_per_second": round(self.counts["samples_accepted"] / elapsed, 2),
+            "ingest_ms_mean": round(self.ingest_seconds / batches * 1000, 3) if batches else 0.0,
+        }
+
+
+# 单例：/telemetry 路由使用
+telemetry_service = TelemetryService(bus_broker, pending_requests, speculative_analyzer)
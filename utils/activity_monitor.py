@@ -2,55 +2,76 @@
 
 import threading
 import time
-from pynput import keyboard, mouse
-import pygetwindow as gw
-from pygetwindow import PyGetWindowException
+from utils.sensor_events import sensor_notifier
+from utils.synthetic_sensors import SENSOR_MODE, SyntheticInputMonitor
+from utils.activity_trace import ReplayInputMonitor, trace_replayer
+from utils.input_timeline import InputTimeline
 
 class InputWindowMonitor:
+    """
+    统计键鼠频率和可见窗口标题。
+    pynput 回调只把事件时刻写入各自的时间线（键盘时间线只由键盘监听线程写，鼠标时间线只由鼠标监听线程写，不需要加锁），
+    任意窗口的频率、空闲时间和间隔统计都可以从时间线按需计算（get_input_features）；
+    更新线程每 interval 秒计算一次最近 interval 秒的频率，窗口枚举可能要几十毫秒，在任何锁之外进行，
+    结果整体替换 snapshot，读取方（get_latest_data）总能拿到一份完整一致的快照。
+    """
     def __init__(self, interval=2.0):
         self.interval = interval
-        self.keyboard_count = 0
-        self.mouse_count = 0
-        self.keyboard_freq = 0.0
-        self.mouse_freq = 0.0
-        self.open_apps_count = 0
-        self.window_titles = []
-
-        self.lock = threading.Lock()
+        self.keyboard_events = InputTimeline()
+        self.mouse_events = InputTimeline()
+        self.snapshot = {
+            "keyboard_freq_hz": 0.0,
+            "mouse_freq_hz": 0.0,
+            "open_apps_count": 0,
+            "window_titles": (),
+        }
         self._stop_event = threading.Event()
 
     def _keyboard_on_press(self, key):
-        with self.lock:
-            self.keyboard_count += 1
+        self.keyboard_events.record()
 
     def _mouse_on_click(self, x, y, button, pressed):
         if pressed:
-            with self.lock:
-                self.mouse_count += 1
+            self.mouse_events.record()
+
+    @staticmethod
+    def _visible_window_titles(gw, PyGetWindowException) -> tuple:
+        titles = []
+        for w in gw.getWindowsWithTitle(""):
+            try:
+                _ = w.left  # 强制访问一下属性以触发潜在异常
+                if w.title.strip() and not w.isMinimized:
+                    titles.append(w.title)
+            except (OSError, PyGetWindowException) as e:
+                # 无效窗口，跳过
+                continue
+        return tuple(titles)
 
     def _update_loop(self):
+        # pygetwindow 只在真正启动监控时导入，合成数据模式下不需要
+        import pygetwindow as gw
+        from pygetwindow import PyGetWindowException
         while not self._stop_event.is_set():
             time.sleep(self.interval)
-            with self.lock:
-                self.keyboard_freq = round(self.keyboard_count / self.interval, 1)
-                self.mouse_freq = round(self.mouse_count / self.interval, 1)
-                self.keyboard_count = 0
-                self.mouse_count = 0
+            now = time.monotonic()
+            window_titles = self._visible_window_titles(gw, PyGetWindowException)
+            previous = self.snapshot
+            if window_titles == previous["window_titles"]:
+                window_titles = previous["window_titles"]  # 窗口没变时沿用原来的元组
+            snapshot = {
+                "keyboard_freq_hz": round(self.keyboard_events.rate(self.interval, now), 1),
+                "mouse_freq_hz": round(self.mouse_events.rate(self.interval, now), 1),
+                "open_apps_count": len(window_titles),
+                "window_titles": window_titles,
+            }
+            self.snapshot = snapshot
 
-                # windows = gw.getWindowsWithTitle("")
-                windows = []
-                for w in gw.getWindowsWithTitle(""):
-                    try:
-                        _ = w.left  # 强制访问一下属性以触发潜在异常
-                        windows.append(w)
-                    except (OSError, PyGetWindowException) as e:
-                        # 无效窗口，跳过
-                        continue
-                visible = [w for w in windows if w.title.strip() and not w.isMinimized]
-                self.open_apps_count = len(visible)
-                self.window_titles = [w.title for w in visible]
+            # 只在数据变化时通知主动服务，空闲时不唤醒它
+            if snapshot != previous:
+                sensor_notifier.notify("input")
 
     def start(self):
+        from pynput import keyboard, mouse
         self.k_listener = keyboard.Listener(on_press=self._keyboard_on_press)
         self.m_listener = mouse.Listener(on_click=self._mouse_on_click)
         self.k_listener.start()
@@ -65,13 +86,25 @@ class InputWindowMonitor:
         self.thread.join()
 
     def get_latest_data(self):
-        with self.lock:
-            return {
-                "keyboard_freq_hz": self.keyboard_freq,
-                "mouse_freq_hz": self.mouse_freq,
-                "open_apps_count": self.open_apps_count,
-                "window_titles": self.window_titles.copy()
+        snapshot = self.snapshot
+        return {**snapshot, "window_titles": list(snapshot["window_titles"])}
+
+    def get_input_features(self, window: float = 30.0) -> dict:
+        """最近 window 秒的键鼠输入特征：平均频率、距最近一次输入的秒数和相邻输入的间隔统计。"""
+        now = time.monotonic()
+        return {
+            name: {
+                "freq_hz": round(timeline.rate(window, now), 2),
+                "idle_seconds": timeline.idle_seconds(now),
+                **timeline.interval_stats(window, now),
             }
+            for name, timeline in (("keyboard", self.keyboard_events), ("mouse", self.mouse_events))
+        }
 
 # 单例：项目启动时导入一次即可全局使用
-monitor = InputWindowMonitor()
+if SENSOR_MODE == "synthetic":
+    monitor = SyntheticInputMonitor()
+elif SENSOR_MODE == "replay":
+    monitor = ReplayInputMonitor(trace_replayer)
+else:
+    monitor = InputWindowMonitor()
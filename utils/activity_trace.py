@@ -0,0 +1,225 @@
+# utils/activity_trace.py
+"""
+活动录制数据的存储格式和重放数据源。
+
+录制数据按分块保存为压缩的 NPZ 文件（trace_recorder 写入），每个分块按列存放一段时间内的读数和事件：
+    t / keyboard_freq_hz / mouse_freq_hz / open_apps_count / confidence   每条读数一个值
+    cognitive_load + cognitive_load_levels                                 负荷等级的编码和编码表
+    title_ids + title_offsets + title_vocab                                每条读数的窗口标题（CSR 形式，标题字符串只存一次）
+    event_t / event_kind / event_request_id                                询问、询问结果和手动求助等事件
+只依赖 NumPy，在没有 pynput、pygetwindow 和摄像头的 Linux 上也能读取和重放。
+"""
+import os
+import time
+import threading
+from datetime import datetime
+import numpy as np
+from utils.sensor_events import sensor_notifier
+
+TRACE_FORMAT_VERSION = 1
+# SENSOR_MODE=replay 时重放的录制数据（分块所在目录或单个 .npz 文件）、重放速度倍数，以及播完后是否从头循环
+SENSOR_REPLAY_PATH = os.getenv("SENSOR_REPLAY_PATH", os.path.join("memory", "traces"))
+SENSOR_REPLAY_SPEED = float(os.getenv("SENSOR_REPLAY_SPEED", 1.0))
+SENSOR_REPLAY_LOOP = os.getenv("SENSOR_REPLAY_LOOP", "1") == "1"
+
+INPUT_FIELDS = ("keyboard_freq_hz", "mouse_freq_hz", "open_apps_count", "window_titles")
+VISION_FIELDS = ("cognitive_load", "confidence")
+
+
+def _strings(values) -> np.ndarray:
+    return np.array(list(values), dtype=str)
+
+
+def encode_chunk(samples: list, events: list) -> dict:
+    """把读数（含 t 和各字段的 dict）和事件（(时刻, 类型, 询问ID)）编码成按列存放的数组。"""
+    levels, vocabulary, title_ids, title_offsets = {}, {}, [], [0]
+    for sample in samples:
+        title_ids.extend(vocabulary.setdefault(title, len(vocabulary)) for title in sample["window_titles"])
+        title_offsets.append(len(title_ids))
+    return {
+        "format_version": np.array(TRACE_FORMAT_VERSION),
+        "t": np.array([sample["t"] for sample in samples], dtype=np.float64),
+        "keyboard_freq_hz": np.array([sample["keyboard_freq_hz"] for sample in samples], dtype=np.float64),
+        "mouse_freq_hz": np.array([sample["mouse_freq_hz"] for sample in samples], dtype=np.float64),
+        "open_apps_count": np.array([sample["open_apps_count"] for sample in samples], dtype=np.int32),
+        "confidence": np.array([sample["confidence"] for sample in samples], dtype=np.float64),
+        "cognitive_load": np.array([levels.setdefault(str(sample["cognitive_load"]), len(levels)) for sample in samples], dtype=np.uint8),
+        "cognitive_load_levels": _strings(levels),
+        "title_ids": np.array(title_ids, dtype=np.int32),
+        "title_offsets": np.array(title_offsets, dtype=np.int32),
+        "title_vocab": _strings(vocabulary),
+        "event_t": np.array([event[0] for event in events], dtype=np.float64),
+        "event_kind": _strings(event[1] for event in events),
+        "event_request_id": _strings(event[2] for event in events),
+    }
+
+
+def write_chunk(path: str, samples: list, events: list) -> int:
+    """写入一个分块（先写临时文件再改名，读取方不会看到写了一半的文件），返回文件字节数。"""
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        np.savez_compressed(f, **encode_chunk(samples, events))
+    os.replace(temporary_path, path)
+    return os.path.getsize(path)
+
+
+def read_chunk(path: str):
+    """读取一个分块，返回 (读数列表, 事件列表)，格式与 encode_chunk 的输入相同。"""
+    with np.load(path) as chunk:
+        if int(chunk["format_version"]) != TRACE_FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported trace format {int(chunk['format_version'])}.")
+        levels = chunk["cognitive_load_levels"].tolist()
+        vocabulary = chunk["title_vocab"].tolist()
+        title_ids, offsets = chunk["title_ids"].tolist(), chunk["title_offsets"].tolist()
+        samples = [
+            {
+                "t": t,
+                "keyboard_freq_hz": keyboard,
+                "mouse_freq_hz": mouse,
+                "open_apps_count": apps,
+                "window_titles": [vocabulary[i] for i in title_ids[offsets[row]:offsets[row + 1]]],
+                "cognitive_load": levels[load],
+                "confidence": confidence,
+            }
+            for row, (t, keyboard, mouse, apps, load, confidence) in enumerate(zip(
+                chunk["t"].tolist(), chunk["keyboard_freq_hz"].tolist(), chunk["mouse_freq_hz"].tolist(),
+                chunk["open_apps_count"].tolist(), chunk["cognitive_load"].tolist(), chunk["confidence"].tolist()))
+        ]
+        events = list(zip(chunk["event_t"].tolist(), chunk["event_kind"].tolist(), chunk["event_request_id"].tolist()))
+    return samples, events
+
+
+def trace_files(path: str) -> list:
+    """path 为目录时返回其中的分块文件（文件名以开始时刻命名，排序即时间顺序），为文件时返回它本身。"""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".npz"))
+    return [path]
+
+
+def read_trace(path: str):
+    """读取目录中的所有分块（或单个分块），返回按时间排序的 (读数列表, 事件列表)。"""
+    samples, events = [], []
+    for file in trace_files(path):
+        chunk_samples, chunk_events = read_chunk(file)
+        samples.extend(chunk_samples)
+        events.extend(chunk_events)
+    samples.sort(key=lambda sample: sample["t"])
+    events.sort(key=lambda event: event[0])
+    return samples, events
+
+
+class TraceReplayer:
+    """
+    按原速（speed=1）或加速重放录制的读数：重放时钟从 start() 开始走，查询时返回时钟所在位置的那条读数。
+    ReplayInputMonitor 和 ReplayCognitiveLoadDetector 共用同一条时间线；
+    读数变化时像真实传感器一样发出 "input" / "vision" 通知。录制数据在第一次 start() 时才读取。
+    """
+    def __init__(self, path: str = SENSOR_REPLAY_PATH, speed: float = SENSOR_REPLAY_SPEED, loop: bool = SENSOR_REPLAY_LOOP):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.lock = threading.Lock()
+        self.users = 0
+        self.thread = None
+        self.samples = None
+        self.offsets = None
+        self.cycle_seconds = 0.0
+        self.started_at = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        with self.lock:
+            self.users += 1
+            if self.thread is not None:
+                return
+            samples, _ = read_trace(self.path)
+            if not samples:
+                raise ValueError(f"No recorded samples found in {self.path}.")
+            self.samples = samples
+            self.offsets = np.array([sample["t"] for sample in samples]) - samples[0]["t"]
+            # 一轮的时长：最后一条读数再保持一个平均采样间隔后回到开头
+            self.cycle_seconds = max(self.offsets[-1] * len(samples) / max(len(samples) - 1, 1), 1.0)
+            self.started_at = time.monotonic()
+            self._stop_event.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+            print(f"[重放] {len(samples)} 条读数，{self.offsets[-1]:.0f} 秒，{self.speed:g} 倍速")
+
+    def stop(self):
+        with self.lock:
+            self.users = max(self.users - 1, 0)
+            if self.users == 0 and self.thread is not None:
+                self._stop_event.set()
+                self.thread = None
+
+    def _elapsed(self) -> float:
+        """重放时钟在录制数据中的位置（秒）。"""
+        elapsed = (time.monotonic() - self.started_at) * self.speed
+        return elapsed % self.cycle_seconds if self.loop else min(elapsed, self.offsets[-1])
+
+    def current(self):
+        """重放时钟所在位置的读数；还没有 start() 时返回 None。"""
+        if self.samples is None:
+            return None
+        return self.samples[max(int(np.searchsorted(self.offsets, self._elapsed(), side="right")) - 1, 0)]
+
+    def _run(self):
+        previous = None
+        while not self._stop_event.is_set():
+            elapsed = self._elapsed()
+            index = max(int(np.searchsorted(self.offsets, elapsed, side="right")) - 1, 0)
+            sample = self.samples[index]
+            if previous is None or any(sample[field] != previous[field] for field in INPUT_FIELDS):
+                sensor_notifier.notify("input")
+            if previous is None or any(sample[field] != previous[field] for field in VISION_FIELDS):
+                sensor_notifier.notify("vision")
+            previous = sample
+            if index + 1 < len(self.samples):
+                next_offset = self.offsets[index + 1]
+            elif self.loop:
+                next_offset = self.cycle_seconds
+            else:
+                return  # 播完后停在最后一条读数上
+            self._stop_event.wait(max((next_offset - elapsed) / self.speed, 0.001))
+
+
+class ReplayInputMonitor:
+    """与 InputWindowMonitor 接口相同，给出录制的键鼠频率和窗口标题。"""
+    def __init__(self, replayer: TraceReplayer):
+        self.replayer = replayer
+
+    def start(self):
+        self.replayer.start()
+
+    def stop(self):
+        self.replayer.stop()
+
+    def get_latest_data(self):
+        sample = self.replayer.current() or {"keyboard_freq_hz": 0.0, "mouse_freq_hz": 0.0, "open_apps_count": 0, "window_titles": []}
+        return {field: list(sample[field]) if field == "window_titles" else sample[field] for field in INPUT_FIELDS}
+
+
+class ReplayCognitiveLoadDetector:
+    """与 CognitiveLoadThread 接口相同，给出录制的认知负荷结果。"""
+    def __init__(self, replayer: TraceReplayer):
+        self.replayer = replayer
+
+    def start(self):
+        self.replayer.start()
+
+    def stop(self):
+        self.replayer.stop()
+
+    def get_latest_load(self):
+        sample = self.replayer.current()
+        if sample is None:
+            return None
+        return {
+            "cognitive_load": sample["cognitive_load"],
+            "confidence": sample["confidence"],
+            "timestamp": datetime.fromtimestamp(sample["t"]).strftime("%H:%M:%S"),
+        }
+
+
+# 单例：SENSOR_MODE=replay 时由 activity_monitor 和 face_thread 共用
+trace_replayer = TraceReplayer()
@@ -0,0 +1,132 @@
+# utils/attachment_store.py
+import os
+import re
+import base64
+import hashlib
+import tempfile
+from typing import BinaryIO, Optional
+
+ATTACHMENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "attachments")
+ATTACHMENT_URL_PREFIX = "attachment://"
+_CHUNK_SIZE = 1024 * 1024
+# 合法的附件键：小写十六进制的 SHA-256 摘要；其他字符串一律不当作附件引用（防止 ../ 之类的路径穿越）
+_SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class AttachmentStore:
+    """
+    按内容寻址的附件存储。
+    上传的文件只以 SHA-256 为键写入磁盘一次，消息历史中只保存引用和元数据，
+    需要原始内容时（工具调用、发送给视觉模型）再按需解析。
+    """
+    def __init__(self, root_dir: str = ATTACHMENTS_DIR):
+        self.root_dir = os.path.abspath(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def path_for(self, sha256: str) -> str:
+        """返回某个摘要对应的 blob 路径（两级目录，避免单目录文件过多）。"""
+        if not is_sha256(sha256):
+            raise ValueError(f"Invalid attachment key: {sha256!r}")
+        return os.path.join(self.root_dir, sha256[:2], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path_for(sha256))
+
+    def put_stream(self, stream: BinaryIO, name: str = "", mime: str = "") -> dict:
+        """
+        边读边计算哈希，把流式上传的内容写入临时文件，完成后原子地移动到最终位置。
+        相同内容已存在时直接丢弃临时文件。
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.root_dir, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                while True:
+                    chunk = stream.read(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+            sha256 = hasher.hexdigest()
+            final_path = self.path_for(sha256)
+            if os.path.exists(final_path):
+                os.unlink(temp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(temp_path, final_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return make_ref(sha256, name, mime, size)
+
+    def put_bytes(self, data: bytes, name: str = "", mime: str = "") -> dict:
+        """写入一段内存中的字节（兼容旧的 Base64 JSON 上传）。"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        final_path = self.path_for(sha256)
+        if not os.path.exists(final_path):
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.root_dir, prefix=".upload-")
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, final_path)
+        return make_ref(sha256, name, mime, len(data))
+
+    def get_bytes(self, sha256: str) -> bytes:
+        with open(self.path_for(sha256), "rb") as f:
+            return f.read()
+
+    def get_base64(self, sha256: str) -> str:
+        return base64.b64encode(self.get_bytes(sha256)).decode("utf-8")
+
+
+def make_ref(sha256: str, name: str, mime: str, size: int) -> dict:
+    """消息中保存的附件引用：只有摘要和元数据，没有内容。"""
+    return {
+        "ref": sha256,
+        "name": name,
+        "mime": mime,
+        "size": size,
+        "url": f"{ATTACHMENT_URL_PREFIX}{sha256}",
+    }
+
+
+def is_sha256(value) -> bool:
+    return isinstance(value, str) and _SHA256_PATTERN.fullmatch(value) is not None
+
+
+def parse_attachment_url(url: str) -> Optional[str]:
+    """如果是合法的 attachment://<sha256> 引用则返回摘要，否则返回 None。"""
+    if isinstance(url, str) and url.startswith(ATTACHMENT_URL_PREFIX):
+        sha256 = url[len(ATTACHMENT_URL_PREFIX):]
+        if is_sha256(sha256):
+            return sha256
+    return None
+
+
+def resolve_image_part(part: dict) -> dict:
+    """把引用形式的 image_url 部分解析为发送给视觉模型的 data URL。"""
+    url = part.get("image_url", {}).get("url", "")
+    sha256 = parse_attachment_url(url)
+    if not sha256:
+        return part
+    mime = part.get("image_url", {}).get("mime") or "image/png"
+    return {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{attachment_store.get_base64(sha256)}"}}
+
+
+def resolve_tool_args(value):
+    """递归地把工具参数中的 attachment:// 引用替换为本地 blob 路径。"""
+    if isinstance(value, dict):
+        return {k: resolve_tool_args(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_tool_args(v) for v in value]
+    sha256 = parse_attachment_url(value)
+    if sha256 and attachment_store.exists(sha256):
+        return attachment_store.path_for(sha256)
+    return value
+
+
+# 单例：全局共享一个附件存储
+attachment_store = AttachmentStore()
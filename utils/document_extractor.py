@@ -0,0 +1,265 @@
+# utils/document_extractor.py
+import os
+import time
+import atexit
+import asyncio
+import tempfile
+import threading
+from typing import Callable, Optional
+from concurrent.futures import ProcessPoolExecutor
+from utils import extraction_workers
+from utils.attachment_store import attachment_store
+from utils.helpers import log_message
+
+# 提取逻辑变化时递增，旧的缓存条目会自然失效
+EXTRACTOR_VERSION = 2
+EXTRACTION_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "extraction")
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# 进程池配置：解析 PDF 是占用 GIL 的纯 CPU 工作，放到子进程中才不会卡住事件循环
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", max(1, min(4, (os.cpu_count() or 2) - 1))))
+PDF_PAGES_PER_TASK = 8
+# 为 True 时，提前停止的提取会在后台继续完成全文解析并写入缓存
+EXTRACT_FULL_IN_BACKGROUND = os.getenv("EXTRACT_FULL_IN_BACKGROUND", "0") == "1"
+
+PLAIN_TEXT_EXTENSIONS = [".txt", ".md", ".py", ".json", ".html", ".css", ".csv"]
+EXTRACTORS = {".pdf": "pypdf", ".docx": "docx2txt"}
+
+
+class ExtractionCache:
+    """
+    文档文本提取结果的磁盘缓存。
+    以“文件内容哈希 + 提取器名称 + 提取器版本”为键，跨会话共享；
+    总大小超过上限时按最近使用时间淘汰。
+    """
+    def __init__(self, cache_dir: str = EXTRACTION_CACHE_DIR, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._total_bytes = None  # 首次写入时再扫描目录
+
+    def _key(self, sha256: str, extractor: str) -> str:
+        return f"{sha256}-{extractor}-v{EXTRACTOR_VERSION}"
+
+    def _paths(self, key: str):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".txt", base + ".meta"
+
+    def _read(self, sha256: str, extractor: str):
+        """读取缓存条目，返回 (文本, 当初的解析耗时)；不存在或已损坏时返回 None。"""
+        text_path, meta_path = self._paths(self._key(sha256, extractor))
+        try:
+            with open(text_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            with open(meta_path, "r", encoding="utf-8") as f:
+                parse_seconds = float(f.read().strip() or 0)
+            os.utime(text_path)  # 刷新最近使用时间，用于淘汰
+        except (OSError, ValueError):
+            return None
+        return text, parse_seconds
+
+    def get(self, sha256: str, extractor: str) -> Optional[str]:
+        entry = self._read(sha256, extractor)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.seconds_saved += entry[1]
+        return entry[0]
+
+    def peek(self, sha256: str, extractor: str) -> Optional[str]:
+        """与 get 相同，但不计入命中率统计（用于不会触发解析的读取，例如重建文档索引）。"""
+        entry = self._read(sha256, extractor)
+        return entry[0] if entry is not None else None
+
+    def put(self, sha256: str, extractor: str, text: str, parse_seconds: float):
+        text_path, meta_path = self._paths(self._key(sha256, extractor))
+        # 文本先写到唯一的临时文件（可以并发写）；替换和大小统计在锁内完成，同一条目并发写入时只计一次
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            size = os.path.getsize(temp_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        with self.lock:
+            try:
+                previous_size = os.path.getsize(text_path)  # 同一条目再次写入时只计大小的变化
+            except OSError:
+                previous_size = 0
+            os.replace(temp_path, text_path)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                f.write(f"{parse_seconds:.6f}")
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total_bytes()
+            else:
+                self._total_bytes += size - previous_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan_total_bytes(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.cache_dir) if entry.name.endswith(".txt"))
+
+    def _evict(self):
+        """淘汰最久未使用的条目，直到总大小回到上限的 90% 以下。"""
+        entries = sorted(
+            (entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".txt")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        target = int(self.max_bytes * 0.9)
+        for entry in entries:
+            if self._total_bytes <= target:
+                break
+            size = entry.stat().st_size
+            for path in self._paths(entry.path[:-len(".txt")]):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            self._total_bytes -= size
+            log_message(f"Extraction cache evicted {entry.name} ({size} bytes).")
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "seconds_saved": round(self.seconds_saved, 3),
+            }
+
+
+_executor = None
+_background_tasks = set()
+
+
+def get_cached_text(file_ref: dict) -> Optional[str]:
+    """只查缓存、不触发解析，返回完整提取文本或 None。"""
+    extractor = EXTRACTORS.get(os.path.splitext(file_ref.get('name', ''))[1].lower())
+    return extraction_cache.peek(file_ref['ref'], extractor) if extractor else None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS)
+        atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+    return _executor
+
+
+async def _extract_pdf(path: str, max_chars: Optional[int]):
+    """
+    按页分批并行解析 PDF。
+    批次按页序提交，同时在飞的批次数不超过进程数；
+    指定了 max_chars 时，一旦已按页序拿到足够的文本就停止提交并取消剩余批次。
+    返回 (文本, 是否完整)。
+    """
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    page_count = await loop.run_in_executor(executor, extraction_workers.pdf_page_count, path)
+    batches = [(start, min(start + PDF_PAGES_PER_TASK, page_count)) for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+
+    pages, chars, next_batch = [], 0, 0
+    in_flight = []
+    try:
+        while next_batch < len(batches) or in_flight:
+            while next_batch < len(batches) and len(in_flight) < EXTRACTION_WORKERS:
+                start, stop = batches[next_batch]
+                in_flight.append(loop.run_in_executor(executor, extraction_workers.extract_pdf_pages, path, start, stop))
+                next_batch += 1
+            batch_pages = await in_flight.pop(0)
+            pages.extend(batch_pages)
+            chars += sum(len(page) for page in batch_pages)
+            if max_chars is not None and chars > max_chars and (in_flight or next_batch < len(batches)):
+                return "\n\n".join(pages), False
+        return "\n\n".join(pages), True
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+async def _extract(extension: str, path: str, max_chars: Optional[int]):
+    if extension == ".pdf":
+        return await _extract_pdf(path, max_chars)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), extraction_workers.extract_docx, path), True
+
+
+async def _notify_full_text(on_full_text: Optional[Callable[[str], None]], text: str):
+    if on_full_text is not None:
+        await asyncio.to_thread(on_full_text, text)
+
+
+async def _extract_full_and_cache(file_name: str, extension: str, sha256: str, on_full_text: Optional[Callable[[str], None]]):
+    start = time.perf_counter()
+    try:
+        text, _ = await _extract(extension, attachment_store.path_for(sha256), None)
+        parse_seconds = time.perf_counter() - start
+        await asyncio.to_thread(extraction_cache.put, sha256, EXTRACTORS[extension], text, parse_seconds)
+        log_message(f"Background full extraction of '{file_name}' finished in {parse_seconds:.2f}s ({len(text)} chars).")
+        await _notify_full_text(on_full_text, text)
+    except Exception as e:
+        log_message(f"Background full extraction of '{file_name}' failed: {e}")
+
+
+async def extract_attachment_text(file_ref: dict, max_chars: Optional[int] = None, full_in_background: bool = EXTRACT_FULL_IN_BACKGROUND,
+                                  on_full_text: Optional[Callable[[str], None]] = None) -> str:
+    """
+    提取附件的文本内容。PDF/DOCX 先查提取缓存，未命中时在进程池中解析。
+    指定 max_chars 时，大 PDF 在拿到足够文本后提前返回（只有完整结果才会写入缓存）；
+    若 full_in_background 为 True，剩余部分会在后台继续解析并写入缓存。
+    每当拿到完整的提取文本（缓存命中、完整解析或后台解析完成）时，都会以全文调用 on_full_text。
+    出错时返回一段错误说明文本（与原来的行为一致），而不是抛出异常。
+    """
+    file_name = file_ref.get('name', '')
+    file_extension = os.path.splitext(file_name)[1].lower()
+    sha256 = file_ref['ref']
+
+    try:
+        if file_extension in PLAIN_TEXT_EXTENSIONS:
+            decoded_bytes = await asyncio.to_thread(attachment_store.get_bytes, sha256)
+            text = decoded_bytes.decode('utf-8', errors='ignore')
+            await _notify_full_text(on_full_text, text)
+            return text
+
+        extractor = EXTRACTORS.get(file_extension)
+        if extractor is None:
+            return f"错误：不支持的文件类型 '{file_extension}'。我只能读取 .pdf, .docx, 和纯文本文件。"
+
+        cached_text = await asyncio.to_thread(extraction_cache.get, sha256, extractor)
+        if cached_text is not None:
+            log_message(f"Extraction cache hit for '{file_name}' ({extractor}). Stats: {extraction_cache.stats()}")
+            await _notify_full_text(on_full_text, cached_text)
+            return cached_text
+
+        print(f"Using {extractor} for file: {file_name}")
+        start = time.perf_counter()
+        # 直接读取附件存储中的 blob，无需再写临时文件
+        text, complete = await _extract(file_extension, attachment_store.path_for(sha256), max_chars)
+        parse_seconds = time.perf_counter() - start
+        if complete:
+            await asyncio.to_thread(extraction_cache.put, sha256, extractor, text, parse_seconds)
+            log_message(f"Extraction cache miss for '{file_name}', parsed in {parse_seconds:.2f}s. Stats: {extraction_cache.stats()}")
+            await _notify_full_text(on_full_text, text)
+        else:
+            log_message(f"Stopped extracting '{file_name}' early after {parse_seconds:.2f}s ({len(text)} chars, budget {max_chars}).")
+            if full_in_background:
+                task = asyncio.create_task(_extract_full_and_cache(file_name, file_extension, sha256, on_full_text))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+        return text
+
+    except Exception as e:
+        print(f"Error processing file content for file '{file_name}': {e}")
+        return f"错误：处理文件 '{file_name}' 时发生异常: {e}"
+
+
+# 单例：全局共享一个提取缓存
+extraction_cache = ExtractionCache()
@@ -0,0 +1,140 @@
+# utils/document_index.py
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import List, Optional
+
+CHUNK_CHARS = 600
+CHUNK_OVERLAP_CHARS = 100
+MAX_INDEXED_DOCUMENTS = 32
+
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+_CJK_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    简单的中英文混合分词：英文/数字按单词切分，中文连续片段切成单字 + 相邻二元组。
+    不依赖额外的分词库。
+    """
+    text = text.lower()
+    tokens = _WORD_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 LLM token 数：中文约 1 字 1 token，其余约 4 字符 1 token。"""
+    cjk_chars = sum(len(run) for run in _CJK_RE.findall(text))
+    return cjk_chars + (len(text) - cjk_chars) // 4 + 1
+
+
+def chunk_text(text: str, chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP_CHARS) -> List[str]:
+    """按段落边界把文本切成约 chunk_chars 大小的块，相邻块之间保留少量重叠。"""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            # 尽量在段落或句子边界处断开
+            boundary = max(text.rfind("\n", start + chunk_chars // 2, end), text.rfind("。", start + chunk_chars // 2, end))
+            if boundary > start:
+                end = boundary + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class BM25Index:
+    """对单个文档的所有文本块建立的 BM25 倒排统计。"""
+    def __init__(self, text: str, complete: bool = True):
+        self.complete = complete
+        self.chunks = chunk_text(text)
+        self.term_freqs = [Counter(tokenize(chunk)) for chunk in self.chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        doc_freqs = Counter()
+        for tf in self.term_freqs:
+            doc_freqs.update(tf.keys())
+        n = len(self.chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def score(self, query: str) -> List[float]:
+        query_terms = set(tokenize(query))
+        scores = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self.avg_length) if self.avg_length else BM25_K1
+            for term in query_terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+            scores.append(score)
+        return scores
+
+    def select(self, query: str, token_budget: int, fallback_to_head: bool = True) -> List[str]:
+        """
+        选出与问题最相关（得分大于 0）、且总 token 数不超过预算的文本块，按原文顺序返回；得分为 0 的块不会用来填充预算。
+        所有块都不相关时，fallback_to_head 为 True 则从文档开头按顺序填充预算，否则返回空列表。
+        """
+        scores = self.score(query) if query else [0.0] * len(self.chunks)
+        if any(scores):
+            order = sorted((i for i in range(len(self.chunks)) if scores[i] > 0), key=lambda i: (-scores[i], i))
+        elif fallback_to_head:
+            order = range(len(self.chunks))
+        else:
+            return []
+        selected, used = [], 0
+        for i in order:
+            cost = estimate_tokens(self.chunks[i])
+            if used + cost > token_budget:
+                continue
+            selected.append(i)
+            used += cost
+        return [self.chunks[i] for i in sorted(selected)]
+
+
+class DocumentIndexStore:
+    """
+    按附件摘要缓存文档索引（LRU），同一文档的后续提问直接复用。
+    先用首轮提取的部分文本建索引，后台全文提取完成后再替换为完整索引。
+    """
+    def __init__(self, max_documents: int = MAX_INDEXED_DOCUMENTS):
+        self.max_documents = max_documents
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, sha256: str, text: str, complete: bool = True) -> BM25Index:
+        with self.lock:
+            existing = self.indexes.get(sha256)
+            if existing is not None and existing.complete and not complete:
+                return existing  # 不要用部分文本覆盖完整索引
+        index = BM25Index(text, complete)
+        with self.lock:
+            self.indexes[sha256] = index
+            self.indexes.move_to_end(sha256)
+            while len(self.indexes) > self.max_documents:
+                self.indexes.popitem(last=False)
+        return index
+
+    def get(self, sha256: str) -> Optional[BM25Index]:
+        with self.lock:
+            index = self.indexes.get(sha256)
+            if index is not None:
+                self.indexes.move_to_end(sha256)
+            return index
+
+
+# 单例：全局共享文档索引
+document_index_store = DocumentIndexStore()
@@ -0,0 +1,209 @@
+# utils/event_broker.py
+import json
+import time
+import asyncio
+from collections import deque, Counter
+from typing import Optional
+
+SUBSCRIBER_QUEUE_SIZE = 64
+# 低价值事件：队列满时优先丢弃其中最旧的一条
+LOW_VALUE_EVENT_TYPES = {"state_update"}
+# 服务端保留最近多少条事件，用于断线重连时按 Last-Event-ID 补发
+REPLAY_BUFFER_SIZE = 256
+# 这些事件超过一定时间后不再补发（例如询问在前端 20 秒后就自动关闭了）
+REPLAY_MAX_AGE_SECONDS = {"inquiry": 20}
+# 判断状态是否变化时忽略的字段
+STATE_VOLATILE_FIELDS = {"timestamp"}
+# 运行 web_app 的这台机器的用户；不带 user_id 的订阅者和本机传感器的状态都属于它，远程用户的数据来自遥测上报
+LOCAL_USER_ID = "local"
+
+
+class Subscriber:
+    """一个 SSE 连接对应一个订阅者，拥有自己的有界事件队列，队列元素为 (事件ID, 事件)。"""
+    def __init__(self, broker, session_id: Optional[str], maxsize: int, user_id: str = LOCAL_USER_ID):
+        self.broker = broker
+        self.session_id = session_id
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.events = deque()
+        self.dropped = 0
+        # 丢过状态增量后，下一条状态事件要换成完整快照，客户端才能保持一致
+        self.state_stale = False
+        self._ready = asyncio.Event()
+
+    def offer(self, event_id: int, event: dict) -> Optional[dict]:
+        """
+        放入一个事件，返回因队列已满而被丢弃的事件（没有则返回 None）。
+        队列满时先丢弃最旧的低价值事件；若队列里全是重要事件，
+        新来的低价值事件直接丢弃，重要事件则挤掉最旧的一条。
+        """
+        dropped = None
+        if len(self.events) >= self.maxsize:
+            low_value = next((item for item in self.events if item[1].get("type") in LOW_VALUE_EVENT_TYPES), None)
+            if low_value is not None:
+                self.events.remove(low_value)
+                dropped = low_value[1]
+            elif event.get("type") in LOW_VALUE_EVENT_TYPES:
+                dropped = event
+            else:
+                dropped = self.events.popleft()[1]
+            self.dropped += 1
+            if dropped.get("type") == "state_update":
+                self.state_stale = True
+            if dropped is event:
+                return event
+        self.events.append((event_id, event))
+        self._ready.set()
+        return dropped
+
+    async def get(self):
+        while not self.events:
+            self._ready.clear()
+            await self._ready.wait()
+        event_id, event = self.events.popleft()
+        if event.get("type") == "state_update" and self.state_stale:
+            self.state_stale = False
+            event = self.broker.state_keyframe(self.user_id)
+        return event_id, event
+
+
+class EventBroker:
+    """
+    /listen 的扇出式发布/订阅。
+    每个订阅者一个有界队列；广播事件发给所有订阅者，带 session_id 的事件只发给该会话的订阅者，
+    带 user_id 的事件只发给该用户的订阅者。没有订阅者时事件直接丢弃，不做任何缓冲（重放缓冲区除外）。
+    所有事件带单调递增的 ID；状态更新按用户分别维护快照，只在变化时发出，内容为相对上一快照的增量。
+    """
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE, replay_size: int = REPLAY_BUFFER_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.last_event_id = 0
+        self.replay_buffer = deque(maxlen=replay_size)  # (事件ID, session_id, user_id, 发布时间, 事件)
+        self.state_snapshots = {}  # user_id -> 状态快照
+        self.published = Counter()
+        self.delivered = Counter()
+        self.dropped = Counter()
+        self.coalesced = 0
+        self.replayed = 0
+
+    def subscribe(self, session_id: Optional[str] = None, last_event_id: Optional[int] = None,
+                  user_id: str = LOCAL_USER_ID) -> Subscriber:
+        """
+        新建订阅。带 last_event_id 的重连会先补发缓冲区中之后的事件；
+        首次连接或缓冲区已覆盖不到断点时，先发一个该用户的完整状态快照，
+        此时缓冲区中的状态增量都比快照旧，只补发其他事件。
+        """
+        subscriber = Subscriber(self, session_id, self.queue_size, user_id)
+        if last_event_id is not None and last_event_id > self.last_event_id:
+            last_event_id = None  # 服务端重启过，旧的事件ID已经没有意义
+        oldest_id = self.replay_buffer[0][0] if self.replay_buffer else self.last_event_id + 1
+        sent_keyframe = last_event_id is None or last_event_id < oldest_id - 1
+        if sent_keyframe:
+            if self.state_snapshots.get(user_id):
+                subscriber.offer(self.last_event_id, self.state_keyframe(user_id))
+        if last_event_id is not None:
+            now = time.time()
+            for event_id, target_session, target_user, published_at, event in self.replay_buffer:
+                if event_id <= last_event_id or not self._routes_to(subscriber, target_session, target_user):
+                    continue
+                if sent_keyframe and event.get("type") == "state_update":
+                    continue
+                max_age = REPLAY_MAX_AGE_SECONDS.get(event.get("type"))
+                if max_age is not None and now - published_at > max_age:
+                    continue
+                subscriber.offer(event_id, event)
+                self.replayed += 1
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def subscribed_sessions(self, user_id: Optional[str] = None) -> set:
+        """有订阅者的会话；给出 user_id 时只返回该用户的会话。"""
+        return {s.session_id for s in self.subscribers if s.session_id and (user_id is None or s.user_id == user_id)}
+
+    def session_users(self) -> dict:
+        """有订阅者的会话 -> 其用户。"""
+        return {s.session_id: s.user_id for s in self.subscribers if s.session_id}
+
+    def has_subscribers(self, session_id: Optional[str] = None) -> bool:
+        if session_id is None:
+            return bool(self.subscribers)
+        return any(s.session_id == session_id for s in self.subscribers)
+
+    @staticmethod
+    def _routes_to(subscriber: Subscriber, session_id: Optional[str], user_id: Optional[str]) -> bool:
+        return (session_id is None or subscriber.session_id == session_id) and (user_id is None or subscriber.user_id == user_id)
+
+    def publish(self, event: dict, session_id: Optional[str] = None, event_id: Optional[int] = None,
+                user_id: Optional[str] = None) -> int:
+        """
+        发布事件，返回实际投递到的订阅者数量。必须在事件循环线程中调用。
+        event_id 由事件总线给出时沿用它（各 worker 的事件ID因此一致），否则自行递增。
+        """
+        event_type = event.get("type", "unknown")
+        self.last_event_id = max(self.last_event_id + 1, event_id or 0)
+        event_id = self.last_event_id
+        self.replay_buffer.append((event_id, session_id, user_id, time.time(), event))
+        self.published[event_type] += 1
+        delivered = 0
+        for subscriber in list(self.subscribers):
+            if not self._routes_to(subscriber, session_id, user_id):
+                continue
+            dropped = subscriber.offer(event_id, event)
+            if dropped is not event:
+                delivered += 1
+            if dropped is not None:
+                self.dropped[dropped.get("type", "unknown")] += 1
+        self.delivered[event_type] += delivered
+        return delivered
+
+    def publish_state(self, data: dict, event_id: Optional[int] = None, user_id: str = LOCAL_USER_ID) -> int:
+        """
+        发布某个用户的状态更新，只发给该用户的订阅者：与该用户的上一快照相比没有变化则不发送（只计数），
+        否则只发送变化的字段（易变字段如时间戳随增量一起带上）；上一快照中有、这次没有的字段列在 removed 中，客户端据此删除。
+        """
+        snapshot = self.state_snapshots.get(user_id, {})
+        changed = {k: v for k, v in data.items() if k not in STATE_VOLATILE_FIELDS and (k not in snapshot or snapshot[k] != v)}
+        removed = [k for k in snapshot if k not in data]
+        if not changed and not any(k not in STATE_VOLATILE_FIELDS for k in removed):
+            self.coalesced += 1
+            return 0
+        event = {"type": "state_update", "delta": {k: v for k, v in data.items() if k in changed or k in STATE_VOLATILE_FIELDS}}
+        if removed:
+            event["removed"] = removed
+        self.state_snapshots[user_id] = dict(data)
+        return self.publish(event, event_id=event_id, user_id=user_id)
+
+    def forget_user(self, user_id: str):
+        """丢弃一个不再活跃的用户的状态快照。"""
+        self.state_snapshots.pop(user_id, None)
+
+    def state_keyframe(self, user_id: str = LOCAL_USER_ID) -> dict:
+        return {"type": "state_update", "full": True, "delta": dict(self.state_snapshots.get(user_id, {}))}
+
+    def stats(self) -> dict:
+        by_session = Counter(s.session_id or "(anonymous)" for s in self.subscribers)
+        return {
+            "subscribers": len(self.subscribers),
+            "subscribers_by_session": dict(by_session),
+            "users": len({s.user_id for s in self.subscribers}),
+            "state_snapshots": len(self.state_snapshots),
+            "last_event_id": self.last_event_id,
+            "published": dict(self.published),
+            "delivered": dict(self.delivered),
+            "dropped": dict(self.dropped),
+            "coalesced_state_updates": self.coalesced,
+            "replayed": self.replayed,
+            "queued": sum(len(s.events) for s in self.subscribers),
+        }
+
+
+def format_sse(event_id: int, event: dict) -> str:
+    """按 SSE 格式输出一条带 ID 的事件。"""
+    return f"id: {event_id}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+# 单例：web_app 与主动服务共享同一个事件代理
+event_broker = EventBroker()
@@ -0,0 +1,391 @@
+# utils/event_bus.py
+import os
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Optional
+from utils.helpers import log_message
+from utils.event_broker import event_broker, LOCAL_USER_ID
+
+# "inprocess"（单进程，默认）或 "sqlite"（同一台机器上的多个 worker 共享一个 SQLite 文件）
+EVENT_BUS_BACKEND = os.getenv("EVENT_BUS", "inprocess").lower()
+EVENT_BUS_PATH = os.getenv("EVENT_BUS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "event_bus.sqlite3"))
+# SQLite 实现的事件轮询间隔
+EVENT_BUS_POLL_SECONDS = float(os.getenv("EVENT_BUS_POLL_SECONDS", 0.1))
+# 事件日志保留的条数（进程内实现即环形缓冲区大小）
+EVENT_LOG_RETAIN = 10000
+# 每个 worker 登记自己正在监听的会话，登记的有效期
+LISTENER_REGISTRY_TTL_SECONDS = 15
+LISTENER_REGISTRY_REFRESH_SECONDS = 5
+
+# 当前 worker 的标识，用于会话登记和主动服务的领导者锁
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+EVENTS_CHANNEL = "events"
+STATE_CHANNEL = "state"
+CONTROL_CHANNEL = "control"
+
+
+class EventBus(ABC):
+    """
+    事件/KV 总线接口：跨 worker 共享询问上下文、任务快照等键值数据，
+    并提供一个所有 worker 都能按顺序读取的事件日志（用于 SSE 扇出）。
+    """
+    @abstractmethod
+    async def publish(self, channel: str, message: dict) -> int:
+        ...
+
+    @abstractmethod
+    async def read(self, after_id: int, timeout: float) -> list:
+        """读取 ID 大于 after_id 的事件，返回 [(ID, 频道, 消息)]；没有新事件时最多等待 timeout 秒。"""
+
+    @abstractmethod
+    async def last_id(self) -> int:
+        ...
+
+    @abstractmethod
+    async def kv_set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    async def kv_get(self, key: str) -> Any:
+        ...
+
+    @abstractmethod
+    async def kv_pop(self, key: str) -> Any:
+        """原子地取出并删除一个键，保证同一份询问上下文只会被一个 worker 取走。"""
+
+    @abstractmethod
+    async def kv_delete(self, key: str):
+        ...
+
+    @abstractmethod
+    async def kv_scan(self, prefix: str) -> dict:
+        ...
+
+    @abstractmethod
+    async def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """锁不存在、已过期或本来就属于 owner 时获得（并续期）锁。"""
+
+
+class InProcessBus(EventBus):
+    """单进程实现：字典 + 内存中的事件环形缓冲区。"""
+    def __init__(self, retain: int = EVENT_LOG_RETAIN):
+        self.kv = {}  # key -> (value, 过期时间或 None)
+        self.events = deque(maxlen=retain)
+        self.next_id = 1
+        self._changed = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    async def publish(self, channel: str, message: dict) -> int:
+        event_id = self.next_id
+        self.next_id += 1
+        self.events.append((event_id, channel, message))
+        async with self._condition():
+            self._condition().notify_all()
+        return event_id
+
+    async def read(self, after_id: int, timeout: float) -> list:
+        async with self._condition():
+            if self.next_id - 1 <= after_id:
+                try:
+                    await asyncio.wait_for(self._condition().wait(), timeout)
+                except asyncio.TimeoutError:
+                    return []
+        return [item for item in self.events if item[0] > after_id]
+
+    async def last_id(self) -> int:
+        return self.next_id - 1
+
+    def _live(self, key: str):
+        item = self.kv.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] < time.time():
+            del self.kv[key]
+            return None
+        return item
+
+    async def kv_set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.kv[key] = (value, time.time() + ttl if ttl else None)
+
+    async def kv_get(self, key: str) -> Any:
+        item = self._live(key)
+        return item[0] if item else None
+
+    async def kv_pop(self, key: str) -> Any:
+        item = self._live(key)
+        self.kv.pop(key, None)
+        return item[0] if item else None
+
+    async def kv_delete(self, key: str):
+        self.kv.pop(key, None)
+
+    async def kv_scan(self, prefix: str) -> dict:
+        return {key: item[0] for key in list(self.kv) if key.startswith(prefix) and (item := self._live(key))}
+
+    async def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        item = self._live(name)
+        if item is not None and item[0] != owner:
+            return False
+        self.kv[name] = (owner, time.time() + ttl)
+        return True
+
+
+class SQLiteBus(EventBus):
+    """
+    基于本机 SQLite 文件的实现，供同一台机器上的多个 worker 进程共享（WAL 模式）。
+    事件按自增 ID 写入事件表，各 worker 轮询读取；阻塞的数据库操作放到线程中执行。
+    """
+    def __init__(self, path: str = EVENT_BUS_PATH, poll_seconds: float = EVENT_BUS_POLL_SECONDS, retain: int = EVENT_LOG_RETAIN):
+        self.path = os.path.abspath(path)
+        self.poll_seconds = poll_seconds
+        self.retain = retain
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程使用，每个线程各开一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def _publish(self, channel: str, message: dict) -> int:
+        with self._connect() as conn:
+            cursor = conn.execute("INSERT INTO events (channel, payload, created_at) VALUES (?, ?, ?)",
+                                  (channel, json.dumps(message, ensure_ascii=False), time.time()))
+            event_id = cursor.lastrowid
+            if event_id % 1000 == 0:
+                conn.execute("DELETE FROM events WHERE id <= ?", (event_id - self.retain,))
+                conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        return event_id
+
+    def _read(self, after_id: int) -> list:
+        rows = self._connect().execute("SELECT id, channel, payload FROM events WHERE id > ? ORDER BY id LIMIT 500", (after_id,)).fetchall()
+        return [(event_id, channel, json.loads(payload)) for event_id, channel, payload in rows]
+
+    def _last_id(self) -> int:
+        return self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def _kv_set(self, key: str, value: Any, ttl: Optional[float]):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(value, ensure_ascii=False), time.time() + ttl if ttl else None))
+
+    def _kv_get(self, key: str) -> Any:
+        row = self._connect().execute("SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _kv_pop(self, key: str) -> Any:
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")  # 读和删在同一个写事务里，避免两个 worker 同时取走
+            row = conn.execute("SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)", (key, time.time())).fetchone()
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        return json.loads(row[0]) if row else None
+
+    def _kv_delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _kv_scan(self, prefix: str) -> dict:
+        rows = self._connect().execute("SELECT key, value FROM kv WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at >= ?)",
+                                       (prefix, prefix + "￿", time.time())).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def _acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        value = json.dumps(owner)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE kv.value = excluded.value OR kv.expires_at < ?",
+                (name, value, now + ttl, now))
+        return cursor.rowcount == 1
+
+    async def publish(self, channel: str, message: dict) -> int:
+        return await asyncio.to_thread(self._publish, channel, message)
+
+    async def read(self, after_id: int, timeout: float) -> list:
+        deadline = time.monotonic() + timeout
+        while True:
+            events = await asyncio.to_thread(self._read, after_id)
+            if events or time.monotonic() >= deadline:
+                return events
+            await asyncio.sleep(self.poll_seconds)
+
+    async def last_id(self) -> int:
+        return await asyncio.to_thread(self._last_id)
+
+    async def kv_set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await asyncio.to_thread(self._kv_set, key, value, ttl)
+
+    async def kv_get(self, key: str) -> Any:
+        return await asyncio.to_thread(self._kv_get, key)
+
+    async def kv_pop(self, key: str) -> Any:
+        return await asyncio.to_thread(self._kv_pop, key)
+
+    async def kv_delete(self, key: str):
+        await asyncio.to_thread(self._kv_delete, key)
+
+    async def kv_scan(self, prefix: str) -> dict:
+        return await asyncio.to_thread(self._kv_scan, prefix)
+
+    async def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        return await asyncio.to_thread(self._acquire_lock, name, owner, ttl)
+
+
+def create_event_bus(backend: str = EVENT_BUS_BACKEND) -> EventBus:
+    if backend == "sqlite":
+        log_message(f"--- Using SQLite event bus at {os.path.abspath(EVENT_BUS_PATH)} (worker {WORKER_ID}) ---")
+        return SQLiteBus()
+    if backend != "inprocess":
+        log_message(f"Unknown EVENT_BUS '{backend}', falling back to in-process bus.")
+    return InProcessBus()
+
+
+class BusBroker:
+    """
+    跨 worker 的事件发布入口，接口与 EventBroker 的发布部分相同。
+    发布的事件先写入总线，每个 worker 的泵任务再把总线事件按顺序交给本进程的 EventBroker 扇出，
+    并沿用总线事件ID作为 SSE ID，因此客户端重连到任何 worker 都能按 Last-Event-ID 补发。
+    """
+    def __init__(self, bus: EventBus, local_broker):
+        self.bus = bus
+        self.local = local_broker
+        self.outbox = None
+        self.last_states = {}  # user_id -> 上一次发布的状态
+        self.listening_sessions = {}  # 其他 worker 登记的会话 -> 用户
+        self.control_handlers = {}
+        self.event_handlers = {}
+        self.tasks = []
+
+    def start(self):
+        if self.tasks:
+            return
+        self.outbox = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._pump()), asyncio.create_task(self._register_listeners())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def publish(self, event: dict, session_id: Optional[str] = None, user_id: Optional[str] = None):
+        # 单个写入任务按顺序写总线，保证同一来源的事件（如任务进度）不乱序，且不阻塞调用方
+        self.outbox.put_nowait((EVENTS_CHANNEL, {"session_id": session_id, "user_id": user_id, "event": event}))
+
+    def publish_state(self, data: dict, user_id: str = LOCAL_USER_ID):
+        # 总线上只发送有变化的状态；各 worker 的 EventBroker 再各自维护快照和增量
+        last_state = self.last_states.get(user_id)
+        if last_state and all(last_state.get(k) == v for k, v in data.items() if k != "timestamp"):
+            return
+        self.last_states[user_id] = dict(data)
+        self.outbox.put_nowait((STATE_CHANNEL, {"user_id": user_id, "state": data}))
+
+    def forget_user(self, user_id: str):
+        """用户不再上报数据时释放本 worker 上它的状态快照。"""
+        self.last_states.pop(user_id, None)
+        self.local.forget_user(user_id)
+
+    def send_control(self, command: dict):
+        self.outbox.put_nowait((CONTROL_CHANNEL, command))
+
+    def on_control(self, command_type: str, handler):
+        self.control_handlers[command_type] = handler
+
+    def on_event(self, event_type: str, handler):
+        """登记一个回调，本 worker 从总线收到该类型的事件时调用（无论有没有订阅者）。"""
+        self.event_handlers[event_type] = handler
+
+    def session_users(self) -> dict:
+        """所有 worker 上有 /listen 连接的会话 -> 其用户（其他 worker 的由它们定期登记）。"""
+        return {**self.listening_sessions, **self.local.session_users()}
+
+    def subscribed_sessions(self, user_id: Optional[str] = None) -> set:
+        """所有 worker 上有 /listen 连接的会话；给出 user_id 时只返回该用户的会话。"""
+        return {session_id for session_id, owner in self.session_users().items() if user_id is None or owner == user_id}
+
+    async def _writer(self):
+        while True:
+            channel, message = await self.outbox.get()
+            try:
+                await self.bus.publish(channel, message)
+            except Exception as e:
+                log_message(f"Event bus publish failed on channel '{channel}': {e}")
+
+    async def _pump(self):
+        after_id = await self.bus.last_id()
+        while True:
+            try:
+                events = await self.bus.read(after_id, timeout=1.0)
+            except Exception as e:
+                log_message(f"Event bus read failed: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            for event_id, channel, message in events:
+                after_id = event_id
+                # 一条格式不对的消息或出错的回调只跳过这一条，不能让 pump 退出（否则本 worker 不再收到任何事件）
+                if channel == EVENTS_CHANNEL:
+                    event = message.get("event")
+                    if not isinstance(event, dict):
+                        log_message(f"Ignoring malformed bus event {event_id}: {message!r}")
+                        continue
+                    self._dispatch(self.event_handlers.get(event.get("type")), event, event_id)
+                    try:
+                        self.local.publish(event, session_id=message.get("session_id"), event_id=event_id, user_id=message.get("user_id"))
+                    except Exception as e:
+                        log_message(f"Failed to publish bus event {event_id} locally: {e}")
+                elif channel == STATE_CHANNEL:
+                    try:
+                        self.local.publish_state(message["state"], event_id=event_id, user_id=message["user_id"])
+                    except Exception as e:
+                        log_message(f"Failed to publish bus state {event_id} locally: {e}")
+                elif channel == CONTROL_CHANNEL:
+                    self._dispatch(self.control_handlers.get(message.get("type")), message, event_id)
+
+    @staticmethod
+    def _dispatch(handler, message: dict, event_id: int):
+        if handler is None:
+            return
+        try:
+            handler(message)
+        except Exception as e:
+            log_message(f"Bus handler for {message.get('type')!r} (event {event_id}) failed: {type(e).__name__}: {e}")
+
+    async def _register_listeners(self):
+        while True:
+            try:
+                await self.bus.kv_set(f"listeners:{WORKER_ID}", self.local.session_users(), ttl=LISTENER_REGISTRY_TTL_SECONDS)
+                registry = await self.bus.kv_scan("listeners:")
+                self.listening_sessions = {session_id: user_id for sessions in registry.values() for session_id, user_id in sessions.items()}
+            except Exception as e:
+                log_message(f"Event bus listener registration failed: {e}")
+            await asyncio.sleep(LISTENER_REGISTRY_REFRESH_SECONDS)
+
+    def stats(self) -> dict:
+        return {"worker_id": WORKER_ID, "backend": type(self.bus).__name__,
+                "outbox": self.outbox.qsize() if self.outbox else 0, "listening_sessions": len(self.listening_sessions)}
+
+
+# 单例：本进程的总线连接，以及经由总线发布事件的代理
+event_bus = create_event_bus()
+bus_broker = BusBroker(event_bus, event_broker)
@@ -0,0 +1,20 @@
+# utils/extraction_workers.py
+# 在进程池中执行的文档解析函数。
+# 这个模块刻意只依赖解析库本身：子进程反序列化任务时会导入它，
+# 不能连带导入键鼠监控、摄像头等重量级模块。
+import docx2txt
+from pypdf import PdfReader
+
+
+def pdf_page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def extract_pdf_pages(path: str, start: int, stop: int) -> list:
+    """提取 [start, stop) 范围内各页的文本。"""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, min(stop, len(reader.pages)))]
+
+
+def extract_docx(path: str) -> str:
+    return docx2txt.process(path) or ""
@@ -1,7 +1,12 @@
 # utils/face_thread.py
 import threading
 import os
-from utils.realtime_detection.realtime_detection import RealtimeCognitiveLoadDetector
+from utils.sensor_events import sensor_notifier
+from utils.synthetic_sensors import SENSOR_MODE, SyntheticCognitiveLoadDetector
+from utils.activity_trace import ReplayCognitiveLoadDetector, trace_replayer
+
+# 置信度变化小于这个值且负荷等级不变时，不通知主动服务
+VISION_NOTIFY_CONFIDENCE_DELTA = 0.05
 
 class CognitiveLoadThread(threading.Thread):
     def __init__(self, model_path="utils/realtime_detection/best_resnet3d.pth"):
@@ -17,11 +22,16 @@ class CognitiveLoadThread(threading.Thread):
             return
 
         print("[信息] 启动实时视觉认知负荷检测线程")
+        # 检测器依赖 torch/cv2/pywin32，只在真正启动检测时导入
+        from utils.realtime_detection.realtime_detection import RealtimeCognitiveLoadDetector
         self.detector = RealtimeCognitiveLoadDetector(self.model_path)
 
-        # 使用生成器版本
-        for result in self.detector.run_detection():
-            self.current_result = result  # 你可以把它保存进共享状态或发信号出去
+        # 使用生成器版本；后台线程不绘制、不打开预览窗口
+        for result in self.detector.run_detection(headless=True, stop_event=self._stop_event):
+            previous, self.current_result = self.current_result, result
+            if (previous is None or previous["cognitive_load"] != result["cognitive_load"]
+                    or abs(previous["confidence"] - result["confidence"]) >= VISION_NOTIFY_CONFIDENCE_DELTA):
+                sensor_notifier.notify("vision")
             print(f"[视觉] 当前认知负荷状态：{result['cognitive_load']} @ {result['timestamp']}")
             if hasattr(self, "_stop_event") and self._stop_event.is_set():
                 break
@@ -33,4 +43,9 @@ class CognitiveLoadThread(threading.Thread):
     def stop(self):
         self._stop_event.set()
 
-visual_detector = CognitiveLoadThread()
\ No newline at end of file
+if SENSOR_MODE == "synthetic":
+    visual_detector = SyntheticCognitiveLoadDetector()
+elif SENSOR_MODE == "replay":
+    visual_detector = ReplayCognitiveLoadDetector(trace_replayer)
+else:
+    visual_detector = CognitiveLoadThread()
\ No newline at end of file
@@ -5,9 +5,14 @@ import json
 import random
 import logging
 import base64
-from PIL import ImageGrab
+from PIL import Image, ImageGrab
 from utils.activity_monitor import monitor
 from utils.face_thread import visual_detector
+from utils.image_ingest import normalize_pil_image, estimate_image_tokens, IMAGE_FORMAT
+from utils.synthetic_sensors import SENSOR_MODE
+
+# take_screenshot 返回的图片格式
+SCREENSHOT_MIME = f"image/{IMAGE_FORMAT.lower()}"
 
 def setup_logging():
     os.makedirs('memory', exist_ok=True)  # 自动创建memory目录
@@ -46,19 +51,25 @@ def load_user_habits() -> dict:
     return {}
 
 def take_screenshot() -> str:
-    """截取当前桌面并返回Base64编码的字符串（去掉右侧1000px）。"""
+    """
+    截取当前桌面并返回Base64编码的字符串（去掉右侧1000px）。
+    发送给视觉模型前会缩小并重新编码（格式见 SCREENSHOT_MIME），原尺寸 PNG 仍保存到本地。
+    """
     logging.info("[截图] 正在截取当前桌面...")
     try:
         path = "desktop_screenshot.png"
-        screenshot = ImageGrab.grab()
+        # 合成数据或重放模式下（没有显示器）用一张空白桌面代替
+        screenshot = Image.new("RGB", (2920, 1080), (240, 240, 240)) if SENSOR_MODE in ("synthetic", "replay") else ImageGrab.grab()
         width, height = screenshot.size
         # 裁剪：保留左侧 width-1000 区域
         crop_width = max(width - 1000, 1)
         cropped = screenshot.crop((0, 0, crop_width, height))
         cropped.save(path)
         logging.info(f"[截图] 截图已保存到 {path}")
-        with open(path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        encoded, _, new_size = normalize_pil_image(cropped)
+        logging.info(f"[截图] 已缩小为 {new_size[0]}x{new_size[1]}，{len(encoded)} 字节，"
+                     f"估算 token {estimate_image_tokens(*cropped.size)} -> {estimate_image_tokens(*new_size)}")
+        return base64.b64encode(encoded).decode('utf-8')
     except Exception as e:
         logging.error(f"错误：无法截图 - {e}")
         return ""
@@ -0,0 +1,139 @@
+# utils/image_ingest.py
+import io
+import os
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+from utils.attachment_store import attachment_store
+
+# 发送给视觉模型前，图片最长边不超过该值（像素）
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", 1568))
+# 重新编码的格式与质量："JPEG" 或 "WEBP"
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 82))
+MAX_DEDUPE_ENTRIES = 256
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    按 OpenAI 高细节模式的计费规则估算图片 token：
+    先缩放到 2048x2048 以内，再把短边缩到 768，按 512x512 的图块计数。
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def normalize_pil_image(image: Image.Image):
+    """
+    缩小并重新编码一张图片。返回 (编码后的字节, MIME 类型, (宽, 高))。
+    带透明通道的图片（如截图）先合成到白色背景上再编码。
+    """
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    if max(image.size) > IMAGE_MAX_DIMENSION:
+        image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+    buffer = io.BytesIO()
+    if IMAGE_FORMAT == "WEBP":
+        image.save(buffer, format="WEBP", quality=IMAGE_QUALITY, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue(), _MIME_TYPES[IMAGE_FORMAT], image.size
+
+
+class ImageIngestor:
+    """
+    /chat 的图片接入阶段：缩小、重新编码、去重，只把处理后的图片写入附件存储。
+    去重分两级：原始字节哈希完全相同，或解码后的像素哈希相同（同一张图被不同编码器保存）。
+    统计中字节和 token 只累计新写入的图片；去重命中不写入新数据，单独计入 deduped / deduped_bytes（未写入的原始字节）。
+    """
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.known = OrderedDict()  # 原始字节/像素哈希 -> 已处理的附件引用
+        self.totals = {"images": 0, "deduped": 0, "deduped_bytes": 0, "bytes_before": 0, "bytes_after": 0,
+                       "tokens_before": 0, "tokens_after": 0}
+
+    def _remember(self, keys, ref: dict):
+        with self.lock:
+            for key in keys:
+                self.known[key] = ref
+                self.known.move_to_end(key)
+            while len(self.known) > MAX_DEDUPE_ENTRIES:
+                self.known.popitem(last=False)
+
+    def _lookup(self, key: str):
+        with self.lock:
+            ref = self.known.get(key)
+            if ref is not None and self.store.exists(ref["ref"]):
+                self.known.move_to_end(key)
+                return ref
+            return None
+
+    def ingest(self, data: bytes, name: str = "") -> dict:
+        """
+        处理一张上传的图片并返回附件引用。引用中的 "ingest" 字段记录本次的字节和 token 节省。
+        无法识别的图片原样保存。
+        """
+        byte_key = "bytes:" + hashlib.sha256(data).hexdigest()
+        ref = self._lookup(byte_key)
+        deduped = ref is not None
+        if ref is None:
+            try:
+                image = Image.open(io.BytesIO(data))
+                image.load()
+            except Exception:
+                return self.store.put_bytes(data, name, "image/png")
+            pixel_key = "pixels:" + hashlib.sha256(image.tobytes()).hexdigest() + f":{image.mode}:{image.size}"
+            ref = self._lookup(pixel_key)
+            deduped = ref is not None
+            if ref is None:
+                original_size = image.size
+                encoded, mime, new_size = normalize_pil_image(image)
+                if len(encoded) >= len(data) and new_size == original_size:
+                    encoded, mime = data, Image.MIME.get(image.format, "image/png")  # 已经足够小，保留原图
+                ref = self.store.put_bytes(encoded, name, mime)
+                ref["ingest"] = {
+                    "original_bytes": len(data),
+                    "bytes": len(encoded),
+                    "original_size": list(original_size),
+                    "size": list(new_size),
+                    "tokens_before": estimate_image_tokens(*original_size),
+                    "tokens_after": estimate_image_tokens(*new_size),
+                }
+            self._remember([byte_key, pixel_key], ref)
+
+        ref = dict(ref, ingest=dict(ref["ingest"], deduped=deduped)) if "ingest" in ref else dict(ref)
+        info = ref.get("ingest")
+        if info:
+            with self.lock:
+                self.totals["images"] += 1
+                if deduped:
+                    self.totals["deduped"] += 1
+                    self.totals["deduped_bytes"] += len(data)
+                    return ref
+                self.totals["bytes_before"] += info["original_bytes"]
+                self.totals["bytes_after"] += info["bytes"]
+                self.totals["tokens_before"] += info["tokens_before"]
+                self.totals["tokens_after"] += info["tokens_after"]
+        return ref
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.totals)
+
+
+# 单例：全局共享一个图片接入器（共享去重表）
+image_ingestor = ImageIngestor(attachment_store)
@@ -0,0 +1,79 @@
+# utils/input_timeline.py
+import os
+import time
+from array import array
+import numpy as np
+
+# 每种输入（键盘、鼠标）最多保留这么多个事件的时间戳（每个 8 字节）；按每秒 10 次计约 1.8 小时
+INPUT_TIMELINE_CAPACITY = int(os.getenv("INPUT_TIMELINE_CAPACITY", 65536))
+# 相邻两次输入间隔至少这么久算作一次停顿
+INPUT_PAUSE_SECONDS = 2.0
+
+
+class InputTimeline:
+    """
+    一种输入事件的时间线：array('d') 环形缓冲区，按 time.monotonic() 记录每个事件的时刻，内存固定。
+    只允许一个线程调用 record()（对应的 pynput 监听线程），写入不加锁；
+    查询可以在任意线程进行，先取一份一致的快照再用 NumPy 计算任意窗口的频率、空闲时间和间隔统计。
+    """
+    def __init__(self, capacity: int = INPUT_TIMELINE_CAPACITY):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.total = 0  # 写入过的事件总数；下一个事件写到 total % capacity
+
+    def record(self, at: float = None):
+        self.times[self.total % self.capacity] = time.monotonic() if at is None else at
+        self.total += 1  # 先写时间戳再增加计数，读取方看到的计数范围内的数据都已写完
+
+    def snapshot(self) -> np.ndarray:
+        """按时间顺序返回仍在缓冲区中的所有事件时刻。"""
+        end = self.total
+        buffer = np.frombuffer(self.times, dtype=np.float64).copy()
+        # 复制期间写入方可能已经覆盖了最旧的几个位置，只保留复制结束时仍然有效的部分
+        start = max(self.total - self.capacity, 0)
+        return buffer[np.arange(start, max(start, end)) % self.capacity]
+
+    def events(self, window: float, now: float = None) -> np.ndarray:
+        """最近 window 秒内的事件时刻。"""
+        now = time.monotonic() if now is None else now
+        times = self.snapshot()
+        return times[np.searchsorted(times, now - window, side="right"):np.searchsorted(times, now, side="right")]
+
+    def rate(self, window: float, now: float = None) -> float:
+        """最近 window 秒内的平均频率（次/秒）。"""
+        return len(self.events(window, now)) / window
+
+    def idle_seconds(self, now: float = None) -> float:
+        """距最近一次事件的秒数；还没有任何事件时为 None。"""
+        if self.total == 0:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(now - self.times[(self.total - 1) % self.capacity], 0.0)
+
+    def histogram(self, window: float, bin_seconds: float, now: float = None) -> np.ndarray:
+        """把最近 window 秒按 bin_seconds 分段，返回每段的事件数（从旧到新）。"""
+        now = time.monotonic() if now is None else now
+        bins = int(np.ceil(window / bin_seconds))
+        offsets = ((self.events(window, now) - (now - window)) // bin_seconds).astype(np.int64)
+        return np.bincount(np.minimum(offsets, bins - 1), minlength=bins)
+
+    def interval_stats(self, window: float, now: float = None, pause_seconds: float = INPUT_PAUSE_SECONDS) -> dict:
+        """
+        最近 window 秒内相邻事件的间隔统计：均值、中位数、90 分位、停顿次数和最长停顿，
+        以及突发度 (σ-μ)/(σ+μ)（-1 为完全均匀，0 接近泊松过程，越接近 1 越集中爆发）。
+        """
+        times = self.events(window, now)
+        gaps = np.diff(times)
+        if len(gaps) == 0:
+            return {"events": len(times), "mean_interval_ms": None, "median_interval_ms": None, "p90_interval_ms": None,
+                    "burstiness": None, "pauses": 0, "longest_pause_seconds": None}
+        mean, std = gaps.mean(), gaps.std()
+        return {
+            "events": len(times),
+            "mean_interval_ms": round(float(mean) * 1000, 1),
+            "median_interval_ms": round(float(np.median(gaps)) * 1000, 1),
+            "p90_interval_ms": round(float(np.percentile(gaps, 90)) * 1000, 1),
+            "burstiness": round(float((std - mean) / (std + mean)), 3) if std + mean > 0 else 0.0,
+            "pauses": int((gaps >= pause_seconds).sum()),
+            "longest_pause_seconds": round(float(gaps.max()), 2),
+        }
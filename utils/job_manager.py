@@ -0,0 +1,253 @@
+# utils/job_manager.py
+import os
+import time
+import uuid
+import asyncio
+import traceback
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Optional
+from utils.helpers import log_message
+from utils.event_bus import bus_broker
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 4))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", 300))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", 100))
+# GET /jobs/<job_id>?wait= 长轮询的最长等待时间
+MAX_JOB_WAIT_SECONDS = 30
+# 已结束的任务保留多少个供轮询查询
+MAX_FINISHED_JOBS = 500
+# 记住其他 worker 上任务的最新快照（来自总线上的 job_update 事件）
+MAX_REMOTE_JOB_SNAPSHOTS = 1000
+
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled", "timeout"}
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    """一次异步执行的 Agent 对话轮次或记忆总结。"""
+    def __init__(self, kind: str, session_id: Optional[str], run: Callable[["Job"], Awaitable[Any]], timeout: float, serialize: bool):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.session_id = session_id
+        self.run = run
+        self.timeout = timeout
+        self.serialize = serialize  # 同一会话的对话轮次需要串行执行
+        self.status = "queued"
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+        self.cancel_requested = False
+        self.done = asyncio.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    异步任务子系统：提交后立即返回任务ID，由固定数量的 worker 协程执行，
+    每个任务有超时、可取消；状态和进度通过事件流推送给对应会话，也可轮询查询。
+    同一会话需要串行的任务在进入 worker 队列之前排队：每个会话同时只有一个任务占用队列和 worker，
+    其余的在该会话自己的等待队列中，不会占着 worker 等待。
+    任务事件经由事件总线发布，因此在其他 worker 上也能查询和取消本 worker 的任务。
+    """
+    def __init__(self, broker, concurrency: int = JOB_CONCURRENCY, timeout: float = JOB_TIMEOUT_SECONDS,
+                 max_queued: int = MAX_QUEUED_JOBS):
+        self.broker = broker
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.queue = None
+        self.max_queued = max_queued
+        self.jobs = OrderedDict()
+        self.session_backlogs = {}  # 会话ID -> 等待前一个任务结束的任务；有条目表示该会话有任务在队列中或正在执行
+        self.workers = []
+        self.remote_jobs = OrderedDict()
+        broker.on_event("job_update", self._remember_remote)
+        broker.on_control("cancel_job", lambda command: self._cancel_local(command["job_id"]))
+
+    def start(self):
+        """在事件循环中启动 worker（应用启动时调用一次）。"""
+        if self.workers:
+            return
+        self.queue = asyncio.Queue()  # 排队上限由 submit 统一检查（包括各会话的等待队列）
+        self.workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        log_message(f"--- Job manager started with {self.concurrency} workers ---")
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, kind: str, session_id: Optional[str], run: Callable[[Job], Awaitable[Any]],
+               timeout: Optional[float] = None, serialize: bool = True) -> Job:
+        job = Job(kind, session_id, run, timeout or self.timeout, serialize)
+        if self._queued_count() >= self.max_queued:
+            raise JobQueueFull(f"Too many queued jobs ({self.max_queued}).")
+        if serialize and session_id:
+            backlog = self.session_backlogs.get(session_id)
+            if backlog is not None:
+                backlog.append(job)  # 前一个任务结束后才进入 worker 队列
+            else:
+                self.session_backlogs[session_id] = deque()
+                self.queue.put_nowait(job)
+        else:
+            self.queue.put_nowait(job)
+        self.jobs[job.id] = job
+        self._trim_finished()
+        self._publish(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def snapshot(self, job_id: str) -> Optional[dict]:
+        """任务的当前状态：本 worker 的任务直接读取，其他 worker 的任务用总线上最近的快照。"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.remote_jobs.get(job_id)
+
+    def _remember_remote(self, event: dict):
+        job_id = event["job_id"]
+        if job_id in self.jobs:
+            return
+        self.remote_jobs[job_id] = {k: v for k, v in event.items() if k != "type"}
+        self.remote_jobs.move_to_end(job_id)
+        while len(self.remote_jobs) > MAX_REMOTE_JOB_SNAPSHOTS:
+            self.remote_jobs.popitem(last=False)
+
+    def cancel(self, job_id: str) -> bool:
+        if job_id not in self.jobs:
+            remote = self.remote_jobs.get(job_id)
+            if remote is None or remote["status"] in TERMINAL_STATUSES:
+                return False
+            self.broker.send_control({"type": "cancel_job", "job_id": job_id})  # 由持有该任务的 worker 取消
+            return True
+        return self._cancel_local(job_id)
+
+    def _cancel_local(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.status in TERMINAL_STATUSES:
+            return False
+        job.cancel_requested = True
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            self._finish(job, "cancelled")  # 还在排队，worker 取到时会跳过
+        return True
+
+    def report_progress(self, job: Job, progress: str):
+        job.progress = progress
+        self._publish(job)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """等待任务结束，最多 timeout 秒，返回任务快照。"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return job.to_dict()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            snapshot = self.remote_jobs.get(job_id)
+            if snapshot is None or snapshot["status"] in TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(0.5)
+        return self.remote_jobs.get(job_id)
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.status == "queued":
+                    await self._execute(job)
+            finally:
+                if job.serialize and job.session_id:
+                    self._release_session(job.session_id)
+                self.queue.task_done()
+
+    def _release_session(self, session_id: str):
+        """会话的当前任务结束：把它等待队列中下一个未取消的任务放进 worker 队列；没有时删除该会话的条目。"""
+        backlog = self.session_backlogs.get(session_id)
+        while backlog:
+            job = backlog.popleft()
+            if job.status == "queued":
+                self.queue.put_nowait(job)
+                return
+        self.session_backlogs.pop(session_id, None)
+
+    def _queued_count(self) -> int:
+        return self.queue.qsize() + sum(len(backlog) for backlog in self.session_backlogs.values())
+
+    async def _execute(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        self._publish(job)
+        job.task = asyncio.create_task(job.run(job))
+        try:
+            job.result = await asyncio.wait_for(job.task, job.timeout)
+            self._finish(job, "succeeded")
+        except asyncio.CancelledError:
+            self._finish(job, "cancelled")
+            if not job.cancel_requested:
+                raise  # worker 自身被取消（应用关闭）
+        except asyncio.TimeoutError:
+            self._finish(job, "timeout", f"Job exceeded {job.timeout:g}s timeout.")
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(job, "failed", f"An error occurred: {e}")
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        job.task = None
+        log_message(f"Job {job.id} ({job.kind}, session {job.session_id}) finished: {status}"
+                    + (f" after {job.finished_at - job.started_at:.1f}s" if job.started_at else ""))
+        self._publish(job)
+        job.done.set()
+
+    def _publish(self, job: Job):
+        if job.session_id:
+            self.broker.publish({"type": "job_update", **job.to_dict()}, session_id=job.session_id)
+
+    def _trim_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in TERMINAL_STATUSES]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def stats(self) -> dict:
+        by_status = {}
+        for job in self.jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            "workers": len(self.workers),
+            "queued": self._queued_count() if self.queue else 0,
+            "busy_sessions": len(self.session_backlogs),
+            "jobs_by_status": by_status,
+        }
+
+
+# 单例：web_app 的所有路由共享同一个任务管理器，任务事件经由事件总线推送
+job_manager = JobManager(bus_broker)
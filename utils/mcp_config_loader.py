@@ -18,7 +18,7 @@ def load_mcp_servers_config() -> Dict[str, Any]:
     try:
         # Get the directory of the current script
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        mcp_config_path = os.path.join(current_dir, "..", "config", "mcpServers.json")
+        mcp_config_path = os.getenv("MCP_CONFIG_PATH") or os.path.join(current_dir, "..", "config", "mcpServers.json")
 
         if os.path.exists(mcp_config_path):
             with open(mcp_config_path, 'r', encoding='utf-8') as f:
@@ -0,0 +1,144 @@
+# utils/pending_requests.py
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict, Counter
+from datetime import datetime
+from typing import Optional
+from utils.helpers import log_message
+from utils.event_bus import event_bus
+
+# 询问的有效期，与前端自动关闭询问的时间一致
+PENDING_REQUEST_TTL_SECONDS = float(os.getenv("PENDING_REQUEST_TTL_SECONDS", 20))
+MAX_PENDING_REQUESTS = int(os.getenv("MAX_PENDING_REQUESTS", 64))
+MAX_PENDING_REQUEST_BYTES = int(os.getenv("MAX_PENDING_REQUEST_BYTES", 2 * 1024 * 1024))
+# 总线上的条目比有效期多保留一段时间，由清理任务取出并记为“忽略”；清理任务停掉时总线也会最终删除它们
+PENDING_REQUEST_GRACE_SECONDS = 60
+INQUIRY_FEEDBACK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "memory", "inquiry_feedback.jsonl")
+
+
+def pending_request_key(request_id: str) -> str:
+    """询问上下文在事件总线上的键。"""
+    return f"pending_request:{request_id}"
+
+
+class PendingRequestCache:
+    """
+    主动询问上下文的缓存：每个条目有与询问相同的有效期，总条目数和总字节数有硬上限。
+    条目存放在事件总线上（任何 worker 都能接受询问），创建条目的 worker 在本地记录大小用于内存统计。
+    每个询问最终只有一种结果（接受 / 拒绝 / 忽略 / 被挤出），都写入反馈文件，供以后调整主动服务。
+    """
+    def __init__(self, bus, ttl: float = PENDING_REQUEST_TTL_SECONDS, max_entries: int = MAX_PENDING_REQUESTS,
+                 max_bytes: int = MAX_PENDING_REQUEST_BYTES, feedback_file: str = INQUIRY_FEEDBACK_FILE):
+        self.bus = bus
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.feedback_file = os.path.abspath(feedback_file)
+        self.entries = OrderedDict()  # request_id -> (过期时间, 字节数)，按创建顺序
+        self.total_bytes = 0
+        self.peak_bytes = 0
+        self.outcomes = Counter()
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """登记一个回调 listener(request_id, outcome)，每个询问得出结果时调用一次。"""
+        self.listeners.append(listener)
+
+    async def put(self, request_id: str, context: dict) -> float:
+        """缓存一个询问上下文，返回它的有效期（秒）。超出上限时先挤出最旧的条目。"""
+        size = len(json.dumps(context, ensure_ascii=False).encode("utf-8"))
+        while self.entries and (len(self.entries) >= self.max_entries or self.total_bytes + size > self.max_bytes):
+            oldest_id = next(iter(self.entries))
+            await self._expire(oldest_id, "evicted")
+        now = time.time()
+        await self.bus.kv_set(pending_request_key(request_id),
+                              {"context": context, "created_at": now, "expires_at": now + self.ttl, "size": size},
+                              ttl=self.ttl + PENDING_REQUEST_GRACE_SECONDS)
+        self.entries[request_id] = (now + self.ttl, size)
+        self.total_bytes += size
+        self.peak_bytes = max(self.peak_bytes, self.total_bytes)
+        self.outcomes["issued"] += 1
+        return self.ttl
+
+    async def pop(self, request_id: str, outcome: str = "accepted") -> Optional[dict]:
+        """
+        取走一个询问上下文并记录结果（"accepted" 或 "declined"）。
+        不存在、已被取走或已过期时返回 None；过期的条目顺带记为“忽略”。
+        """
+        entry = await self.bus.kv_pop(pending_request_key(request_id))
+        self._forget(request_id)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.time():
+            await self._record(request_id, "ignored", entry)
+            return None
+        await self._record(request_id, outcome, entry)
+        return entry["context"]
+
+    async def sweep(self):
+        """取出本 worker 创建的、已过期而无人响应的条目，记为“忽略”。"""
+        now = time.time()
+        expired = [request_id for request_id, (expires_at, _) in self.entries.items() if expires_at < now]
+        for request_id in expired:
+            await self._expire(request_id, "ignored")
+
+    async def _expire(self, request_id: str, outcome: str):
+        entry = await self.bus.kv_pop(pending_request_key(request_id))
+        self._forget(request_id)
+        if entry is not None:  # 已被某个 worker 接受或拒绝时，结果已经由那边记录
+            await self._record(request_id, outcome, entry)
+
+    def _forget(self, request_id: str):
+        local = self.entries.pop(request_id, None)
+        if local is not None:
+            self.total_bytes -= local[1]
+
+    async def _record(self, request_id: str, outcome: str, entry: dict):
+        self.outcomes[outcome] += 1
+        context = entry.get("context") or {}
+        record = {
+            "timestamp": datetime.now().isoformat(),
+            "request_id": request_id,
+            "outcome": outcome,
+            "response_seconds": round(time.time() - entry["created_at"], 2),
+            "activity_summary": context.get("activity_summary"),
+        }
+        log_message(f"Inquiry {request_id} {outcome} after {record['response_seconds']}s.")
+        for listener in self.listeners:
+            listener(request_id, outcome)
+        try:
+            await asyncio.to_thread(self._append_feedback, record)
+        except OSError as e:
+            log_message(f"Failed to record inquiry feedback: {e}")
+
+    def _append_feedback(self, record: dict):
+        os.makedirs(os.path.dirname(self.feedback_file), exist_ok=True)
+        with open(self.feedback_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "peak_bytes": self.peak_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "outcomes": dict(self.outcomes),
+        }
+
+
+async def run_sweeper(cache: PendingRequestCache, interval: float = 1.0):
+    """后台定期清理过期的询问。"""
+    while True:
+        try:
+            await cache.sweep()
+        except Exception as e:
+            log_message(f"Pending request sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+
+# 单例：主动服务写入、/request_assistance 和 /decline_assistance 取出
+pending_requests = PendingRequestCache(event_bus)
@@ -0,0 +1,328 @@
+# utils/proactive_replay.py
+"""
+主动服务评分模型的离线回放和参数扫描：读取录制的活动数据，按与线上相同的语义
+（每 SAMPLE_SLOT_SECONDS 一个槽、空槽零阶保持、满窗口后每条读数重新评分、询问后冷却）
+一次性评估成千上万组权重/阈值组合，报告询问频率、首次询问时间，以及与标注的求助时刻的吻合程度。
+只依赖 NumPy，可在没有摄像头和显示器的 Linux 上运行：
+
+    python -m utils.proactive_replay traces/*.jsonl
+    python -m utils.proactive_replay memory/traces          # trace_recorder 录制的 NPZ 分块目录
+    python -m utils.proactive_replay traces/*.jsonl --threshold 0:30:31 --stuck-bonus 0.5:2.5:9 --window-switch 0.2,0.4,0.6 --top 10
+
+录制数据为 JSONL，每行一条读数，字段与 /telemetry 上报的读数相同：
+    {"t": 1718000000.0, "keyboard_freq_hz": 1.2, "mouse_freq_hz": 0.4, "window_titles": [...], "cognitive_load": "High Load", "confidence": 0.8}
+除 t 外的字段都可以省略，省略时沿用上一条读数的值；{"t": ..., "help": true} 表示用户在该时刻主动求助（标注）。
+也可以直接读取 trace_recorder 录制的 NPZ 分块（目录或单个文件），标注取自录制的事件（默认为手动求助和接受的询问）。
+同一个槽内收到多条读数时，线上会在每条之后都评分，这里只按槽内最后一条评分。
+"""
+import sys
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+from agents.proactive_scoring import (SAMPLE_SLOT_SECONDS, PROACTIVE_WEIGHTS, PROACTIVE_THRESHOLD,
+                                      COGNITIVE_LOAD_RANGES, signal_scores)
+from utils.activity_trace import read_trace
+
+# 用户的第一条读数缺少的字段用这些值补齐
+DEFAULT_SAMPLE = {
+    "keyboard_freq_hz": 0.0,
+    "mouse_freq_hz": 0.0,
+    "window_titles": [],
+    "cognitive_load": "waiting...",
+    "confidence": 0.0,
+}
+# NPZ 录制数据中作为求助标注的事件类型
+DEFAULT_HELP_EVENTS = ("manual_request", "accepted")
+# 参数组合的顺序，也是权重矩阵的列顺序
+SWEEP_PARAMETERS = ("cognitive_load", "stuck_bonus", "flow_signal", "window_switch", "threshold")
+# 每个分块内 行数 × 参数组合数 的上限，控制评分矩阵的内存
+SWEEP_BLOCK_CELLS = 4_000_000
+# 字节 -> 其中为 1 的位数，用于对打包后的窗口标题集合求对称差的大小
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int32)
+
+
+class ReplayTrace:
+    """
+    一段录制数据按评分槽重采样后的数组表示，每行对应线上写入建模器历史的一条读数。
+    scored 标记线上会在该行之后评分的行（真实读数；补齐空槽的行只写入历史，不单独评分）。
+    """
+    def __init__(self, name: str, times, keyboard, mouse, cognitive_load, confidence, titles, scored, help_times):
+        self.name = name
+        self.times = times
+        self.keyboard = keyboard
+        self.mouse = mouse
+        self.load_scores = _load_scores(cognitive_load, confidence)
+        self.titles = titles  # (行数, 标题字节数) 的 uint8 位图，每一位表示一个窗口标题是否打开
+        self.scored = scored
+        self.help_times = help_times
+
+    @property
+    def duration_seconds(self) -> float:
+        return float(self.times[-1] - self.times[0]) + SAMPLE_SLOT_SECONDS if len(self.times) else 0.0
+
+    def window_features(self, history_limit: int) -> dict:
+        """每一行作为最新读数时滑动窗口的指标；窗口未满的行为 NaN。"""
+        rows = len(self.times)
+        features = {name: np.full(rows, np.nan) for name in ("avg_keyboard_hz", "avg_mouse_hz", "changed_windows_count")}
+        if rows < history_limit:
+            return features
+        windows = rows - history_limit + 1
+        for name, values in (("avg_keyboard_hz", self.keyboard), ("avg_mouse_hz", self.mouse)):
+            # 每个窗口按时间顺序重新累加（与线上 UserStateModeler 相同），不用整段的前缀和相减，长录制也不会累积误差
+            sums = values[:windows].astype(np.float64)
+            for offset in range(1, history_limit):
+                sums += values[offset:offset + windows]
+            features[name][history_limit - 1:] = sums / history_limit
+        changed = np.bitwise_xor(self.titles[history_limit - 1:], self.titles[:rows - history_limit + 1])
+        features["changed_windows_count"][history_limit - 1:] = _POPCOUNT[changed].sum(axis=1)
+        return features
+
+
+def _load_scores(cognitive_load: np.ndarray, confidence: np.ndarray) -> np.ndarray:
+    """cognitive_load_score 的向量化版本：各等级的区间内按置信度取值后向下取整。"""
+    start = np.zeros(len(cognitive_load))
+    span = np.zeros(len(cognitive_load))
+    for level, (level_start, level_span) in COGNITIVE_LOAD_RANGES.items():
+        mask = cognitive_load == level
+        start[mask], span[mask] = level_start, level_span
+    return np.floor(start + confidence * span)
+
+
+def trace_from_samples(name: str, samples: list, help_times=(), history_limit: int = 6) -> ReplayTrace:
+    """
+    把按时间排序、字段齐全的读数按 proactive_service.log_slots 的规则写成历史行：
+    同一槽只保留最后一条，跨过的空槽用上一条读数补齐，最多补 history_limit 条。
+    """
+    t = np.array([sample["t"] for sample in samples], dtype=np.float64)
+    slots = np.floor(t / SAMPLE_SLOT_SECONDS).astype(np.int64)
+    kept = np.flatnonzero(np.append(slots[1:] != slots[:-1], True))
+    kept_slots = slots[kept]
+    gaps = np.diff(kept_slots, prepend=kept_slots[:1] - 1)
+    repeats = np.minimum(gaps, history_limit + 1)
+
+    # 每个保留的读数展开成 repeats 行：前面几行是补齐的空槽（取上一条保留的读数），最后一行是它自己
+    group = np.repeat(np.arange(len(kept)), repeats)
+    ends = np.cumsum(repeats) - 1
+    slots_before_end = np.repeat(ends, repeats) - np.arange(len(group))
+    scored = slots_before_end == 0
+    source = kept[np.where(scored, group, group - 1)]
+    times = np.where(scored, t[kept][group], (kept_slots[group] - slots_before_end) * float(SAMPLE_SLOT_SECONDS))
+
+    vocabulary = {}
+    title_rows = [[vocabulary.setdefault(title, len(vocabulary)) for title in samples[i]["window_titles"]] for i in kept]
+    titles = np.zeros((len(kept), max(len(vocabulary), 1)), dtype=bool)
+    for row, indices in enumerate(title_rows):
+        titles[row, indices] = True
+
+    return ReplayTrace(
+        name,
+        times=times,
+        keyboard=np.array([samples[i]["keyboard_freq_hz"] for i in source], dtype=np.float64),
+        mouse=np.array([samples[i]["mouse_freq_hz"] for i in source], dtype=np.float64),
+        cognitive_load=np.array([str(samples[i]["cognitive_load"]) for i in source]),
+        confidence=np.array([samples[i]["confidence"] for i in source], dtype=np.float64),
+        titles=np.packbits(titles, axis=1)[np.searchsorted(kept, source)],
+        scored=scored,
+        help_times=np.sort(np.asarray(help_times, dtype=np.float64)),
+    )
+
+
+def load_jsonl_trace(path: str, history_limit: int = 6) -> ReplayTrace:
+    """读取一个 JSONL 录制文件，省略的字段沿用上一条读数。"""
+    records, help_times = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("help"):
+                help_times.append(float(record["t"]))
+            else:
+                records.append(record)
+    records.sort(key=lambda record: float(record["t"]))
+    samples, previous = [], DEFAULT_SAMPLE
+    for record in records:
+        previous = {**previous, **record, "t": float(record["t"])}
+        samples.append(previous)
+    if not samples:
+        raise ValueError(f"{path} contains no samples.")
+    return trace_from_samples(path, samples, help_times, history_limit)
+
+
+def load_trace(path: str, history_limit: int = 6, help_events=DEFAULT_HELP_EVENTS) -> ReplayTrace:
+    """读取一段录制数据：.jsonl 文件，或 NPZ 分块（目录或单个 .npz 文件）。"""
+    if path.endswith(".jsonl"):
+        return load_jsonl_trace(path, history_limit)
+    samples, events = read_trace(path)
+    if not samples:
+        raise ValueError(f"{path} contains no samples.")
+    return trace_from_samples(path, samples, [t for t, kind, _ in events if kind in help_events], history_limit)
+
+
+def parameter_grid(values: dict) -> dict:
+    """values 为 参数名 -> 取值列表，返回所有组合展开后的 参数名 -> 数组。"""
+    combos = np.array(list(itertools.product(*(values[name] for name in SWEEP_PARAMETERS))), dtype=np.float64)
+    return {name: combos[:, i] for i, name in enumerate(SWEEP_PARAMETERS)}
+
+
+def replay_trace(trace: ReplayTrace, grid: dict, history_limit: int = 6, cooldown_samples: int = None,
+                 match_window: float = 60.0) -> dict:
+    """
+    在一段录制数据上同时评估 grid 中的所有参数组合，返回各组合的计数（数组，按组合对齐）。
+    分项得分与参数无关，只算一次；总分 = 分项矩阵 × 权重矩阵，按行分块计算。
+    冷却依赖上一次询问的位置，只能按时间顺序推进，但每一步都同时处理所有组合。
+    """
+    cooldown = history_limit if cooldown_samples is None else cooldown_samples
+    combos = len(grid["threshold"])
+    features = trace.window_features(history_limit)
+    rows = np.flatnonzero(trace.scored & ~np.isnan(features["changed_windows_count"]))
+    scores = signal_scores(trace.load_scores[rows], features["avg_keyboard_hz"][rows],
+                           features["avg_mouse_hz"][rows], features["changed_windows_count"][rows])
+    # total_score 的矩阵形式，列顺序与 weights 的行顺序一致（心流信号为减分项）
+    signals = np.column_stack([scores["cognitive_load"], scores["stuck_signal"], scores["window_switch"], -scores["flow_signal"]])
+    weights = np.vstack([grid["cognitive_load"], grid["stuck_bonus"], grid["window_switch"], grid["flow_signal"]])
+
+    # 每个评分行对应的标注：与前后 match_window 秒内最近的一次求助对应，没有则为 -1
+    times = trace.times[rows]
+    labels = trace.help_times
+    nearest = np.full(len(rows), -1)
+    if len(labels):
+        right = np.clip(np.searchsorted(labels, times), 0, len(labels) - 1)
+        left = np.clip(right - 1, 0, len(labels) - 1)
+        closest = np.where(np.abs(labels[left] - times) <= np.abs(labels[right] - times), left, right)
+        nearest = np.where(np.abs(labels[closest] - times) <= match_window, closest, -1)
+
+    result = {
+        "inquiries": np.zeros(combos, dtype=np.int64),
+        "hours": np.full(combos, trace.duration_seconds / 3600),
+        "first_trigger_seconds": np.full(combos, np.nan),
+        "labels": np.full(combos, len(labels)),
+        "matched_inquiries": np.zeros(combos, dtype=np.int64),
+        "labels_hit": np.zeros(combos, dtype=np.int64),
+        "lead_seconds_sum": np.zeros(combos),
+    }
+    last_inquiry = np.full(combos, -np.inf)
+    last_label = np.full(combos, -1)  # 每个组合最近一次命中的标注；同一次求助只计最早那次询问的提前量
+    block = max(1, SWEEP_BLOCK_CELLS // max(combos, 1))
+    for start in range(0, len(rows), block):
+        above = signals[start:start + block] @ weights > grid["threshold"]
+        for offset in np.flatnonzero(above.any(axis=1)):
+            index = start + offset
+            fire = above[offset] & (rows[index] - last_inquiry >= cooldown)
+            if not fire.any():
+                continue
+            result["first_trigger_seconds"][fire & (last_inquiry == -np.inf)] = times[index] - trace.times[0]
+            last_inquiry[fire] = rows[index]
+            result["inquiries"] += fire
+            label = nearest[index]
+            if label >= 0:
+                result["matched_inquiries"] += fire
+                hit = fire & (last_label != label)
+                last_label[hit] = label
+                result["labels_hit"] += hit
+                result["lead_seconds_sum"] += hit * (labels[label] - times[index])
+    return result
+
+
+def summarize(totals: dict, grid: dict, traces: int) -> dict:
+    """把各段录制的计数合计后换算成报告指标（数组，按组合对齐）。"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = totals["matched_inquiries"] / totals["inquiries"]
+        recall = totals["labels_hit"] / totals["labels"]
+        return {
+            **grid,
+            "inquiries": totals["inquiries"],
+            "inquiries_per_hour": totals["inquiries"] / totals["hours"],
+            "mean_first_trigger_seconds": totals["first_trigger_seconds_sum"] / totals["traces_triggered"],
+            "traces_triggered": totals["traces_triggered"],
+            "traces": np.full(len(grid["threshold"]), traces),
+            "precision": precision,
+            "recall": recall,
+            "f1": 2 * precision * recall / (precision + recall),
+            "mean_lead_seconds": totals["lead_seconds_sum"] / totals["labels_hit"],
+        }
+
+
+def sweep(traces: list, grid: dict, history_limit: int = 6, cooldown_samples: int = None, match_window: float = 60.0) -> dict:
+    """在所有录制数据上评估所有参数组合。"""
+    totals = {}
+    for trace in traces:
+        result = replay_trace(trace, grid, history_limit, cooldown_samples, match_window)
+        first_trigger = result.pop("first_trigger_seconds")
+        result["first_trigger_seconds_sum"] = np.nan_to_num(first_trigger)
+        result["traces_triggered"] = (~np.isnan(first_trigger)).astype(np.int64)
+        for key, values in result.items():
+            totals[key] = totals.get(key, 0) + values
+    return summarize(totals, grid, len(traces))
+
+
+def parse_values(spec: str) -> list:
+    """"0.6" -> [0.6]；"0.2,0.4,0.6" -> 列表；"0:1.5:7" -> 从 0 到 1.5 均匀取 7 个值。"""
+    if ":" in spec:
+        start, stop, num = spec.split(":")
+        return np.linspace(float(start), float(stop), int(num)).tolist()
+    return [float(value) for value in spec.split(",")]
+
+
+def report_rows(summary: dict, order: np.ndarray) -> list:
+    return [{key: (None if np.isnan(float(values[i])) else round(float(values[i]), 4)) for key, values in summary.items()} for i in order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded activity traces through the proactive scoring model and sweep its weights and threshold.")
+    parser.add_argument("traces", nargs="+", help="JSONL trace files, NPZ trace chunks or directories of chunks")
+    parser.add_argument("--cognitive-load", default=str(PROACTIVE_WEIGHTS["cognitive_load"]), help='weight values: "0.6", "0.4,0.6" or "start:stop:num"')
+    parser.add_argument("--stuck-bonus", default=str(PROACTIVE_WEIGHTS["stuck_bonus"]))
+    parser.add_argument("--flow-signal", default=str(PROACTIVE_WEIGHTS["flow_signal"]))
+    parser.add_argument("--window-switch", default=str(PROACTIVE_WEIGHTS["window_switch"]))
+    parser.add_argument("--threshold", default=str(PROACTIVE_THRESHOLD))
+    parser.add_argument("--history-limit", type=int, default=6, help="samples in the sliding window")
+    parser.add_argument("--cooldown", type=int, default=None, help="samples between inquiries (default: one window)")
+    parser.add_argument("--match-window", type=float, default=60.0, help="seconds between an inquiry and a labeled help request to count as a match")
+    parser.add_argument("--help-events", default=",".join(DEFAULT_HELP_EVENTS), help="NPZ event kinds counted as help requests")
+    parser.add_argument("--sort", default="f1", choices=["f1", "precision", "recall", "inquiries_per_hour", "mean_lead_seconds"])
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args()
+
+    load_start = time.perf_counter()
+    traces = [load_trace(path, args.history_limit, args.help_events.split(",")) for path in args.traces]
+    load_seconds = time.perf_counter() - load_start
+
+    # 当前使用的参数总是作为第 0 个组合参与评估，方便对比
+    values = {name: parse_values(getattr(args, name)) for name in SWEEP_PARAMETERS}
+    baseline = {**{name: [PROACTIVE_WEIGHTS[name]] for name in SWEEP_PARAMETERS[:-1]}, "threshold": [PROACTIVE_THRESHOLD]}
+    grid = {name: np.concatenate((current, swept)) for (name, current), swept
+            in zip(parameter_grid(baseline).items(), parameter_grid(values).values())}
+
+    sweep_start = time.perf_counter()
+    summary = sweep(traces, grid, args.history_limit, args.cooldown, args.match_window)
+    sweep_seconds = time.perf_counter() - sweep_start
+
+    key = summary[args.sort]
+    order = np.argsort(-np.nan_to_num(key, nan=-np.inf), kind="stable")[:args.top]
+    rows, labels = sum(len(trace.times) for trace in traces), sum(len(trace.help_times) for trace in traces)
+    hours = sum(trace.duration_seconds for trace in traces) / 3600
+    print(f"{len(traces)} trace(s), {hours:.2f} h, {rows} history rows, {labels} labeled help requests (loaded in {load_seconds:.2f}s)")
+    print(f"{len(grid['threshold'])} parameter combinations evaluated in {sweep_seconds:.2f}s")
+    columns = list(SWEEP_PARAMETERS) + ["inquiries_per_hour", "mean_first_trigger_seconds", "precision", "recall", "f1", "mean_lead_seconds"]
+    widths = [len(column) for column in ["current"] + columns]
+    print("  ".join(column.rjust(width) for column, width in zip(["rank"] + columns, widths)))
+    for rank, row in zip(["current"] + list(range(1, len(order) + 1)), report_rows(summary, np.concatenate(([0], order)))):
+        print("  ".join(str(value).rjust(width) for value, width in zip([rank] + [row[column] for column in columns], widths)))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "traces": [trace.name for trace in traces],
+                "config": vars(args),
+                "sweep_seconds": round(sweep_seconds, 3),
+                "current": report_rows(summary, [0])[0],
+                "results": report_rows(summary, np.argsort(-np.nan_to_num(key, nan=-np.inf), kind="stable")),
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import os
+from collections import Counter
+import cv2
+import numpy as np
+
+# SSD 人脸检测的置信度阈值
+FACE_CONFIDENCE_THRESHOLD = 0.5
+# 跟踪时每隔这么多帧重新检测一次人脸，其间在上一个框附近做模板匹配
+FACE_REDETECT_EVERY = int(os.getenv("FACE_REDETECT_EVERY", 8))
+# 模板匹配的归一化相关系数低于这个值时认为跟丢，重新检测
+FACE_TRACK_MIN_SCORE = float(os.getenv("FACE_TRACK_MIN_SCORE", 0.6))
+# 搜索区域：上一个框四周各扩展框宽/高的这个比例
+FACE_TRACK_SEARCH_MARGIN = 0.5
+# 模板和搜索区域按同一比例缩小，模板宽度缩到这么多像素再匹配
+FACE_TRACK_TEMPLATE_WIDTH = 48
+
+
+def detect_faces(net, frames: list, threshold: float = FACE_CONFIDENCE_THRESHOLD) -> list:
+    """
+    用 cv2.dnn.blobFromImages 一次前向检测多帧（300x300 SSD），
+    返回每帧置信度最高的人脸框 (x1, y1, x2, y2)，没有检测到人脸的帧为 None。
+    """
+    if not frames:
+        return []
+    blob = cv2.dnn.blobFromImages(frames, 1.0, (300, 300), (104.0, 177.0, 123.0), False, False)
+    net.setInput(blob)
+    # [帧数 * keep_top_k, 7]：帧序号, 类别, 置信度, x1, y1, x2, y2（相对坐标）
+    detections = net.forward()[0, 0]
+    boxes = []
+    for index, frame in enumerate(frames):
+        rows = detections[(detections[:, 0] == index) & (detections[:, 2] > threshold)]
+        h, w = frame.shape[:2]
+        best_box = None
+        for row in rows[np.argsort(-rows[:, 2], kind="stable")]:
+            x1, y1, x2, y2 = (row[3:7] * np.array([w, h, w, h])).astype(int)
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(w, x2), min(h, y2)
+            if x2 > x1 and y2 > y1:
+                best_box = (int(x1), int(y1), int(x2), int(y2))
+                break
+        boxes.append(best_box)
+    return boxes
+
+
+class FaceTracker:
+    """
+    在连续的帧之间复用人脸框：每 redetect_every 帧用 SSD 重新检测一次，其间在上一个框附近做模板匹配
+    （缩小后的灰度图，TM_CCOEFF_NORMED），匹配分数就是跟踪置信度，低于 min_score 时改为重新检测。
+    locate_batch() 把一批帧中需要检测的帧合并成 blobFromImages 前向：先检测按计划该检测的帧，
+    再按顺序跟踪其余帧，跟丢的帧最后再合并检测一次，每批最多两次前向。
+    """
+    def __init__(self, net, redetect_every: int = FACE_REDETECT_EVERY, min_score: float = FACE_TRACK_MIN_SCORE,
+                 threshold: float = FACE_CONFIDENCE_THRESHOLD):
+        self.net = net
+        self.redetect_every = max(redetect_every, 1)
+        self.min_score = min_score
+        self.threshold = threshold
+        self.box = None  # 最近一帧的人脸框
+        self.template = None  # 最近一次检测到的人脸（缩小后的灰度图）
+        self.scale = 1.0
+        self.since_detection = 0
+        self.counts = Counter()
+
+    def _remember(self, frame, box):
+        """以检测到的人脸作为新的跟踪模板。"""
+        x1, y1, x2, y2 = box
+        self.scale = min(FACE_TRACK_TEMPLATE_WIDTH / (x2 - x1), 1.0)
+        gray = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+        self.template = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        self.box = box
+        self.since_detection = 0
+
+    def _track(self, frame):
+        """在上一个框附近寻找模板，返回 (新的框, 匹配分数)。"""
+        x1, y1, x2, y2 = self.box
+        h, w = frame.shape[:2]
+        margin_x, margin_y = int((x2 - x1) * FACE_TRACK_SEARCH_MARGIN), int((y2 - y1) * FACE_TRACK_SEARCH_MARGIN)
+        sx1, sy1 = max(0, x1 - margin_x), max(0, y1 - margin_y)
+        sx2, sy2 = min(w, x2 + margin_x), min(h, y2 + margin_y)
+        gray = cv2.cvtColor(frame[sy1:sy2, sx1:sx2], cv2.COLOR_BGR2GRAY)
+        region = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        th, tw = self.template.shape
+        if region.shape[0] < th or region.shape[1] < tw:
+            return self.box, 0.0
+        _, score, _, (dx, dy) = cv2.minMaxLoc(cv2.matchTemplate(region, self.template, cv2.TM_CCOEFF_NORMED))
+        nx1, ny1 = sx1 + int(round(dx / self.scale)), sy1 + int(round(dy / self.scale))
+        box = (nx1, ny1, min(w, nx1 + x2 - x1), min(h, ny1 + y2 - y1))
+        return box, float(score)
+
+    def locate_batch(self, frames: list) -> list:
+        """按时间顺序定位一批帧中的人脸，返回每帧的人脸框或 None。"""
+        boxes = [None] * len(frames)
+        # 第一轮：按计划该检测的帧（没有可跟踪的框时从第一帧开始）
+        first = 0 if self.box is None else self.redetect_every - self.since_detection
+        scheduled = list(range(max(first, 0), len(frames), self.redetect_every))
+        detected = dict(zip(scheduled, self._detect([frames[i] for i in scheduled])))
+        # 第二轮：按顺序跟踪其余帧，记下跟丢的帧
+        lost = []
+        for i, frame in enumerate(frames):
+            if i in detected:
+                if detected[i] is None:
+                    self.box = None
+                else:
+                    self._remember(frame, detected[i])
+                boxes[i] = detected[i]
+                continue
+            if self.box is not None:
+                box, score = self._track(frame)
+                if score >= self.min_score:
+                    boxes[i] = self.box = box
+                    self.since_detection += 1
+                    self.counts["tracked"] += 1
+                    continue
+            lost.append(i)
+            self.counts["lost"] += 1
+        # 第三轮：跟丢的帧合并检测；最后一帧跟丢时以它的检测结果作为新的跟踪起点
+        for i, box in zip(lost, self._detect([frames[i] for i in lost])):
+            boxes[i] = box
+        if lost and lost[-1] == len(frames) - 1:
+            if boxes[-1] is None:
+                self.box = None
+            else:
+                self._remember(frames[-1], boxes[-1])
+        return boxes
+
+    def _detect(self, frames: list) -> list:
+        if frames:
+            self.counts["detections"] += len(frames)
+            self.counts["forward_passes"] += 1
+        return detect_faces(self.net, frames, self.threshold)
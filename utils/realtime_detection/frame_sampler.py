@@ -0,0 +1,116 @@
+import os
+import time
+import cv2
+import numpy as np
+
+# 摄像头采集参数：模型每 30 秒只用 32 帧（约 1 fps），因此向摄像头请求较低的帧率；驱动不支持时设置无效，由 capture_loop 丢弃多余的帧。
+# 分辨率要保证裁剪出的人脸不小于模型输入（112x112）
+VISION_CAPTURE_WIDTH = int(os.getenv("VISION_CAPTURE_WIDTH", 640))
+VISION_CAPTURE_HEIGHT = int(os.getenv("VISION_CAPTURE_HEIGHT", 480))
+VISION_CAPTURE_FPS = float(os.getenv("VISION_CAPTURE_FPS", 5))
+# 攒够这么多个采样帧再一起裁剪人脸（人脸检测合批）；预测前会先处理未攒满的部分
+VISION_CROP_BATCH = int(os.getenv("VISION_CROP_BATCH", 8))
+
+
+class FrameSampler:
+    """
+    按墙钟时间从摄像头画面中等间隔采样模型需要的帧：每 segment_seconds 秒取 sample_frames 帧，与摄像头的实际帧率无关。
+    采样的帧每攒够 crop_batch_size 个就一起交给 crop_batch 裁剪人脸，再用 cv2.resize 直接缩放进预先分配的
+    uint8 环形缓冲区 [sample_frames, frame_size, frame_size, 3] 并原地转为 RGB；
+    缓冲区中始终是最近一个片段的采样帧，其余画面既不保留也不复制。
+    预测时 write_input 把环形缓冲区的两段按时间顺序直接写进模型输入，不经过中间数组。
+    """
+    def __init__(self, segment_seconds=30, sample_frames=32, frame_size=112, crop_batch=None,
+                 crop_batch_size=VISION_CROP_BATCH):
+        self.sample_frames = sample_frames
+        self.frame_size = frame_size
+        self.interval = segment_seconds / sample_frames
+        self.crop_batch = crop_batch or (lambda frames: frames)
+        self.crop_batch_size = max(crop_batch_size, 1)
+        self.ring = np.zeros((sample_frames, frame_size, frame_size, 3), dtype=np.uint8)
+        self.pending = []  # 已采样、还没有裁剪的原始画面
+        self.samples_taken = 0  # 已写入环形缓冲区的采样帧数
+        self.next_sample_at = None
+
+    @property
+    def ready(self) -> bool:
+        """是否已采够一个完整片段的帧（包括还没有裁剪的）。"""
+        return self.samples_taken + len(self.pending) >= self.sample_frames
+
+    def due(self, now: float) -> bool:
+        """now（time.monotonic()）时刻的画面是否需要采样。"""
+        return self.next_sample_at is None or now >= self.next_sample_at
+
+    def offer(self, frame, now: float = None) -> bool:
+        """交给采样器一帧 BGR 画面，返回是否采样了这一帧。"""
+        now = time.monotonic() if now is None else now
+        if not self.due(now):
+            return False
+        # 调用方可能在这一帧上绘制预览，留一份副本等待合批裁剪
+        self.pending.append(frame.copy())
+        if len(self.pending) >= self.crop_batch_size:
+            self.flush()
+        # 按固定节拍安排下一次采样；落后超过一个间隔（摄像头卡顿等）时从现在重新计时，不连续补采
+        if self.next_sample_at is None or now - self.next_sample_at >= self.interval:
+            self.next_sample_at = now + self.interval
+        else:
+            self.next_sample_at += self.interval
+        return True
+
+    def flush(self):
+        """裁剪所有待处理的采样帧，缩放后写入环形缓冲区。"""
+        frames, self.pending = self.pending, []
+        for face in self.crop_batch(frames):
+            slot = self.ring[self.samples_taken % self.sample_frames]
+            # INTER_AREA 缩小时带抗锯齿，接近训练时 transforms.Resize（PIL 双线性）的效果；先缩放再转 RGB，只转换 112x112 的像素
+            cv2.resize(face, (self.frame_size, self.frame_size), dst=slot, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(slot, cv2.COLOR_BGR2RGB, dst=slot)
+            self.samples_taken += 1
+
+    def ordered(self) -> np.ndarray:
+        """按时间从旧到新排列的采样帧 [sample_frames, frame_size, frame_size, 3]（新分配的 uint8 数组）。"""
+        self.flush()
+        start = self.samples_taken % self.sample_frames
+        return np.concatenate((self.ring[start:], self.ring[:start]))
+
+    def write_input(self, out: np.ndarray) -> np.ndarray:
+        """
+        按时间从旧到新把采样帧写入 out（[sample_frames, frame_size, frame_size, 3] float32，可以是模型输入张量的视图），
+        写入时除以 255 缩放到 0~1（与 ToTensor 相同）。环形缓冲区的两段各一次 np.divide，类型转换和缩放在同一遍完成。
+        """
+        self.flush()
+        start = self.samples_taken % self.sample_frames
+        older = self.sample_frames - start
+        np.divide(self.ring[start:], np.float32(255), out=out[:older], dtype=np.float32)
+        np.divide(self.ring[:start], np.float32(255), out=out[older:], dtype=np.float32)
+        return out
+
+
+def open_capture(source=0, width: int = VISION_CAPTURE_WIDTH, height: int = VISION_CAPTURE_HEIGHT,
+                 fps: float = VISION_CAPTURE_FPS):
+    """打开摄像头并请求采集分辨率和帧率（尽力而为，驱动不支持的设置会被忽略）。"""
+    cap = cv2.VideoCapture(source)
+    if cap.isOpened():
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        cap.set(cv2.CAP_PROP_FPS, fps)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
+def capture_loop(cap, sampler: FrameSampler, decode_all: bool = False):
+    """
+    逐帧 grab() 取出摄像头画面，只有轮到采样时（或 decode_all=True，用于预览窗口）才 retrieve()（解码），采样的帧交给采样器。
+    每取出一帧生成一次 (时刻, 解码的画面或 None, 是否采样)，调用方可借此处理窗口事件或检查停止条件；读取失败时结束。
+    """
+    while True:
+        if not cap.grab():
+            return
+        now = time.monotonic()
+        if not (decode_all or sampler.due(now)):
+            yield now, None, False
+            continue
+        ok, frame = cap.retrieve()
+        if not ok:
+            return
+        yield now, frame, sampler.offer(frame, now)
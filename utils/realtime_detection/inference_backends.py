@@ -0,0 +1,224 @@
+import os
+import copy
+import tempfile
+from abc import ABC, abstractmethod
+import torch
+import torch.nn as nn
+
+# 视觉模型的推理后端：eager / torchscript / compile / onnx / int8-dynamic / int8-static（见 BACKENDS）
+VISION_INFERENCE_BACKEND = os.getenv("VISION_INFERENCE_BACKEND", "eager")
+# 推理使用的 CPU 线程数；0 表示保持 PyTorch / ONNX Runtime 的默认值
+VISION_INFERENCE_THREADS = int(os.getenv("VISION_INFERENCE_THREADS", 0))
+# int8-static：前这么多次预测用带观察器的 float32 模型推理并记录激活范围，之后转换为 int8 模型
+VISION_CALIBRATION_BATCHES = int(os.getenv("VISION_CALIBRATION_BATCHES", 8))
+ONNX_OPSET = 18
+# onnx 后端导出的模型放在这里，按权重文件名和输入形状命名；比权重文件新时直接复用，不再重新导出
+VISION_ONNX_CACHE_DIR = os.getenv("VISION_ONNX_CACHE_DIR",
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cache", "onnx"))
+
+
+class InferenceBackend(ABC):
+    """推理后端：输入 [1, 3, 32, 112, 112] float32，返回 logits [1, num_classes]。"""
+    name = "base"
+
+    @abstractmethod
+    def __call__(self, frames: torch.Tensor) -> torch.Tensor:
+        ...
+
+    def warmup(self, example: torch.Tensor):
+        """用示例输入跑一次，让首次预测不承担编译、内存分配等一次性开销。"""
+        self(example)
+
+
+class EagerBackend(InferenceBackend):
+    """float32 eager 执行；CPU 上权重和输入使用 channels_last_3d 内存布局。"""
+    name = "eager"
+
+    def __init__(self, model: nn.Module, device: torch.device):
+        self.device = device
+        self.memory_format = torch.channels_last_3d if device.type == "cpu" else torch.contiguous_format
+        self.model = model.to(device, memory_format=self.memory_format).eval()
+
+    def __call__(self, frames):
+        with torch.inference_mode():
+            return self.model(frames.to(self.device).contiguous(memory_format=self.memory_format))
+
+
+class TorchScriptBackend(EagerBackend):
+    """torch.jit.trace 后冻结（权重折叠为常量、BN 融合进卷积）并做推理优化。"""
+    name = "torchscript"
+
+    def __init__(self, model: nn.Module, device: torch.device, example: torch.Tensor):
+        super().__init__(model, device)
+        with torch.no_grad():
+            traced = torch.jit.trace(self.model, example.contiguous(memory_format=self.memory_format))
+            self.model = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+
+class CompileBackend(EagerBackend):
+    """torch.compile（inductor），第一次调用时编译，需要 C++ 编译器。"""
+    name = "compile"
+
+    def __init__(self, model: nn.Module, device: torch.device):
+        super().__init__(model, device)
+        self.model = torch.compile(self.model, dynamic=False)
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    导出为 ONNX，用 ONNX Runtime（CPUExecutionProvider，全部图优化）推理。需要 onnx 和 onnxruntime。
+    给出 weights_path 时导出到 VISION_ONNX_CACHE_DIR，已有的导出比权重文件新就直接复用；否则每次导出到临时目录。
+    """
+    name = "onnx"
+
+    def __init__(self, model: nn.Module, example: torch.Tensor, threads: int = 0, onnx_path: str = None,
+                 weights_path: str = None):
+        import onnxruntime as ort
+        self.onnx_path = onnx_path or self.default_path(weights_path, tuple(example.shape))
+        if self._stale(weights_path):
+            output_dir = os.path.dirname(self.onnx_path) or "."
+            os.makedirs(output_dir, exist_ok=True)
+            # 先用同样的文件名导出到临时目录（权重可能另存为 <文件名>.data 并按文件名引用），完成后再整体移过去
+            with tempfile.TemporaryDirectory(dir=output_dir) as temp_dir, torch.no_grad():
+                torch.onnx.export(copy.deepcopy(model).eval().cpu(), (example.cpu().contiguous(),),
+                                  os.path.join(temp_dir, os.path.basename(self.onnx_path)),
+                                  input_names=["frames"], output_names=["logits"], opset_version=ONNX_OPSET)
+                for file_name in os.listdir(temp_dir):
+                    os.replace(os.path.join(temp_dir, file_name), os.path.join(output_dir, file_name))
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+
+    @staticmethod
+    def default_path(weights_path: str, input_shape: tuple) -> str:
+        if weights_path is None:
+            return os.path.join(tempfile.gettempdir(), "cognitive_load_resnet3d.onnx")
+        name = os.path.splitext(os.path.basename(weights_path))[0]
+        shape = "x".join(str(dim) for dim in input_shape)
+        return os.path.join(os.path.abspath(VISION_ONNX_CACHE_DIR), f"{name}-{shape}-opset{ONNX_OPSET}.onnx")
+
+    def _stale(self, weights_path: str) -> bool:
+        """没有权重文件可比较（随机初始化的模型等）时总是重新导出。"""
+        try:
+            return weights_path is None or os.path.getmtime(self.onnx_path) < os.path.getmtime(weights_path)
+        except OSError:
+            return True
+
+    def __call__(self, frames):
+        logits = self.session.run(["logits"], {"frames": frames.detach().cpu().contiguous().numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+class Int8DynamicBackend(EagerBackend):
+    """
+    动态 int8 量化：权重量化为 int8，激活在运行时量化。PyTorch 只对全连接层（和 RNN）做动态量化，
+    3D 卷积仍是 float32，因此对本模型加速有限；卷积也量化请用 int8-static。
+    """
+    name = "int8-dynamic"
+
+    def __init__(self, model: nn.Module):
+        from torch.ao.quantization import quantize_dynamic
+        super().__init__(quantize_dynamic(copy.deepcopy(model).eval().cpu(), {nn.Linear}, dtype=torch.qint8), torch.device("cpu"))
+
+
+class Int8StaticBackend(InferenceBackend):
+    """
+    FX 图模式静态 int8 量化（卷积、全连接和激活都量化）。需要用真实输入校准：
+    前 calibration_batches 次调用用插入了观察器的 float32 模型推理，同时记录激活范围，之后转换为 int8 模型；
+    也可以事先用 calibrate() 一次性校准。校准和转换总是在 inference_mode 之外进行（即使调用方处在 inference_mode 中），
+    观察器的状态和转换得到的 int8 模型都是普通张量。
+    """
+    name = "int8-static"
+
+    def __init__(self, model: nn.Module, example: torch.Tensor, calibration_batches: int = VISION_CALIBRATION_BATCHES):
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import prepare_fx
+        qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+        self.prepared = prepare_fx(copy.deepcopy(model).eval().cpu(), qconfig_mapping, (example.cpu(),))
+        self.remaining = max(calibration_batches, 1)
+        self.model = None
+
+    @property
+    def calibrated(self) -> bool:
+        return self.model is not None
+
+    def warmup(self, example):
+        pass  # 随机输入会污染校准得到的激活范围
+
+    def calibrate(self, batches):
+        """用给定的输入校准并立即转换为 int8 模型。"""
+        with torch.inference_mode(False), torch.no_grad():
+            for frames in batches:
+                self.prepared(frames.detach().cpu().clone())
+        self._convert()
+
+    def _convert(self):
+        from torch.ao.quantization.quantize_fx import convert_fx
+        with torch.inference_mode(False), torch.no_grad():
+            self.model = convert_fx(self.prepared)
+        self.prepared = None
+
+    def __call__(self, frames):
+        frames = frames.detach().cpu()
+        if self.model is not None:
+            with torch.inference_mode():
+                return self.model(frames)
+        with torch.inference_mode(False), torch.no_grad():
+            logits = self.prepared(frames.clone())  # 调用方传入的可能是 inference 张量
+        self.remaining -= 1
+        if self.remaining == 0:
+            self._convert()
+        return logits
+
+
+BACKENDS = ("eager", "torchscript", "compile", "onnx", "int8-dynamic", "int8-static")
+
+
+def create_backend(model: nn.Module, name: str, device: torch.device, example: torch.Tensor, threads: int = 0,
+                   onnx_path: str = None, weights_path: str = None) -> InferenceBackend:
+    """按名称创建推理后端（不预热、不回退）。"""
+    if name == "eager":
+        return EagerBackend(model, device)
+    if name == "torchscript":
+        return TorchScriptBackend(model, device, example)
+    if name == "compile":
+        return CompileBackend(model, device)
+    if name == "onnx":
+        return OnnxBackend(model, example, threads, onnx_path, weights_path)
+    if name == "int8-dynamic":
+        return Int8DynamicBackend(model)
+    if name == "int8-static":
+        return Int8StaticBackend(model, example)
+    raise ValueError(f"Unknown vision inference backend: {name} (choose from {', '.join(BACKENDS)}).")
+
+
+def build_backend(model: nn.Module, name: str = VISION_INFERENCE_BACKEND, device: torch.device = None,
+                  threads: int = VISION_INFERENCE_THREADS, onnx_path: str = None, weights_path: str = None,
+                  input_shape: tuple = (1, 3, 32, 112, 112)) -> InferenceBackend:
+    """
+    创建并预热推理后端。threads > 0 时设置 PyTorch 的线程数（ONNX Runtime 使用同样的线程数）。
+    除 eager 外的后端只支持 CPU；后端不可用（缺少依赖、编译失败等）时打印警告并改用 eager。
+    weights_path 是模型权重文件，onnx 后端据此复用缓存的导出。应在 inference_mode 之外调用。
+    """
+    device = device or torch.device("cpu")
+    if threads > 0:
+        torch.set_num_threads(threads)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown vision inference backend: {name} (choose from {', '.join(BACKENDS)}).")
+    if device.type != "cpu" and name != "eager":
+        print(f"警告：推理后端 {name} 只支持 CPU，在 {device} 上改用 eager")
+        name = "eager"
+    example = torch.rand(input_shape)
+    try:
+        backend = create_backend(model, name, device, example, threads, onnx_path, weights_path)
+        backend.warmup(example)
+    except Exception as e:
+        if name == "eager":
+            raise
+        print(f"警告：推理后端 {name} 初始化失败（{e}），改用 eager")
+        backend = EagerBackend(model, device)
+        backend.warmup(example)
+    print(f"视觉模型推理后端：{backend.name}，线程数 {torch.get_num_threads()}")
+    return backend
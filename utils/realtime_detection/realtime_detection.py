@@ -1,10 +1,10 @@
 import cv2
 import torch
-import numpy as np
 import time
-from collections import deque
-from torchvision import transforms
 from utils.realtime_detection.model import get_resnet3d
+from utils.realtime_detection.frame_sampler import FrameSampler, open_capture, capture_loop
+from utils.realtime_detection.face_tracker import FaceTracker, detect_faces
+from utils.realtime_detection.inference_backends import build_backend
 
 import threading
 
@@ -15,19 +15,15 @@ import site
 # # 手动添加 DLL 路径
 # dll_path = Path(sys.prefix)  # sys.prefix 通常就是 .venv 目录
 # os.add_dll_directory(str(dll_path))
-site_packages = next(p for p in sys.path if "site-packages" in p)
-dll_path = Path(site_packages) / "pywin32_system32"
+# pywin32、keyboard、mouse 只在 Windows 上真正监控输入和窗口时需要，其他平台上也能导入本模块（例如运行基准测试）
+if sys.platform == "win32":
+    site_packages = next(p for p in sys.path if "site-packages" in p)
+    dll_path = Path(site_packages) / "pywin32_system32"
 
-if not dll_path.exists():
-    raise FileNotFoundError(f"❌ DLL 路径不存在: {dll_path}")
-else:
-    os.add_dll_directory(str(dll_path))
-
-import win32gui
-import win32con
-import win32api
-import keyboard
-import mouse
+    if not dll_path.exists():
+        raise FileNotFoundError(f"❌ DLL 路径不存在: {dll_path}")
+    else:
+        os.add_dll_directory(str(dll_path))
 
 class InputMonitor:
     """统计鼠标和键盘输入次数"""
@@ -47,6 +43,8 @@ class InputMonitor:
         self.running = False
 
     def _monitor(self):
+        import keyboard
+        import mouse
         mouse.hook(lambda e: self._on_mouse(e))
         keyboard.hook(lambda e: self._on_key(e))
         while self.running:
@@ -62,7 +60,10 @@ class InputMonitor:
             self.key_presses += 1
 
 def get_active_window_info():
-    """获取当前活跃窗口标题和坐标"""
+    """获取当前活跃窗口标题和坐标（仅 Windows，其他平台返回 None）"""
+    if sys.platform != "win32":
+        return None
+    import win32gui
     hwnd = win32gui.GetForegroundWindow()
     title = win32gui.GetWindowText(hwnd)
     rect = win32gui.GetWindowRect(hwnd)
@@ -74,8 +75,6 @@ class RealtimeCognitiveLoadDetector:
         self.predict_interval = predict_interval
         self.sample_frames = sample_frames
         self.frame_size = frame_size
-        self.fps = 25  # 假设摄像头25fps
-        self.frames_per_segment = int(self.fps * segment_seconds)
         self.input_monitor = InputMonitor()
         
         # 加载认知负荷检测模型
@@ -83,19 +82,21 @@ class RealtimeCognitiveLoadDetector:
         self.model = get_resnet3d(num_classes=3, pretrained=False).to(self.device)
         self.model.load_state_dict(torch.load(model_path, map_location=self.device))
         self.model.eval()
+        # 推理后端由 VISION_INFERENCE_BACKEND / VISION_INFERENCE_THREADS 选择，ONNX 模型导出到 VISION_ONNX_CACHE_DIR
+        input_shape = (1, 3, sample_frames, frame_size, frame_size)
+        self.backend = build_backend(self.model, device=self.device, input_shape=input_shape, weights_path=model_path)
+        # 模型输入 [1, 3, sample_frames, frame_size, frame_size]，每次预测复用；
+        # channels_last_3d 布局与采样缓冲区 [T, H, W, C] 的内存顺序一致，input_frames 是它按 [T, H, W, C] 取的 numpy 视图
+        self.input_buffer = torch.empty(input_shape, dtype=torch.float32).contiguous(memory_format=torch.channels_last_3d)
+        self.input_frames = self.input_buffer[0].permute(1, 2, 3, 0).numpy()
         
         # 加载人脸检测模型
         self.face_detector = self.load_face_detector(face_detector_path)
+        # 采样帧之间复用人脸框，每隔几帧或跟丢时才重新检测
+        self.face_tracker = FaceTracker(self.face_detector) if self.face_detector is not None else None
         
-        # 图像预处理
-        self.transform = transforms.Compose([
-            transforms.ToPILImage(),
-            transforms.Resize((frame_size, frame_size)),
-            transforms.ToTensor()
-        ])
-        
-        # 帧缓存
-        self.frame_buffer = deque(maxlen=self.frames_per_segment)
+        # 帧缓存：按时间每 segment_seconds 秒采样 sample_frames 帧，只保存裁剪、缩放后的采样帧
+        self.sampler = FrameSampler(segment_seconds, sample_frames, frame_size, crop_batch=self.crop_faces)
         
         # 标签映射
         self.label_names = {0: 'Low Load', 1: 'Medium Load', 2: 'High Load'}
@@ -123,74 +124,61 @@ class RealtimeCognitiveLoadDetector:
             return frame, None
         
         try:
-            blob = cv2.dnn.blobFromImage(frame, 1.0, (300, 300), (104.0, 177.0, 123.0), False, False)
-            self.face_detector.setInput(blob)
-            detections = self.face_detector.forward()
-            
-            max_confidence = 0
-            best_face = None
-            best_box = None
-            
-            for i in range(detections.shape[2]):
-                confidence = detections[0, 0, i, 2]
-                if confidence > 0.5:
-                    if confidence > max_confidence:
-                        max_confidence = confidence
-                        h, w = frame.shape[:2]
-                        box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                        x1, y1, x2, y2 = box.astype(int)
-                        x1, y1 = max(0, x1), max(0, y1)
-                        x2, y2 = min(w, x2), min(h, y2)
-                        if x2 > x1 and y2 > y1:
-                            best_face = frame[y1:y2, x1:x2]
-                            best_box = (x1, y1, x2, y2)
-            
-            return best_face if best_face is not None else frame, best_box
+            box = detect_faces(self.face_detector, [frame])[0]
         except Exception as e:
             return frame, None
+        if box is None:
+            return frame, None
+        x1, y1, x2, y2 = box
+        return frame[y1:y2, x1:x2], box
     
-    def preprocess_frames(self, frames):
-        """预处理帧序列"""
-        if len(frames) < self.sample_frames:
+    def crop_faces(self, frames):
+        """按时间顺序批量定位（检测或跟踪）一批采样帧中的人脸并裁剪；没有人脸检测模型或未找到人脸时用整帧"""
+        if self.face_tracker is None:
+            return frames
+        try:
+            boxes = self.face_tracker.locate_batch(frames)
+        except Exception as e:
+            return frames
+        return [frame if box is None else frame[box[1]:box[3], box[0]:box[2]] for frame, box in zip(frames, boxes)]
+    
+    def preprocess_frames(self):
+        """
+        把采样器中最近一个片段的采样帧转换为模型输入 [1, 3, 32, 112, 112]（与 ToTensor 相同，缩放到 0~1）；采样不足时返回 None。
+        采样器把环形缓冲区的两段直接写进预先分配的输入张量（经由它的 [T, H, W, C] 视图），只复制一次。
+        """
+        if not self.sampler.ready:
             return None
-        
-        # 等间隔采样
-        indices = np.linspace(0, len(frames)-1, self.sample_frames, dtype=int)
-        sampled_frames = []
-        
-        for idx in indices:
-            frame = frames[int(idx)]  # 确保索引为int类型
-            # 人脸检测与裁剪
-            face_frame, _ = self.detect_and_crop_face(frame)
-            # 预处理
-            face_frame = cv2.cvtColor(face_frame, cv2.COLOR_BGR2RGB)
-            face_frame = self.transform(face_frame)
-            sampled_frames.append(face_frame)
-        
-        return torch.stack(sampled_frames)  # [32, 3, 112, 112]
+        self.sampler.write_input(self.input_frames)
+        return self.input_buffer
     
     def predict_cognitive_load(self, frames_tensor):
         """预测认知负荷"""
-        with torch.no_grad():
-            frames_tensor = frames_tensor.unsqueeze(0).to(self.device)  # [1, 32, 3, 112, 112]
-            frames_tensor = frames_tensor.permute(0, 2, 1, 3, 4)  # [1, 3, 32, 112, 112]
-            logits = self.model(frames_tensor)
+        # 后端自己进入 inference_mode；int8-static 在前几次调用中校准和转换，需要在 inference_mode 之外
+        logits = self.backend(frames_tensor)  # 输入 [1, 3, 32, 112, 112]
+        with torch.inference_mode():
             probabilities = torch.softmax(logits, dim=1)
             predicted_class = int(torch.argmax(logits, dim=1).item())  # 确保为int类型
             confidence = probabilities[0, predicted_class].item()
             
             return predicted_class, confidence
     
-    def run_detection(self):
-        """运行实时检测"""
-        cap = cv2.VideoCapture(0)  # 打开摄像头
+    def run_detection(self, headless=False, on_result=None, stop_event=None):
+        """
+        运行实时检测，每次预测生成一个结果，并调用 on_result(result)（如果提供）。
+        headless=True 时（web 服务的后台线程使用）不绘制、不打开窗口、不处理按键，只解码采样的帧，
+        在没有显示器的服务器上也能运行；stop_event 被设置后在下一帧退出。
+        直接运行本模块时使用带预览窗口的交互模式，按 'q' 退出。
+        """
+        cap = open_capture(0)  # 打开摄像头，请求低帧率
         
         if not cap.isOpened():
             print("无法打开摄像头")
             return
         
         print("实时认知负荷检测已启动")
-        print("按 'q' 键退出")
+        if not headless:
+            print("按 'q' 键退出")
 
         self.input_monitor.start()  # 启动输入监控
 
@@ -199,22 +187,17 @@ class RealtimeCognitiveLoadDetector:
         current_confidence = 0.0
         
         try:
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    print("无法读取摄像头画面")
+            # 无界面模式下未到采样时刻的帧只 grab 不解码；预览模式解码每一帧用于显示
+            for _, frame, sampled in capture_loop(cap, self.sampler, decode_all=not headless):
+                if stop_event is not None and stop_event.is_set():
                     break
                 
-                # 添加帧到缓存
-                self.frame_buffer.append(frame.copy())
-                
-                # 每5秒进行一次预测
+                # 每 predict_interval 秒进行一次预测
                 current_time = time.time()
-                if (len(self.frame_buffer) >= self.frames_per_segment and 
-                    current_time - last_prediction_time >= self.predict_interval):
+                if sampled and self.sampler.ready and current_time - last_prediction_time >= self.predict_interval:
                     
-                    # 取最近的 frames_per_segment 帧
-                    frames_tensor = self.preprocess_frames(list(self.frame_buffer)[-self.frames_per_segment:])
+                    # 取最近一个片段的采样帧
+                    frames_tensor = self.preprocess_frames()
                     if frames_tensor is not None:
                         predicted_class, confidence = self.predict_cognitive_load(frames_tensor)
                         current_load = self.label_names[predicted_class]
@@ -239,24 +222,27 @@ class RealtimeCognitiveLoadDetector:
                         }
                         # print("结构化认知负荷与环境描述：", result)
 
+                        if on_result is not None:
+                            on_result(result)
                         yield result
 
                         self.input_monitor.reset()
                 
+                if headless or frame is None:
+                    continue
+                
                 # 在画面上显示结果
-                # 绘制检测框
-                if self.face_detector is not None:
-                    face_frame, face_box = self.detect_and_crop_face(frame)
-                    if face_box is not None:  # 检测到人脸
-                        x1, y1, x2, y2 = face_box
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                # 绘制跟踪器最近的人脸框（不再为预览单独检测）
+                if self.face_tracker is not None and self.face_tracker.box is not None:
+                    x1, y1, x2, y2 = self.face_tracker.box
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
                 
                 # 显示文本信息
                 cv2.putText(frame, f"Cognitive Load: {current_load}", (10, 30), 
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
                 cv2.putText(frame, f"Confidence: {current_confidence:.3f}", (10, 60), 
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (147,20,255), 2)
-                cv2.putText(frame, f"Buffer: {len(self.frame_buffer)}/{self.frames_per_segment}", (10, 90), 
+                cv2.putText(frame, f"Samples: {min(self.sampler.samples_taken + len(self.sampler.pending), self.sample_frames)}/{self.sample_frames}", (10, 90), 
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
                 
                 # 显示画面
@@ -265,11 +251,14 @@ class RealtimeCognitiveLoadDetector:
                 # 检查按键
                 if cv2.waitKey(1) & 0xFF == ord('q'):
                     break
+            else:
+                print("无法读取摄像头画面")
         
         finally:
             self.input_monitor.stop()
             cap.release()
-            cv2.destroyAllWindows()
+            if not headless:
+                cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     import os
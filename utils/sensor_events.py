@@ -0,0 +1,84 @@
+# utils/sensor_events.py
+import os
+import time
+import asyncio
+import threading
+from collections import Counter
+from typing import Optional, Set
+
+# 收到第一条变化通知后再等这么久，把同一批变化（键鼠统计和视觉结果常常前后脚到达）合并成一次处理
+SENSOR_DEBOUNCE_SECONDS = float(os.getenv("SENSOR_DEBOUNCE_SECONDS", 0.3))
+
+
+class SensorNotifier:
+    """
+    传感器线程（键鼠/窗口监控、视觉检测）与 asyncio 事件循环之间的桥梁。
+    notify() 可在任意线程中调用，通过 call_soon_threadsafe 唤醒等待中的 wait()；
+    事件循环还没处理上一次通知时，后续通知只记下来源，不会重复唤醒。
+    """
+    def __init__(self, debounce: float = SENSOR_DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        self.loop = None
+        self.event = None
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.first_pending_at = None
+        self.scheduled = False
+        self.counts = Counter()
+        self.reaction_seconds = {"last": 0.0, "max": 0.0, "total": 0.0}
+
+    def bind(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """在事件循环中调用一次，此后的通知会唤醒 wait()。"""
+        self.loop = loop or asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def notify(self, source: str):
+        """报告某个传感器的数据发生了变化（线程安全）。"""
+        with self.lock:
+            self.counts[f"notify_{source}"] += 1
+            self.pending.add(source)
+            if self.first_pending_at is None:
+                self.first_pending_at = time.monotonic()
+            if self.scheduled or self.loop is None:
+                return
+            self.scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:  # 事件循环已关闭
+            pass
+
+    async def wait(self, timeout: float) -> Set[str]:
+        """等待变化通知，返回发生变化的来源集合；超时（心跳）时返回空集合。"""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.counts["heartbeats"] += 1
+            return set()
+        if self.debounce > 0:
+            await asyncio.sleep(self.debounce)
+        self.event.clear()
+        with self.lock:
+            sources, self.pending = self.pending, set()
+            first_pending_at, self.first_pending_at = self.first_pending_at, None
+            self.scheduled = False
+        self.counts["wakeups"] += 1
+        if first_pending_at is not None:
+            reaction = time.monotonic() - first_pending_at
+            self.reaction_seconds["last"] = reaction
+            self.reaction_seconds["max"] = max(self.reaction_seconds["max"], reaction)
+            self.reaction_seconds["total"] += reaction
+        return sources
+
+    def stats(self) -> dict:
+        wakeups = self.counts["wakeups"]
+        return {
+            **dict(self.counts),
+            "debounce_seconds": self.debounce,
+            "reaction_ms_last": round(self.reaction_seconds["last"] * 1000, 1),
+            "reaction_ms_max": round(self.reaction_seconds["max"] * 1000, 1),
+            "reaction_ms_mean": round(self.reaction_seconds["total"] / wakeups * 1000, 1) if wakeups else 0.0,
+        }
+
+
+# 单例：传感器线程调用 notify()，主动服务循环等待通知
+sensor_notifier = SensorNotifier()
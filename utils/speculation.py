@@ -0,0 +1,170 @@
+# utils/speculation.py
+import os
+import time
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable, Optional
+from utils.helpers import log_message
+from utils.event_bus import bus_broker
+from utils.pending_requests import pending_requests, PENDING_REQUEST_GRACE_SECONDS
+
+# 为 "0" 时关闭预分析，接受询问时再分析
+SPECULATIVE_ANALYSIS = os.getenv("SPECULATIVE_ANALYSIS", "1") == "1"
+# 接受询问的 worker 不是发起预分析的那个时，最多等它这么久
+SPECULATION_REMOTE_WAIT_SECONDS = 30
+# 分析器出错时返回的兜底结果带有这个意图，不能当作预分析的结果使用
+ANALYSIS_FAILED_INTENT = "分析失败"
+
+
+def speculation_key(request_id: str) -> str:
+    return f"speculation:{request_id}"
+
+
+class SpeculativeAnalyzer:
+    """
+    主动询问发出的同时，在后台预先运行分析器（截图 + 视觉 LLM），结果随询问一起缓存在事件总线上。
+    用户接受时直接取用结果；询问被拒绝、超时或被挤出时取消预分析。
+    询问在其他 worker 上被接受时，本地的预分析照常完成（结果在总线上供那边取用），完成后丢弃本地条目；
+    询问有效期（加宽限期）过后仍留在本地的条目一律丢弃，不会累积。
+    统计预分析的命中率、节省的等待时间和浪费的分析时间。
+    """
+    def __init__(self, broker, requests, enabled: bool = SPECULATIVE_ANALYSIS):
+        self.broker = broker
+        self.bus = broker.bus
+        self.enabled = enabled
+        self.analyze = None
+        self.tasks = {}  # request_id -> {"task": 预分析任务, "started": 开始时间, "finished": 结束时间或 None}
+        self.metrics = Counter()
+        self.seconds = Counter()
+        requests.add_listener(self._on_request_closed)
+        broker.on_control("cancel_speculation", lambda command: self._cancel_local(command["request_id"], command["reason"]))
+        broker.on_control("release_speculation", lambda command: self._release_local(command["request_id"]))
+
+    def configure(self, analyze: Callable[..., Awaitable[dict]]):
+        """设置分析函数，以 analyze(context=...) 调用（由 web_app 绑定 llm 和工具配置）。"""
+        self.analyze = analyze
+
+    def start(self, request_id: str, context: dict, ttl: float):
+        if not self.enabled or self.analyze is None:
+            return
+        entry = {"task": asyncio.create_task(self._run(request_id, context, ttl)), "started": time.monotonic(), "finished": None}
+        entry["task"].add_done_callback(lambda _: entry.update(finished=time.monotonic()))
+        self.tasks[request_id] = entry
+        self.metrics["started"] += 1
+        # 到期时询问已经被记为“忽略”或由某个 worker 取走，本地条目不再有用
+        asyncio.get_running_loop().call_later(ttl + PENDING_REQUEST_GRACE_SECONDS, self._cancel_local, request_id, "expired", entry)
+
+    async def _run(self, request_id: str, context: dict, ttl: float) -> Optional[dict]:
+        key = speculation_key(request_id)
+        await self.bus.kv_set(key, {"status": "running"}, ttl=ttl + PENDING_REQUEST_GRACE_SECONDS)
+        start = time.monotonic()
+        try:
+            result = await self.analyze(context=context)
+        except asyncio.CancelledError:
+            await self.bus.kv_delete(key)
+            raise
+        except Exception as e:
+            log_message(f"Speculative analysis for {request_id} failed: {e}")
+            result = None
+        if not result or result.get("user_intent") == ANALYSIS_FAILED_INTENT:
+            self.metrics["failed"] += 1
+            await self.bus.kv_set(key, {"status": "failed"}, ttl=ttl + PENDING_REQUEST_GRACE_SECONDS)
+            return None
+        elapsed = time.monotonic() - start
+        log_message(f"Speculative analysis for {request_id} finished in {elapsed:.1f}s.")
+        await self.bus.kv_set(key, {"status": "done", "result": result, "seconds": elapsed}, ttl=ttl + PENDING_REQUEST_GRACE_SECONDS)
+        return result
+
+    async def take(self, request_id: str, context: dict) -> dict:
+        """
+        取出询问的分析结果。预分析已完成时直接返回；还在运行时等它完成；
+        没有可用的预分析时现场分析（记为未命中）。
+        """
+        result = None
+        local = self.tasks.pop(request_id, None)
+        if local is not None:
+            accepted_at = time.monotonic()
+            finished = local["finished"] is not None
+            try:
+                result = await local["task"]
+            except (asyncio.CancelledError, Exception):
+                result = None
+            if result is not None:
+                # 用户少等的时间：预分析在接受之前已经运行的部分
+                self.metrics["hits" if finished else "partial_hits"] += 1
+                self.seconds["saved"] += min(accepted_at, local["finished"]) - local["started"]
+        else:
+            result = await self._take_remote(request_id)
+        await self.bus.kv_delete(speculation_key(request_id))
+        if result is not None:
+            return result
+
+        self.metrics["misses"] += 1
+        return await self.analyze(context=context)
+
+    async def _take_remote(self, request_id: str) -> Optional[dict]:
+        """预分析在其他 worker 上运行：轮询总线上的状态。"""
+        deadline = time.monotonic() + SPECULATION_REMOTE_WAIT_SECONDS
+        waited = False
+        while True:
+            state = await self.bus.kv_get(speculation_key(request_id))
+            if state is None or state["status"] == "failed":
+                return None
+            if state["status"] == "done":
+                self.metrics["partial_hits" if waited else "hits"] += 1
+                self.seconds["saved"] += state["seconds"]
+                return state["result"]
+            if time.monotonic() >= deadline:
+                return None
+            waited = True
+            await asyncio.sleep(0.25)
+
+    def _on_request_closed(self, request_id: str, outcome: str):
+        if outcome == "accepted":
+            if request_id not in self.tasks:
+                # 由本 worker 的 take() 取用；预分析在另一个 worker 上时，让那边完成后丢弃本地条目
+                self.broker.send_control({"type": "release_speculation", "request_id": request_id})
+            return
+        if request_id in self.tasks:
+            self._cancel_local(request_id, outcome)
+        else:
+            # 预分析可能在另一个 worker 上运行
+            self.broker.send_control({"type": "cancel_speculation", "request_id": request_id, "reason": outcome})
+
+    def _release_local(self, request_id: str):
+        """询问已在其他 worker 上被接受：预分析完成后（结果已写到总线上）丢弃本地条目。"""
+        local = self.tasks.get(request_id)
+        if local is None:
+            return
+        if local["task"].done():
+            self._discard(request_id, local)
+        else:
+            local["task"].add_done_callback(lambda _: self._discard(request_id, local))
+
+    def _discard(self, request_id: str, entry: dict):
+        if self.tasks.get(request_id) is entry:
+            del self.tasks[request_id]
+
+    def _cancel_local(self, request_id: str, reason: str, entry: dict = None):
+        local = self.tasks.get(request_id)
+        if local is None or (entry is not None and local is not entry):
+            return
+        del self.tasks[request_id]
+        local["task"].cancel()
+        self.seconds["wasted"] += (local["finished"] or time.monotonic()) - local["started"]
+        self.metrics[f"cancelled_{reason}"] += 1
+
+    def stats(self) -> dict:
+        resolved = self.metrics["hits"] + self.metrics["partial_hits"] + self.metrics["misses"]
+        return {
+            "enabled": self.enabled,
+            "in_flight": sum(1 for entry in self.tasks.values() if entry["finished"] is None),
+            **dict(self.metrics),
+            "hit_rate": round((self.metrics["hits"] + self.metrics["partial_hits"]) / resolved, 3) if resolved else 0.0,
+            "seconds_saved": round(self.seconds["saved"], 2),
+            "seconds_wasted": round(self.seconds["wasted"], 2),
+        }
+
+
+# 单例：主动服务发起预分析，/request_assistance 取用结果
+speculative_analyzer = SpeculativeAnalyzer(bus_broker, pending_requests)
@@ -0,0 +1,82 @@
+# utils/synthetic_sensors.py
+import os
+import time
+import random
+import threading
+from datetime import datetime
+from utils.sensor_events import sensor_notifier
+
+# "live"（默认，真实的键鼠/窗口监控和摄像头检测）、"synthetic"（无摄像头、无显示器的机器上使用合成数据，例如压测）
+# 或 "replay"（重放录制的数据，见 utils/activity_trace.py）
+SENSOR_MODE = os.getenv("SENSOR_MODE", "live").lower()
+# 合成数据的用户画像："busy"（高负荷且几乎没有输入，会触发主动询问）、"calm"（低负荷、输入活跃）、"mixed"（每分钟切换一次）
+SYNTHETIC_SENSOR_PROFILE = os.getenv("SYNTHETIC_SENSOR_PROFILE", "mixed").lower()
+
+SYNTHETIC_WINDOW_TITLES = [
+    "main.py - CogAgent - Visual Studio Code",
+    "Terminal - pwsh.exe - Visual Studio Code",
+    "Google Chrome - LangChain AgentState Documentation",
+    "WeChat",
+    "Spotify - Now Playing",
+    "PowerPoint - 会议汇报.pptx",
+    "Word - 论文.docx",
+    "Outlook - 邮箱",
+    "Notepad++ - notes.txt",
+]
+
+
+def _current_profile() -> str:
+    if SYNTHETIC_SENSOR_PROFILE == "mixed":
+        return "busy" if int(time.time() // 60) % 2 == 0 else "calm"
+    return SYNTHETIC_SENSOR_PROFILE
+
+
+class _SyntheticTicker:
+    """按真实传感器的节奏（带抖动）发出变化通知。"""
+    source = None
+    interval = 2.0
+
+    def start(self):
+        self._stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._tick, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _tick(self):
+        while not self._stop_event.wait(self.interval * random.uniform(0.8, 1.2)):
+            sensor_notifier.notify(self.source)
+
+
+class SyntheticInputMonitor(_SyntheticTicker):
+    """与 InputWindowMonitor 接口相同，按画像随机生成键鼠频率和窗口标题。"""
+    source = "input"
+    interval = 2.0
+
+    def get_latest_data(self):
+        if _current_profile() == "busy":
+            keyboard_freq, mouse_freq = random.uniform(0.0, 0.4), random.uniform(0.0, 0.4)
+        else:
+            keyboard_freq, mouse_freq = random.uniform(3.0, 8.0), random.uniform(1.0, 4.0)
+        window_titles = random.sample(SYNTHETIC_WINDOW_TITLES, k=random.randint(3, 6))
+        return {
+            "keyboard_freq_hz": round(keyboard_freq, 1),
+            "mouse_freq_hz": round(mouse_freq, 1),
+            "open_apps_count": len(window_titles),
+            "window_titles": window_titles,
+        }
+
+
+class SyntheticCognitiveLoadDetector(_SyntheticTicker):
+    """与 CognitiveLoadThread 接口相同，按画像给出认知负荷结果。"""
+    source = "vision"
+    interval = 3.0
+
+    def get_latest_load(self):
+        busy = _current_profile() == "busy"
+        return {
+            "cognitive_load": "High Load" if busy else "Low Load",
+            "confidence": round(random.uniform(0.7, 0.95), 2),
+            "timestamp": datetime.now().strftime("%H:%M:%S"),
+        }
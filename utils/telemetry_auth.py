@@ -0,0 +1,54 @@
+# utils/telemetry_auth.py
+"""
+远程遥测的令牌：每个用户的令牌是 HMAC-SHA256(TELEMETRY_SECRET, user_id)，服务器不需要保存令牌列表。
+客户端代理用它上报 /telemetry，用户用它订阅自己的 /listen；/telemetry/stats 需要密钥本身（运维令牌）。
+未设置 TELEMETRY_SECRET 时远程遥测关闭，上述请求一律拒绝。
+
+为用户签发令牌（在服务器上，使用相同的 TELEMETRY_SECRET）：
+
+    python -m utils.telemetry_auth alice
+"""
+import os
+import sys
+import hmac
+import hashlib
+from typing import Optional
+
+TELEMETRY_SECRET = os.getenv("TELEMETRY_SECRET", "")
+
+
+class TelemetryAuthError(ValueError):
+    """令牌缺失或不匹配；status 为返回给客户端的 HTTP 状态码。"""
+    def __init__(self, message: str, status: int = 401):
+        super().__init__(message)
+        self.status = status
+
+
+def telemetry_token(user_id: str, secret: str = TELEMETRY_SECRET) -> str:
+    return hmac.new(secret.encode("utf-8"), user_id.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def bearer_token(authorization: Optional[str]) -> str:
+    """从 Authorization: Bearer <令牌> 头中取出令牌，没有时返回空字符串。"""
+    scheme, _, token = (authorization or "").partition(" ")
+    return token.strip() if scheme.lower() == "bearer" else ""
+
+
+def authorize(token: Optional[str], user_id: Optional[str] = None, secret: str = TELEMETRY_SECRET):
+    """
+    校验令牌：指定 user_id 时必须是该用户的令牌，否则必须是运维令牌（密钥本身）。
+    不通过时抛出 TelemetryAuthError（缺少令牌 401，令牌不匹配 403，服务器未配置密钥 503）。
+    """
+    if not secret:
+        raise TelemetryAuthError("Remote telemetry is disabled (TELEMETRY_SECRET is not set).", 503)
+    if not token:
+        raise TelemetryAuthError("Missing telemetry token.", 401)
+    expected = telemetry_token(user_id, secret) if user_id is not None else secret
+    if not hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8")):
+        raise TelemetryAuthError("Invalid telemetry token" + (f" for user_id '{user_id}'." if user_id is not None else "."), 403)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or not TELEMETRY_SECRET:
+        sys.exit("usage: TELEMETRY_SECRET=... python -m utils.telemetry_auth <user_id>")
+    print(telemetry_token(sys.argv[1]))
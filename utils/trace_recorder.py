@@ -0,0 +1,135 @@
+# utils/trace_recorder.py
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict, Counter
+from datetime import datetime
+from utils.helpers import log_message
+from utils.pending_requests import pending_requests
+from utils.activity_trace import write_chunk, trace_files
+
+# 录制数据的目录；为空时（默认）不录制
+TRACE_RECORD_DIR = os.getenv("TRACE_RECORD_DIR", "")
+# 攒够这么多条读数（每 5 秒左右一条，约 1 小时）或分块覆盖的时间超过 TRACE_CHUNK_SECONDS 时写成一个分块；进程异常退出时最多丢失一个分块
+TRACE_CHUNK_SAMPLES = int(os.getenv("TRACE_CHUNK_SAMPLES", 720))
+TRACE_CHUNK_SECONDS = float(os.getenv("TRACE_CHUNK_SECONDS", 600))
+# 保留上限：总字节数超出或分块早于保留天数时，从最旧的分块开始删除
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", 200 * 1024 * 1024))
+TRACE_RETENTION_DAYS = float(os.getenv("TRACE_RETENTION_DAYS", 14))
+# 记住最近发出的这么多个询问，只记录它们的结果
+MAX_TRACKED_INQUIRIES = 1000
+
+
+class TraceRecorder:
+    """
+    录制本机用户的读数（键鼠/窗口统计和视觉认知负荷，即主动服务循环看到的每一条读数）
+    以及询问、询问结果和手动求助事件，按列攒成分块后写成压缩的 NPZ 文件（格式见 utils/activity_trace.py）。
+    录制的数据可用 SENSOR_MODE=replay 重放，或用 utils/proactive_replay.py 离线评估评分模型。
+    多 worker 部署时只记录本 worker 发出的询问的结果。
+    """
+    def __init__(self, requests, directory: str = TRACE_RECORD_DIR, chunk_samples: int = TRACE_CHUNK_SAMPLES,
+                 chunk_seconds: float = TRACE_CHUNK_SECONDS, max_bytes: int = TRACE_MAX_BYTES,
+                 retention_days: float = TRACE_RETENTION_DAYS):
+        self.directory = os.path.abspath(directory) if directory else None
+        self.chunk_samples = chunk_samples
+        self.chunk_seconds = chunk_seconds
+        self.max_bytes = max_bytes
+        self.retention_seconds = retention_days * 86400
+        self.samples = []
+        self.events = []  # (时刻, 类型, 询问ID)
+        self.chunk_started_at = None
+        self.issued = OrderedDict()  # 本 worker 发出的询问ID
+        self.file_lock = threading.Lock()
+        self.counts = Counter()
+        if self.directory:
+            requests.add_listener(self.record_outcome)
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    async def record(self, activity: dict, at: float = None):
+        """记录一条读数；当前分块攒满或覆盖的时间足够长时写盘。"""
+        if not self.enabled:
+            return
+        at = time.time() if at is None else at
+        self.samples.append({
+            "t": at,
+            "keyboard_freq_hz": activity.get("keyboard_freq_hz", 0.0),
+            "mouse_freq_hz": activity.get("mouse_freq_hz", 0.0),
+            "open_apps_count": activity.get("open_apps_count", 0),
+            "window_titles": list(activity.get("window_titles", [])),
+            "cognitive_load": activity.get("cognitive_load", "waiting..."),
+            "confidence": activity.get("confidence", 0.0),
+        })
+        self.counts["samples"] += 1
+        if self.chunk_started_at is None:
+            self.chunk_started_at = at
+        if len(self.samples) >= self.chunk_samples or at - self.chunk_started_at >= self.chunk_seconds:
+            await self.flush()
+
+    def record_event(self, kind: str, request_id: str = "", at: float = None):
+        """记录一个事件："inquiry"（发出询问）、询问结果（"accepted" 等）或 "manual_request"（用户手动求助）。"""
+        if not self.enabled:
+            return
+        self.events.append((time.time() if at is None else at, kind, request_id or ""))
+        self.counts[f"events_{kind}"] += 1
+        if kind == "inquiry":
+            self.issued[request_id] = None
+            while len(self.issued) > MAX_TRACKED_INQUIRIES:
+                self.issued.popitem(last=False)
+
+    def record_outcome(self, request_id: str, outcome: str):
+        """pending_requests 的回调：本 worker 发出的询问得出结果时记录。"""
+        if request_id in self.issued:
+            del self.issued[request_id]
+            self.record_event(outcome, request_id)
+
+    async def flush(self):
+        """把当前分块写盘（在线程中执行，不阻塞事件循环）。"""
+        if not self.enabled or not (self.samples or self.events):
+            return
+        samples, events = self.samples, self.events
+        self.samples, self.events, self.chunk_started_at = [], [], None
+        try:
+            await asyncio.to_thread(self._write, samples, events)
+        except OSError as e:
+            self.counts["write_errors"] += 1
+            log_message(f"Failed to write activity trace chunk: {e}")
+
+    def _write(self, samples: list, events: list):
+        with self.file_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            started = samples[0]["t"] if samples else events[0][0]
+            path = os.path.join(self.directory, f"trace-{datetime.fromtimestamp(started):%Y%m%d-%H%M%S-%f}.npz")
+            self.counts["chunk_bytes"] += write_chunk(path, samples, events)
+            self.counts["chunks_written"] += 1
+            self._enforce_retention()
+
+    def _enforce_retention(self):
+        files = [(path, os.path.getsize(path), os.path.getmtime(path)) for path in trace_files(self.directory)]
+        total = sum(size for _, size, _ in files)
+        cutoff = time.time() - self.retention_seconds
+        for path, size, modified in files[:-1]:  # 最新的分块总是保留
+            if total <= self.max_bytes and modified >= cutoff:
+                break
+            os.remove(path)
+            total -= size
+            self.counts["chunks_deleted"] += 1
+
+    async def close(self):
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "buffered_samples": len(self.samples),
+            "buffered_events": len(self.events),
+            **dict(self.counts),
+        }
+
+
+# 单例：主动服务循环和 web_app 使用
+trace_recorder = TraceRecorder(pending_requests)
@@ -5,18 +5,17 @@ import json
 import uuid
 import base64
 import asyncio
-import tempfile
 import threading
 import traceback
 from functools import partial
 from quart import Quart, render_template, request, jsonify, Response
+from werkzeug.exceptions import RequestEntityTooLarge
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, SystemMessage, ToolMessage
 
 from utils.activity_monitor import monitor
 from utils.face_thread import visual_detector
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
 
 # --- 路径和模块导入 ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -25,15 +24,28 @@ sys.path.append(project_root)
 
 from datetime import datetime
 from state import AgentState
-from agents.planner import run_planner
+from agents.planner import run_planner, MAX_FILE_CONTENT_CHARS
 from agents.tool_manager import run_tool_manager
 from agents.user_state_modeler import UserStateModeler
 from agents.memory_agent import run_memory_agent
 from proactive_service import proactive_monitoring_loop
+from telemetry_service import telemetry_service, decode_batch, TelemetryError, MAX_TELEMETRY_BODY_BYTES
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from utils.mcp_config_loader import load_mcp_servers_config
 from utils.helpers import setup_logging, load_user_habits, log_message, get_real_time_user_activity
+from utils.attachment_store import attachment_store
+from utils.telemetry_auth import authorize, bearer_token, TelemetryAuthError
+from utils.document_extractor import extract_attachment_text, EXTRACT_FULL_IN_BACKGROUND
+from utils.document_index import document_index_store
+from utils.image_ingest import image_ingestor
+from utils.event_broker import event_broker, format_sse, LOCAL_USER_ID
+from utils.event_bus import event_bus, bus_broker
+from utils.pending_requests import pending_requests, run_sweeper
+from utils.speculation import speculative_analyzer
+from utils.job_manager import job_manager, JobQueueFull, MAX_JOB_WAIT_SECONDS
+from utils.sensor_events import sensor_notifier
+from utils.trace_recorder import trace_recorder
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -45,18 +57,21 @@ executable_tools = {} # <--- 将executable_tools设为全局变量
 core_agent_app = None
 memory_agent = None
 SESSIONS = {}
-message_queue = asyncio.Queue()
-pending_assistance_requests = {}
 SESSIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
 
 # --- 消息序列化和反序列化辅助函数 ---
 def message_to_dict(message: BaseMessage) -> dict:
     return message.to_json()
 
+_MESSAGE_CLASS_TYPES = {"HumanMessage": "human", "AIMessage": "ai", "ToolMessage": "tool", "SystemMessage": "system"}
+
 def dict_to_message(data: dict) -> BaseMessage:
+    # message.to_json() 输出的是 LangChain 的序列化格式，字段在 kwargs 里
+    if data.get("type") == "constructor":
+        data = {**data.get("kwargs", {}), "type": _MESSAGE_CLASS_TYPES.get(data.get("id", [""])[-1])}
     message_type = data.get("type")
     content = data.get("content")
-    if message_type == "human": return HumanMessage(content=content)
+    if message_type == "human": return HumanMessage(content=content, additional_kwargs=data.get("additional_kwargs", {}))
     if message_type == "ai": return AIMessage(content=content, tool_calls=data.get("tool_calls", []))
     if message_type == "tool": return ToolMessage(content=content, tool_call_id=data.get("tool_call_id"))
     if message_type == "system": return SystemMessage(content=content)
@@ -92,7 +107,7 @@ def initialize_system():
     #     azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
     #     azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"), 
     # )
-    llm = ChatOpenAI(model='gemini-2.5-pro', temperature=0)
+    llm = ChatOpenAI(model=os.getenv("LLM_MODEL", 'gemini-2.5-pro'), temperature=0)
 
     user_habits = load_user_habits()
     workflow = StateGraph(AgentState)
@@ -200,100 +215,176 @@ async def save_session_state(session_id: str, state: dict): # 1. 改为 async de
 
 # --- 在全局作用域执行初始化和后台线程启动 ---
 initialize_system()
+speculative_analyzer.configure(partial(UserStateModeler.analyze_user_context_and_suggest, llm=llm, tools_config=tools_config))
 app = Quart(__name__)
 
 @app.before_serving
 async def startup_background_tasks():
     print("--- Starting background tasks ---")
+    bus_broker.start()
+    job_manager.start()
+    # 每个 worker 都启动监控循环，但只有拿到领导者锁的那个真正采集数据和发出询问
     app.add_background_task(
         proactive_monitoring_loop,
         sessions_dict=SESSIONS,
-        msg_queue=message_queue,
-        request_cache=pending_assistance_requests
+        broker=bus_broker,
+        bus=event_bus,
+        request_cache=pending_requests,
+        speculator=speculative_analyzer,
+        notifier=sensor_notifier,
+        recorder=trace_recorder
     )
-    
+    app.add_background_task(run_sweeper, pending_requests)
+
+@app.after_serving
+async def shutdown_background_tasks():
+    await job_manager.stop()
+    await bus_broker.stop()
+    await trace_recorder.close()
+
 # --- 路由定义 ---
 @app.route('/')
 async def index():
     return await render_template('index.html')
 
+async def read_chat_request():
+    """
+    解析 /chat 请求。
+    优先接受流式 multipart 上传（文件边读边写入附件存储），兼容旧的 Base64 JSON 格式。
+    返回 (用户文本, 会话ID, 附件引用或None)。
+    """
+    if request.mimetype == "multipart/form-data":
+        form = await request.form
+        files = await request.files
+        upload = files.get("file")
+        file_type = form.get("file_type", "document")
+        file_ref = None
+        if upload and upload.filename:
+            if file_type == "image":
+                # 图片先经过接入阶段（缩小、重新编码、去重），只保存处理后的版本
+                image_bytes = await asyncio.to_thread(upload.stream.read)
+                file_ref = await asyncio.to_thread(image_ingestor.ingest, image_bytes, upload.filename)
+            else:
+                file_ref = await asyncio.to_thread(attachment_store.put_stream, upload.stream, upload.filename, upload.mimetype)
+            file_ref["type"] = file_type
+        return form.get("message", ""), form.get("session_id", "default_session"), file_ref
+
+    data = await request.get_json()
+    file_data = data.get("file")
+    file_ref = None
+    if file_data and file_data.get("content"):
+        decoded_bytes = base64.b64decode(file_data["content"])
+        if file_data.get("type") == "image":
+            file_ref = await asyncio.to_thread(image_ingestor.ingest, decoded_bytes, file_data.get("name", ""))
+        else:
+            file_ref = await asyncio.to_thread(attachment_store.put_bytes, decoded_bytes, file_data.get("name", ""), "")
+        file_ref["type"] = file_data.get("type", "document")
+    return data.get("message", ""), data.get("session_id", "default_session"), file_ref
+
+async def run_agent_turn(job, state: dict) -> dict:
+    """运行主对话工作流，每个节点执行完都通过任务进度上报一次。"""
+    final_state = state
+    async for mode, chunk in core_agent_app.astream(state, {"recursion_limit": 10}, stream_mode=["updates", "values"]):
+        if mode == "updates":
+            job_manager.report_progress(job, f"{', '.join(chunk)} finished")
+        else:
+            final_state = chunk
+    return final_state
+
+async def run_session_turn(job, session_id: str, state: dict, message: HumanMessage) -> dict:
+    """
+    把用户消息追加到会话并运行一轮工作流，成功后保存会话。
+    任务被取消或超时时撤回这条消息，会话中不会留下没有回复的用户输入。
+    """
+    state['messages'].append(message)
+    try:
+        final_state = await run_agent_turn(job, state)
+    except asyncio.CancelledError:
+        for i in range(len(state['messages']) - 1, -1, -1):
+            if state['messages'][i] is message:
+                del state['messages'][i]
+                break
+        raise
+    await save_session_state(session_id, final_state)
+    return final_state
+
+def job_accepted(job):
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+async def run_chat_job(job, user_input_text: str, session_id: str, file_ref):
+    image_savings = None
+    current_state = await get_session_state(session_id)
+
+    # --- 根据附件类型决定如何构建 HumanMessage ---
+    if file_ref and file_ref.get('type') == 'image':
+        # --- 场景一：附件是图片（来自粘贴） ---
+        # 消息中只保存附件引用，发送给视觉模型前再由 planner 解析为 data URL
+        ingest_info = file_ref.get('ingest')
+        if ingest_info:
+            image_savings = {
+                # 去重命中时没有写入任何新数据
+                "bytes_saved": ingest_info['original_bytes'] if ingest_info['deduped'] else ingest_info['original_bytes'] - ingest_info['bytes'],
+                "tokens_saved": ingest_info['tokens_before'] - ingest_info['tokens_after'],
+                "deduped": ingest_info['deduped']
+            }
+            log_message(f"Image ingest for session {session_id}: {ingest_info}. Totals: {image_ingestor.stats()}")
+        print(f"Processing a pasted image ({file_ref['size']} bytes, ref {file_ref['ref'][:12]})...")
+        multimodal_content = [
+            {"type": "text", "text": user_input_text},
+            {"type": "image_url", "image_url": {"url": file_ref['url'], "mime": file_ref.get('mime') or "image/png"}}
+        ]
+        message = HumanMessage(content=multimodal_content, additional_kwargs={"image": file_ref})
+
+    else:
+        # --- 场景二：附件是文档（来自文件上传）或没有附件 ---
+        extracted_text_content = None
+        if file_ref:
+            job_manager.report_progress(job, "extracting document")
+            # 上传时立即为文档建立分块检索索引：大 PDF 先用提前停止得到的部分文本建索引，
+            # 开启 EXTRACT_FULL_IN_BACKGROUND 时，后台全文解析完成后再替换为完整索引；后续提问直接复用
+            index_full_text = partial(document_index_store.put, file_ref['ref'], complete=True)
+            extracted_text_content = await extract_attachment_text(
+                file_ref, max_chars=MAX_FILE_CONTENT_CHARS, full_in_background=EXTRACT_FULL_IN_BACKGROUND, on_full_text=index_full_text
+            )
+            if document_index_store.get(file_ref['ref']) is None:
+                await asyncio.to_thread(document_index_store.put, file_ref['ref'], extracted_text_content, False)
+            print(f"Extracted text from '{file_ref.get('name')}'. Content length: {len(extracted_text_content)} chars.")
+
+        additional_context = {}
+        if file_ref:
+            additional_context['file'] = {
+                "name": file_ref.get('name'),
+                "ref": file_ref['ref'], # 附件引用，工具和 planner 按需解析
+                "url": file_ref['url'],
+                "mime": file_ref.get('mime'),
+                "size": file_ref.get('size'),
+                # 只随消息保存有限长度的文本，完整内容由文档索引提供
+                "text_content": extracted_text_content[:MAX_FILE_CONTENT_CHARS] if extracted_text_content else extracted_text_content
+            }
+
+        # 1. 'content' 只包含用户的纯文本输入
+        # 2. 所有附加信息都放入 'additional_kwargs'
+        message = HumanMessage(content=user_input_text, additional_kwargs=additional_context)
+
+    final_state = await run_session_turn(job, session_id, current_state, message)
+    response_data = {"response": final_state['messages'][-1].content}
+    if image_savings:
+        response_data["image_savings"] = image_savings
+    return response_data
+
 @app.route('/chat', methods=['POST'])
 async def chat():
+    """
+    提交一轮对话。上传在请求内完成，文档提取和工作流运行作为任务异步执行，
+    立即返回 202 和任务ID，结果通过 /listen 的 job_update 事件或 /jobs/<job_id> 获取。
+    """
+    if not core_agent_app: return jsonify({"error": "Agent is not ready."}), 503
     try:
-        data = await request.get_json()
-        user_input_text = data.get('message', '') # 确保有默认值
-        session_id = data.get('session_id', 'default_session')
-        file_data = data.get('file')
-        
-        current_state = await get_session_state(session_id)
-        
-        # --- 根据附件类型决定如何构建 HumanMessage ---
-        if file_data and file_data.get('type') == 'image':
-            # --- 场景一：附件是图片（来自粘贴） ---
-            print("Processing a pasted image...")
-            multimodal_content = [
-                {"type": "text", "text": user_input_text},
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{file_data['content']}"}}
-            ]
-            current_state['messages'].append(HumanMessage(content=multimodal_content))
-            
-        else:
-            # --- 场景二：附件是文档（来自文件上传）或没有附件 ---
-            extracted_text_content = None
-            if file_data and file_data.get('content'):
-                file_name = file_data.get('name', '')
-                file_extension = os.path.splitext(file_name)[1].lower()
-                
-                try:
-                    decoded_bytes = base64.b64decode(file_data['content'])
-                    
-                    # 对于非纯文本格式，我们需要将其写入临时文件
-                    if file_extension not in [".txt", ".md", ".py", ".json", ".html", ".css", ".csv"]:
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-                            temp_file.write(decoded_bytes)
-                            temp_file_path = temp_file.name
-                    
-                    loader = None
-                    if file_extension == ".pdf":
-                        loader = PyPDFLoader(temp_file_path)
-                    elif file_extension == ".docx":
-                        loader = Docx2txtLoader(temp_file_path)
-                    elif file_extension in [".txt", ".md", ".py", ".json", ".html", ".css", ".csv"]:
-                        extracted_text_content = decoded_bytes.decode('utf-8', errors='ignore')
-                    else:
-                        extracted_text_content = f"错误：不支持的文件类型 '{file_extension}'。我只能读取 .pdf, .docx, 和纯文本文件。"
-
-                    if loader:
-                        print(f"Using {type(loader).__name__} for file: {file_name}")
-                        documents = await asyncio.to_thread(loader.load) # 异步执行IO密集型操作
-                        extracted_text_content = "\n\n".join([doc.page_content for doc in documents])
-                        os.unlink(temp_file_path) # 清理临时文件
-                    
-                    print(f"Successfully extracted text from '{file_name}'. Content length: {len(extracted_text_content)} chars.")
-
-                except Exception as e:
-                    print(f"Error processing file content for file '{file_name}': {e}")
-                    extracted_text_content = f"错误：处理文件 '{file_name}' 时发生异常: {e}"
-        
-            additional_context = {}
-            if file_data:
-                additional_context['file'] = {
-                    "name": file_data.get('name'),
-                    "content": file_data.get('content'), # Base64 content for tools
-                    "text_content": extracted_text_content # Decoded text for LLM
-                }
-
-            current_state = await get_session_state(session_id)
-            # 1. 'content' 只包含用户的纯文本输入
-            # 2. 所有附加信息都放入 'additional_kwargs'
-            current_state['messages'].append(
-                HumanMessage(content=user_input_text, additional_kwargs=additional_context)
-            )
-        
-        final_state = await core_agent_app.ainvoke(current_state, {"recursion_limit": 10})
-        await save_session_state(session_id, final_state)
-        return jsonify({"response": final_state['messages'][-1].content})
-        
+        user_input_text, session_id, file_ref = await read_chat_request()
+        job = job_manager.submit("chat", session_id, partial(run_chat_job, user_input_text=user_input_text, session_id=session_id, file_ref=file_ref))
+        return job_accepted(job)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"An error occurred: {e}"}), 500
@@ -301,68 +392,158 @@ async def chat():
 
 @app.route('/listen')
 async def listen():
+    # 每个连接独立订阅，带上 session_id 才能收到发给该会话的询问；
+    # 带 user_id 时收到的是该远程用户（由 /telemetry 上报）的状态和询问，否则是本机用户的；
+    # 远程用户需要用 token 参数（或 Authorization: Bearer 头）证明身份，只能订阅自己的数据。
+    # 浏览器自动重连时带 Last-Event-ID 头；页面手动重建连接时用 last_event_id 参数
+    session_id = request.args.get("session_id")
+    user_id = request.args.get("user_id") or LOCAL_USER_ID
+    if user_id != LOCAL_USER_ID:
+        try:
+            authorize(request.args.get("token") or bearer_token(request.headers.get("Authorization")), user_id)
+        except TelemetryAuthError as e:
+            return jsonify({"error": str(e)}), e.status
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    subscriber = event_broker.subscribe(session_id, last_event_id, user_id)
     async def event_stream():
-        while True:
-            try:
-                message = await message_queue.get()
-                yield f"data: {json.dumps(message)}\n\n"
-            except asyncio.CancelledError:
-                break
+        try:
+            while True:
+                event_id, message = await subscriber.get()
+                yield format_sse(event_id, message)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            event_broker.unsubscribe(subscriber)
     return Response(event_stream(), mimetype="text/event-stream")
 
-@app.route('/request_assistance', methods=['POST'])
-async def request_assistance():
-    if not core_agent_app: return jsonify({"error": "Agent is not ready."}), 503
+@app.route('/telemetry', methods=['POST'])
+async def ingest_telemetry():
+    """
+    客户端代理批量上报远程用户的活动和认知负荷数据（可用 Content-Encoding: gzip 压缩）。
+    需要 Authorization: Bearer <该用户的令牌>，批次只能上报令牌所属用户的数据。
+    """
     try:
-        data = await request.get_json()
-        request_id, session_id = data.get("request_id"), data.get("session_id")
-        if not session_id: return jsonify({"error": "No active session ID provided."}), 400
-        context_to_process = pending_assistance_requests.pop(request_id, None)
-        if not context_to_process: return jsonify({"error": "Invalid or expired assistance request."}), 404
+        token = bearer_token(request.headers.get("Authorization"))
+        if not token:
+            authorize(token)  # 缺少令牌（或未配置密钥）时不读取请求体
+        # 先按 Content-Length 拒绝过大的请求体，不把它读进内存；没有 Content-Length（分块传输）时读取到上限为止
+        if request.content_length is not None and request.content_length > MAX_TELEMETRY_BODY_BYTES:
+            raise TelemetryError(f"Telemetry payload exceeds {MAX_TELEMETRY_BODY_BYTES} bytes.", 413)
+        request.max_content_length = MAX_TELEMETRY_BODY_BYTES
+        try:
+            body = await request.get_data()
+        except RequestEntityTooLarge:
+            # 与其他拒绝一样计数并返回 JSON，而不是 Quart 自己的 413 页面
+            raise TelemetryError(f"Telemetry payload exceeds {MAX_TELEMETRY_BODY_BYTES} bytes.", 413)
+        batch = decode_batch(body, request.headers.get("Content-Encoding", ""))
+        authorize(token, batch["user_id"])
+    except (TelemetryError, TelemetryAuthError) as e:
+        telemetry_service.record_rejected(e)
+        return jsonify({"error": str(e)}), e.status
+    return jsonify(await telemetry_service.ingest(batch, SESSIONS))
+
+@app.route('/telemetry/stats')
+async def telemetry_stats():
+    """接收统计，需要运维令牌（Authorization: Bearer <TELEMETRY_SECRET>）。"""
+    try:
+        authorize(bearer_token(request.headers.get("Authorization")))
+    except TelemetryAuthError as e:
+        return jsonify({"error": str(e)}), e.status
+    return jsonify(telemetry_service.stats())
+
+@app.route('/listen/stats')
+async def listen_stats():
+    return jsonify({**event_broker.stats(), "bus": bus_broker.stats(), "sensors": sensor_notifier.stats(),
+                    "recorder": trace_recorder.stats()})
 
-        # 1. 调用 Analyzer Agent 进行分析
+async def run_assistance_job(job, session_id: str, context: dict, handoff_intro: str, closing: str, request_id: str = None):
+    """
+    分析用户当前情况，并把分析结果作为 Handoff 消息交给主工作流执行。
+    来自主动询问（带 request_id）时优先取用询问发出时就开始的预分析结果。
+    """
+    # 1. 调用 Analyzer Agent 进行分析
+    job_manager.report_progress(job, "analyzing")
+    if request_id:
+        analysis_result = await speculative_analyzer.take(request_id, context)
+        log_message(f"Speculative analysis stats: {speculative_analyzer.stats()}")
+    else:
         analysis_result = await UserStateModeler.analyze_user_context_and_suggest(
-            context=context_to_process,
+            context=context,
             llm=llm, # 使用全局的、支持视觉的LLM
             tools_config=tools_config # 传递可用的工具
         )
 
-        # 如果分析失败或没有建议，也返回一个完整的结构
-        if not analysis_result or (not analysis_result.get("recommended_tool") and not analysis_result.get("suggestion_text")):
-            error_msg = analysis_result.get("suggestion_text", "分析失败，无法提供建议。")
-            return jsonify({
-                "analysis_message": "系统分析完成。",
-                "response": error_msg
-            })
-        
-        # 2. 基于分析结果，构建一个清晰的 "Handoff" 消息给主Agent
-        handoff_prompt = f"""
-我刚刚确认需要帮助。我的主动式助理分析了我的情况，并给出了以下建议：
+    # 如果分析失败或没有建议，也返回一个完整的结构
+    if not analysis_result or (not analysis_result.get("recommended_tool") and not analysis_result.get("suggestion_text")):
+        error_msg = analysis_result.get("suggestion_text", "分析失败，无法提供建议。")
+        return {"analysis_message": "系统分析完成。", "response": error_msg}
+
+    # 2. 基于分析结果，构建一个清晰的 "Handoff" 消息给主Agent
+    handoff_prompt = f"""
+{handoff_intro}
 
 - **它认为我正在做**: {analysis_result['user_intent']}
 - **它建议的操作**: {analysis_result['suggestion_text']}
-- **它建议使用的工具**: `{analysis_result['recommended_tool']}`
+- **它建议使用的工具**: `{analysis_result.get('recommended_tool', '无')}`
 - **理由**: {analysis_result['reasoning']}
 
-请根据这个建议继续操作。如果这是一个工具调用，请直接准备并执行它。
+{closing}
 """
 
-        # 3. 将这个 Handoff 消息作为用户的最新输入，送入主工作流
-        state = await get_session_state(session_id)
-        state['messages'].append(HumanMessage(content=handoff_prompt))
-        
-        final_state = await core_agent_app.ainvoke(state, {"recursion_limit": 10})
-        await save_session_state(session_id, final_state)
+    # 3. 将这个 Handoff 消息作为用户的最新输入，送入主工作流
+    state = await get_session_state(session_id)
+    final_state = await run_session_turn(job, session_id, state, HumanMessage(content=handoff_prompt))
+
+    return {
+        "analysis_message": f"系统分析完成，建议: {analysis_result['suggestion_text']}\n理由: {analysis_result['reasoning']}",
+        "response": final_state['messages'][-1].content
+    }
+
+@app.route('/request_assistance', methods=['POST'])
+async def request_assistance():
+    if not core_agent_app: return jsonify({"error": "Agent is not ready."}), 503
+    try:
+        data = await request.get_json()
+        request_id, session_id = data.get("request_id"), data.get("session_id")
+        if not session_id: return jsonify({"error": "No active session ID provided."}), 400
+        # 询问上下文存放在事件总线上，哪个 worker 处理这个请求都能取到；过期的询问已被记为“忽略”
+        context_to_process = await pending_requests.pop(request_id, "accepted") if request_id else None
+        if not context_to_process: return jsonify({"error": "Invalid or expired assistance request."}), 404
+
+        job = job_manager.submit("assistance", session_id, partial(
+            run_assistance_job, session_id=session_id, context=context_to_process, request_id=request_id,
+            handoff_intro="我刚刚确认需要帮助。我的主动式助理分析了我的情况，并给出了以下建议：",
+            closing="请根据这个建议继续操作。如果这是一个工具调用，请直接准备并执行它。"
+        ))
+        return job_accepted(job)
 
-        return jsonify({
-                "analysis_message": f"系统分析完成，建议: {analysis_result['suggestion_text']}\n理由: {analysis_result['reasoning']}",
-                "response": final_state['messages'][-1].content
-            })
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"An error occurred: {e}"}), 500
 
+@app.route('/decline_assistance', methods=['POST'])
+async def decline_assistance():
+    """用户拒绝主动询问：取出并丢弃缓存的上下文，记录为“拒绝”（同时取消该询问的预分析）。"""
+    try:
+        data = await request.get_json()
+        request_id = data.get("request_id")
+        if not request_id: return jsonify({"error": "No request ID provided."}), 400
+        context = await pending_requests.pop(request_id, "declined")
+        return jsonify({"request_id": request_id, "declined": context is not None})
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"An error occurred: {e}"}), 500
 
+@app.route('/assistance/stats')
+async def assistance_stats():
+    return jsonify({**pending_requests.stats(), "speculation": speculative_analyzer.stats()})
+
 @app.route('/manual_trigger_assistance', methods=['POST'])
 async def manual_trigger_assistance():
     """
@@ -379,6 +560,7 @@ async def manual_trigger_assistance():
             return jsonify({"error": "No session ID provided."}), 400
 
         log_message(f"--- User manually triggered DIRECT assistance for session: {session_id} ---")
+        trace_recorder.record_event("manual_request")
 
         # 2. 立即获取当前的用户活动状态，以构建上下文
         current_activity = await asyncio.to_thread(get_real_time_user_activity)
@@ -398,50 +580,34 @@ async def manual_trigger_assistance():
             "activity_log": [{"timestamp": datetime.now().isoformat(), "activity": current_activity}]
         }
 
-        # 4. 【核心】直接调用 Analyzer Agent (UserStateModeler) 进行分析
-        analysis_result = await UserStateModeler.analyze_user_context_and_suggest(
-            context=context_to_analyze,
-            llm=llm,
-            tools_config=tools_config
-        )
-
-        if not analysis_result or (analysis_result.get("recommended_tool") is None and not analysis_result.get("suggestion_text")):
-            # 如果分析失败或没有任何建议
-            error_msg = analysis_result.get("suggestion_text", "分析失败，无法提供建议。")
-            return jsonify({"analysis_message": "系统分析完成。", "final_response": error_msg})
-
-        # 5. 构建 Handoff 消息并送入主工作流 (与 /request_assistance 路由后半部分完全相同)
-        handoff_prompt = f"""
-用户刚刚手动请求了帮助。我的主动式助理分析了用户当前的情况，并给出了以下建议：
-
-- **它认为我正在做**: {analysis_result['user_intent']}
-- **它建议的操作**: {analysis_result['suggestion_text']}
-- **它建议使用的工具**: `{analysis_result.get('recommended_tool', '无')}`
-- **理由**: {analysis_result['reasoning']}
-
-请根据这个建议继续操作。
-"""
-        state = await get_session_state(session_id)
-        state['messages'].append(HumanMessage(content=handoff_prompt))
-        
-        final_state = await core_agent_app.ainvoke(state, {"recursion_limit": 10})
-        await save_session_state(session_id, final_state)
-
-        # 6. 返回分析消息和最终执行结果
-        return jsonify({
-            "analysis_message": f"系统分析完成，建议: {analysis_result['suggestion_text']}\n理由: {analysis_result['reasoning']}",
-            "final_response": final_state['messages'][-1].content
-        })
+        # 4. 分析和执行（与 /request_assistance 相同）作为任务异步运行
+        job = job_manager.submit("manual_assistance", session_id, partial(
+            run_assistance_job, session_id=session_id, context=context_to_analyze,
+            handoff_intro="用户刚刚手动请求了帮助。我的主动式助理分析了用户当前的情况，并给出了以下建议：",
+            closing="请根据这个建议继续操作。"
+        ))
+        return job_accepted(job)
 
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"An error occurred: {e}"}), 500
 
+async def run_memorization_job(job, session_id: str, messages: list):
+    log_message(f"Starting background memorization for session {session_id}...")
+    # 注意：这里的 state 是一个副本，以防主会话状态被意外修改
+    memorization_state = {"messages": messages, "log": []}
+    final_memory_state = await memory_agent_app.ainvoke(memorization_state, {"recursion_limit": 5})
+    log_message(f"Background memorization finished for session {session_id}.")
+    log_message(f"Final memory state log: {final_memory_state.get('log')}")
+    return {"status": "success", "message": "Memory summarization finished."}
+
 @app.route('/end_chat', methods=['POST'])
 async def end_chat():
     """
     当用户结束会话时，触发记忆总结Agent。
-    这是一个后台任务，不需要立即返回结果给用户。
+    记忆总结作为任务在受限的 worker 池中执行，立即返回任务ID。
     """
     if not memory_agent_app:
         return jsonify({"status": "error", "message": "Memory Agent not ready."}), 503
@@ -456,25 +622,43 @@ async def end_chat():
         
         # 获取当前会话的完整状态
         current_state = await get_session_state(session_id)
-        
-        # 【关键】使用 app.add_background_task 在后台异步执行记忆总结
-        # 这样可以立刻返回响应给前端，而无需等待记忆过程完成
-        async def run_memorization_in_background():
-            log_message(f"Starting background memorization for session {session_id}...")
-            # 注意：这里的 state 是一个副本，以防主会话状态被意外修改
-            memorization_state = {"messages": current_state["messages"][:], "log": []}
-            final_memory_state = await memory_agent_app.ainvoke(memorization_state, {"recursion_limit": 5})
-            log_message(f"Background memorization finished for session {session_id}.")
-            log_message(f"Final memory state log: {final_memory_state.get('log')}")
-
-        app.add_background_task(run_memorization_in_background)
+        # 记忆总结只读取消息副本，不需要和该会话的对话轮次串行
+        job = job_manager.submit("memorization", session_id, partial(
+            run_memorization_job, session_id=session_id, messages=current_state["messages"][:]
+        ), serialize=False)
 
-        # 立刻返回成功响应
-        return jsonify({"status": "success", "message": "Memory summarization process started in the background."})
+        return jsonify({"status": "success", "message": "Memory summarization process started in the background.",
+                        "job_id": job.id}), 202
 
+    except JobQueueFull as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
     except Exception as e:
         traceback.print_exc()
         return jsonify({"status": "error", "message": f"An error occurred: {e}"}), 500
+
+# --- 任务查询与取消 ---
+@app.route('/jobs/<job_id>')
+async def get_job(job_id):
+    """查询任务状态；带 ?wait=秒数 时最多等待这么久直到任务结束（长轮询）。"""
+    snapshot = job_manager.snapshot(job_id)
+    if snapshot is None: return jsonify({"error": "Unknown job."}), 404
+    try:
+        wait = min(float(request.args.get("wait", 0)), MAX_JOB_WAIT_SECONDS)
+    except ValueError:
+        wait = 0
+    if wait > 0:
+        snapshot = await job_manager.wait(job_id, wait)
+    return jsonify(snapshot)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+async def cancel_job(job_id):
+    if job_manager.snapshot(job_id) is None: return jsonify({"error": "Unknown job."}), 404
+    cancelled = job_manager.cancel(job_id)
+    return jsonify({"job_id": job_id, "cancelled": cancelled, "status": job_manager.snapshot(job_id)["status"]})
+
+@app.route('/jobs/stats')
+async def job_stats():
+    return jsonify(job_manager.stats())
     
 # --- 程序退出时停止后台监听器 ---
 import atexit